@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+'''
+Benchmark: memory and lookup cost of cached forecast windows.
+
+Compares keeping the decoded Open-Meteo JSON (nested dicts and lists) with
+the columnar weather._DailyForecast record for many cached locations, and
+times a single-day lookup + markdown render from each representation.
+
+Usage:
+    python bench/forecast_memory.py --locations 5000
+'''
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import weather  # noqa: E402
+
+def _synthetic_payload(rng: random.Random) -> str:
+    '''Return a JSON document shaped like an Open-Meteo 16-day daily response.'''
+    start = date.today()
+    dates = [(start + timedelta(days=i)).isoformat() for i in range(weather.FORECAST_WINDOW_DAYS)]
+    daily = {"time": dates}
+    for name in weather.DAILY_VARIABLES:
+        if name in ("sunrise", "sunset"):
+            daily[name] = [f"{d}T{rng.randint(5, 19):02d}:{rng.randint(0, 59):02d}" for d in dates]
+        elif name in ("weathercode", "precipitation_probability_max",
+                      "relative_humidity_2m_max", "relative_humidity_2m_min"):
+            daily[name] = [rng.randint(0, 99) for _ in dates]
+        else:
+            daily[name] = [round(rng.uniform(-10, 35), 1) for _ in dates]
+    return json.dumps({"latitude": 0.0, "longitude": 0.0, "timezone": "GMT", "daily": daily})
+
+def _measure_memory(payloads: list[str], build) -> int:
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    kept = [build(json.loads(payload)) for payload in payloads]
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del kept
+    return used
+
+def _raw_lookup(data: dict, target_date: str) -> dict:
+    '''The pre-columnar lookup: list.index on the dates, then a per-key dict.'''
+    daily = data["daily"]
+    date_index = daily["time"].index(target_date)
+    return {key: values[date_index] for key, values in daily.items()}
+
+def main(locations: int, lookups: int) -> None:
+    rng = random.Random(42)
+    payloads = [_synthetic_payload(rng) for _ in range(locations)]
+
+    raw_bytes = _measure_memory(payloads, lambda data: data)
+    record_bytes = _measure_memory(payloads, weather._DailyForecast.from_json)
+    print(f"raw JSON dicts : {raw_bytes / locations:8.0f} bytes/location")
+    print(f"_DailyForecast : {record_bytes / locations:8.0f} bytes/location "
+          f"({record_bytes / raw_bytes:.0%} of raw)")
+
+    data = json.loads(payloads[0])
+    record = weather._DailyForecast.from_json(data)
+    target_date = data["daily"]["time"][-1]
+    city_info = {"name": "bench", "country": "bench", "latitude": 0.0, "longitude": 0.0}
+
+    started = time.perf_counter()
+    for _ in range(lookups):
+        _raw_lookup(data, target_date)
+    raw_us = (time.perf_counter() - started) / lookups * 1e6
+
+    started = time.perf_counter()
+    for _ in range(lookups):
+        record.day(record.index(target_date))
+    record_us = (time.perf_counter() - started) / lookups * 1e6
+
+    started = time.perf_counter()
+    for _ in range(lookups):
+        weather._format_weather_markdown(record, city_info, target_date)
+    render_us = (time.perf_counter() - started) / lookups * 1e6
+
+    print(f"day lookup     : raw {raw_us:6.2f} us, columnar {record_us:6.2f} us")
+    print(f"markdown render: {render_us:6.2f} us")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--locations", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.locations, args.lookups)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+'''
+Benchmark: fresh httpx.AsyncClient per request vs the shared weather.py pool.
+
+Each iteration performs the two upstream calls a tool call makes (geocoding
+and forecast).  The "fresh" mode reproduces the old behaviour of opening a new
+client for every request, the "pooled" mode goes through weather._http_get.
+
+Point WEATHER_GEOCODING_API / WEATHER_OPEN_METEO_BASE_URL at another host
+to benchmark against a stand-in server instead of the public API.
+
+Usage:
+    python bench/http_pool.py --iterations 20
+'''
+
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import weather  # noqa: E402
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+GEOCODE_PARAMS = {"name": "London", "count": 1, "language": "zh", "format": "json"}
+FORECAST_PARAMS = {"latitude": 51.5085, "longitude": -0.1257, "daily": "weathercode", "timezone": "auto"}
+
+async def _fresh_iteration() -> None:
+    for url, params in ((f"{weather.GEOCODING_API}/search", GEOCODE_PARAMS),
+                        (f"{weather.OPEN_METEO_BASE_URL}/forecast", FORECAST_PARAMS)):
+        async with httpx.AsyncClient() as client:
+            response = await client.get(url, params=params, timeout=30.0)
+            response.raise_for_status()
+
+async def _pooled_iteration() -> None:
+    for url, params in ((f"{weather.GEOCODING_API}/search", GEOCODE_PARAMS),
+                        (f"{weather.OPEN_METEO_BASE_URL}/forecast", FORECAST_PARAMS)):
+        response = await weather._http_get(url, params=params, timeout=30.0)
+        response.raise_for_status()
+
+async def _measure(iteration, iterations: int) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await iteration()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+def _report(label: str, samples: list[float]) -> None:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<8} p50={statistics.median(ordered):8.1f} ms  p95={p95:8.1f} ms  "
+          f"mean={statistics.fmean(ordered):8.1f} ms")
+
+async def _main(iterations: int) -> None:
+    _report("fresh", await _measure(_fresh_iteration, iterations))
+    async with weather._service_lifespan():
+        await _pooled_iteration()  # warm the pool once, as a long-lived server would
+        _report("pooled", await _measure(_pooled_iteration, iterations))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(_main(args.iterations))
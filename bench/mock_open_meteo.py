@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+'''
+Local stand-in for the Open-Meteo geocoding, forecast and archive APIs.
+
+Serves ``/v1/search``, ``/v1/forecast`` (including multi-location
+requests) and ``/v1/archive`` with deterministic synthetic data, so benchmarks do not depend on
+the public API or the network.  Latency and failures can be injected:
+
+    --latency 0.05 --jitter 0.02    every response waits 50 ms ± 20 ms
+    --error-rate 0.1                10% of requests fail with --error-status
+    --not-found Nowhere             geocoding returns no result for these names
+
+Usage:
+    python bench/mock_open_meteo.py --port 18080 --latency 0.02
+
+then point weather.py at it:
+
+    WEATHER_GEOCODING_API=http://127.0.0.1:18080/v1
+    WEATHER_OPEN_METEO_BASE_URL=http://127.0.0.1:18080/v1
+    WEATHER_ARCHIVE_API=http://127.0.0.1:18080/v1
+'''
+
+import argparse
+import asyncio
+import json
+import random
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+            500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable"}
+
+def _seed(*parts: Any) -> int:
+    return zlib.crc32(":".join(map(str, parts)).encode())
+
+def geocode(name: str, not_found: frozenset) -> Dict[str, Any]:
+    '''Deterministic coordinates derived from the queried name.'''
+    if name in not_found:
+        return {"generationtime_ms": 0.1}
+    seed = _seed(name)
+    return {
+        "results": [{
+            "name": name,
+            "latitude": round(-60 + seed % 12000 / 100, 4),
+            "longitude": round(-180 + (seed >> 8) % 36000 / 100, 4),
+            "country": "Mockland"
+        }],
+        "generationtime_ms": 0.1
+    }
+
+def _daily_value(variable: str, day: date, seed: int) -> Any:
+    rnd = random.Random(seed ^ day.toordinal() ^ _seed(variable))
+    if variable == "weathercode":
+        return rnd.choice((0, 1, 2, 3, 45, 51, 61, 63, 71, 80, 95))
+    if variable in ("sunrise", "sunset"):
+        hour = rnd.randint(5, 7) if variable == "sunrise" else rnd.randint(17, 19)
+        return f"{day.isoformat()}T{hour:02d}:{rnd.randint(0, 59):02d}"
+    if variable in ("precipitation_probability_max", "relative_humidity_2m_max", "relative_humidity_2m_min"):
+        return rnd.randint(0, 100)
+    if variable == "precipitation_sum":
+        return round(rnd.uniform(0, 20), 1) if rnd.random() < 0.4 else 0.0
+    if variable == "uv_index_max":
+        return round(rnd.uniform(0, 11), 2)
+    if variable == "windspeed_10m_max":
+        return round(rnd.uniform(0, 40), 1)
+    return round(rnd.uniform(-10, 35), 1)
+
+def _hourly_value(variable: str, hour: str, seed: int) -> Any:
+    rnd = random.Random(seed ^ _seed(variable, hour))
+    if variable in ("weathercode", "weather_code"):
+        return rnd.choice((0, 1, 2, 3, 61, 80))
+    if variable.startswith("winddirection"):
+        return rnd.randint(0, 359)
+    if variable.startswith(("relative_humidity", "precipitation_probability", "cloudcover")):
+        return rnd.randint(0, 100)
+    if variable in ("precipitation", "rain", "snowfall"):
+        return round(rnd.uniform(0, 5), 1) if rnd.random() < 0.3 else 0.0
+    if variable.startswith("wind"):
+        return round(rnd.uniform(0, 40), 1)
+    if variable == "uv_index":
+        return round(rnd.uniform(0, 11), 1)
+    return round(rnd.uniform(-10, 35), 1)
+
+# Like the real reanalysis archive, the most recent days are not published yet
+ARCHIVE_LAG_DAYS = 5
+
+def forecast_location(latitude: float, longitude: float, query: Dict[str, List[str]],
+                      available_until: Optional[date] = None) -> Dict[str, Any]:
+    '''Forecast payload for one location honouring daily/hourly and the date range parameters.
+
+    Days after ``available_until`` come back as nulls, as the archive API does.
+    '''
+    if "start_date" in query:
+        start = date.fromisoformat(query["start_date"][0])
+        end = date.fromisoformat(query.get("end_date", query["start_date"])[0])
+    else:
+        start = datetime.now(timezone.utc).date()  # the payload says GMT
+        end = start + timedelta(days=int(query.get("forecast_days", ["7"])[0]) - 1)
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    seed = _seed(latitude, longitude)
+    body: Dict[str, Any] = {
+        "latitude": latitude,
+        "longitude": longitude,
+        "timezone": "GMT",
+        "utc_offset_seconds": 0
+    }
+    if "daily" in query:
+        daily: Dict[str, List[Any]] = {"time": [day.isoformat() for day in days]}
+        for variable in query["daily"][0].split(","):
+            daily[variable] = [None if available_until is not None and day > available_until
+                               else _daily_value(variable, day, seed) for day in days]
+        body["daily"] = daily
+    if "hourly" in query:
+        hours = [f"{day.isoformat()}T{h:02d}:00" for day in days for h in range(24)]
+        hourly: Dict[str, List[Any]] = {"time": hours}
+        for variable in query["hourly"][0].split(","):
+            hourly[variable] = [_hourly_value(variable, hour, seed) for hour in hours]
+        body["hourly"] = hourly
+    return body
+
+class MockOpenMeteo:
+    '''Minimal asyncio HTTP/1.1 server with keep-alive and latency/error injection.'''
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, not_found: Optional[List[str]] = None, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.not_found = frozenset(not_found or ("Nowhere",))
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+
+    def respond(self, target: str) -> tuple:
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            return self.error_status, {"error": True, "reason": "injected failure"}
+        if url.path.endswith("/search") and "name" in query:
+            return 200, geocode(query["name"][0], self.not_found)
+        if url.path.endswith("/forecast") and "latitude" in query:
+            latitudes = query["latitude"][0].split(",")
+            longitudes = query["longitude"][0].split(",")
+            if len(latitudes) != len(longitudes):
+                return 400, {"error": True, "reason": "latitude/longitude length mismatch"}
+            bodies = [forecast_location(float(lat), float(lon), query) for lat, lon in zip(latitudes, longitudes)]
+            return 200, bodies if len(bodies) > 1 else bodies[0]
+        if url.path.endswith("/archive") and "latitude" in query and "start_date" in query:
+            available_until = date.today() - timedelta(days=ARCHIVE_LAG_DAYS)
+            return 200, forecast_location(float(query["latitude"][0]), float(query["longitude"][0]), query,
+                                          available_until)
+        return 404, {"error": True, "reason": "not found"}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                keep_alive = True
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    if header.lower().startswith(b"connection:") and b"close" in header.lower():
+                        keep_alive = False
+                self.requests += 1
+                _, target, _ = request_line.decode("latin-1").split(" ", 2)
+                delay = self.latency + (self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                status, payload = self.respond(target)
+                body = json.dumps(payload).encode()
+                # single write: avoids Nagle/delayed-ACK stalls on keep-alive connections
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 18080) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._handle, host, port)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for the Open-Meteo APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform ± jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--not-found", nargs="*", default=["Nowhere"], help="names geocoding does not know")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    mock = MockOpenMeteo(args.latency, args.jitter, args.error_rate, args.error_status, args.not_found, args.seed)
+
+    async def run() -> None:
+        server = await mock.serve(args.host, args.port)
+        print(f"mock Open-Meteo listening on http://{args.host}:{args.port}/v1", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
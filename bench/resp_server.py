@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+'''
+Local stand-in for a Redis-protocol cache server.
+
+Implements the RESP2 subset weather.py's Redis cache backend uses (PING,
+AUTH, SELECT, GET, MGET, SET with EX/PX, DEL, EXISTS, PTTL, DBSIZE,
+FLUSHDB, INFO, QUIT) with per-database expiry, so the shared cache can be
+exercised and benchmarked without a Redis install.  Not for production use.
+
+Usage:
+    python bench/resp_server.py --port 16379 [--password secret]
+
+then run weather.py (or several replicas) with:
+
+    WEATHER_CACHE_URL=redis://127.0.0.1:16379/0
+'''
+
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+class RespServer:
+    '''In-memory key/value store speaking RESP2 over asyncio streams.'''
+
+    def __init__(self, password: Optional[str] = None):
+        self.password = password
+        self.databases: Dict[int, Dict[bytes, Tuple[bytes, Optional[float]]]] = {}
+        self.commands = 0
+
+    @staticmethod
+    def _encode(value: Any) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, Exception):
+            return b"-ERR " + str(value).encode() + b"\r\n"
+        if isinstance(value, bool):
+            return b"+OK\r\n" if value else b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, str):
+            return b"+" + value.encode() + b"\r\n"
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(RespServer._encode(item) for item in value)
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # inline command, e.g. from telnet
+        args = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def _lookup(self, db: int, key: bytes) -> Optional[bytes]:
+        entries = self.databases.setdefault(db, {})
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            del entries[key]
+            return None
+        return entry[0]
+
+    def execute(self, state: Dict[str, Any], args: List[bytes]) -> Any:
+        self.commands += 1
+        name = args[0].upper().decode()
+        db = state["db"]
+        if name == "AUTH":
+            if self.password is None or args[-1].decode() == self.password:
+                state["authenticated"] = True
+                return "OK"
+            return Exception("invalid password")
+        if not state["authenticated"]:
+            return Exception("NOAUTH Authentication required.")
+        if name == "PING":
+            return "PONG" if len(args) == 1 else args[1]
+        if name == "SELECT":
+            state["db"] = int(args[1])
+            return "OK"
+        if name == "GET":
+            return self._lookup(db, args[1])
+        if name == "MGET":
+            return [self._lookup(db, key) for key in args[1:]]
+        if name == "SET":
+            expires = None
+            options = [arg.upper() for arg in args[3:]]
+            for i, option in enumerate(options):
+                if option in (b"EX", b"PX"):
+                    ttl = float(args[3 + i + 1])
+                    expires = time.time() + (ttl if option == b"EX" else ttl / 1000)
+            self.databases.setdefault(db, {})[args[1]] = (args[2], expires)
+            return "OK"
+        if name == "DEL":
+            entries = self.databases.setdefault(db, {})
+            return sum(entries.pop(key, None) is not None for key in args[1:])
+        if name == "EXISTS":
+            return sum(self._lookup(db, key) is not None for key in args[1:])
+        if name == "PTTL":
+            if self._lookup(db, args[1]) is None:
+                return -2
+            expires = self.databases[db][args[1]][1]
+            return -1 if expires is None else int((expires - time.time()) * 1000)
+        if name == "DBSIZE":
+            return len(self.databases.setdefault(db, {}))
+        if name == "FLUSHDB":
+            self.databases[db] = {}
+            return "OK"
+        if name == "INFO":
+            keys = sum(len(entries) for entries in self.databases.values())
+            return f"# Stats\r\ntotal_commands_processed:{self.commands}\r\nkeys:{keys}\r\n".encode()
+        return Exception(f"unknown command '{name}'")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        state = {"db": 0, "authenticated": self.password is None}
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                if not args:
+                    continue
+                if args[0].upper() == b"QUIT":
+                    writer.write(b"+OK\r\n")
+                    break
+                writer.write(self._encode(self.execute(state, args)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for a Redis-protocol cache server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=16379)
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    server = RespServer(args.password)
+
+    async def run() -> None:
+        listener = await asyncio.start_server(server.handle, args.host, args.port)
+        print(f"RESP stand-in listening on redis://{args.host}:{args.port}/0", flush=True)
+        async with listener:
+            await listener.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
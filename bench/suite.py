@@ -0,0 +1,543 @@
+#!/usr/bin/env python3
+'''
+Reproducible benchmark suite for weather.py.
+
+Starts the local Open-Meteo stand-in (bench/mock_open_meteo.py), then drives
+the tools at fixed concurrency levels over three transports:
+
+    inprocess   FastMCP.call_tool in this process (no protocol overhead)
+    stdio       a `python weather.py` subprocess through the MCP stdio client
+    http        a `python weather.py --transport http` subprocess through the
+                MCP streamable HTTP client
+
+For every (transport, tool, concurrency) scenario it reports throughput,
+p50/p95/p99 latency and errors; in-process scenarios also report the
+allocations per call measured with tracemalloc in a separate sequential pass
+(so tracing overhead does not distort the latencies).  Results are written as
+JSON, by default to bench/results/<commit>.json, and two result files can be
+compared to spot regressions.
+
+--cache selects the shared cache tier: the default SQLite file, "memory", or
+"redis", which starts bench/resp_server.py and points WEATHER_CACHE_URL at it.
+
+"warm" mode (default) primes the caches with a pool of --cities names before
+measuring; "cold" mode uses a fresh city for every call so each one pays for
+geocoding and a forecast fetch against the stand-in.
+
+Scenarios run under the server's own WEATHER_UPSTREAM_RATE/BURST defaults, so
+cold-mode throughput is what the production limiter allows; --upstream-rate
+overrides both (e.g. 10000 to measure the server without the limiter).
+
+Every run also measures start-up (skip with --startup-runs 0): the median
+`python -X importtime -c "import weather"` total and its heaviest modules, and
+the time for a fresh stdio server to answer initialize, tools/list and a first
+tool call, both with an empty cache directory and with the cache directory and
+WEATHER_SNAPSHOT left behind by a previous process.  --startup-budget-ms makes
+the run exit with status 1 when the cold first answer exceeds the budget.
+
+The run also checks the server under its production rate-limit defaults
+(skip with --limits-check-cities 0): a fresh stdio server without the
+WEATHER_UPSTREAM_RATE/BURST overrides must answer one cold
+weather_query_batch over --limits-check-cities cities without a single
+per-city error, otherwise the run exits with status 1.
+
+Usage:
+    python bench/suite.py run --transports inprocess stdio http --concurrency 1 8 32
+    python bench/suite.py run --mode cold --latency 0.02 --error-rate 0.05
+    python bench/suite.py run --mode cold --upstream-rate 10000
+    python bench/suite.py run --transports --startup-runs 10 --startup-budget-ms 1500
+    python bench/suite.py compare bench/results/abc1234.json bench/results/def5678.json
+'''
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+
+TOOLS = {
+    "by_days": "weather_query_by_days",
+    "range": "weather_query_range",
+    "batch": "weather_query_batch"
+}
+
+CallTool = Callable[[str, Dict[str, Any]], Awaitable[bool]]
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def _wait_for_port(port: int, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"nothing listening on port {port} after {timeout}s")
+            await asyncio.sleep(0.05)
+
+def _git_revision() -> Tuple[str, bool]:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return revision, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    '''Nearest-rank percentile of an already sorted list.'''
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def _arguments(tool: str, index: int, args: argparse.Namespace, prefix: str) -> Dict[str, Any]:
+    '''Tool arguments for call ``index``; cold mode never repeats a city.'''
+    def city(i: int) -> str:
+        return f"{prefix}-{i}" if args.mode == "cold" else f"Benchville-{i % args.cities}"
+
+    if tool == "batch":
+        return {"params": {"cities": [city(index * args.batch_size + j) for j in range(args.batch_size)],
+                           "days_later": index % 7}}
+    if tool == "range":
+        return {"params": {"city": city(index), "num_days": 7}}
+    return {"params": {"city": city(index), "days_later": index % 7}}
+
+def _is_error_text(text: str) -> bool:
+    return text.startswith("Error")
+
+async def _drive(call: CallTool, tool: str, concurrency: int, calls: int,
+                 args: argparse.Namespace, prefix: str) -> Dict[str, Any]:
+    '''Run ``calls`` tool calls with ``concurrency`` workers and summarise the latencies.'''
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker() -> None:
+        nonlocal next_index, errors
+        while next_index < calls:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                ok = await call(TOOLS[tool], _arguments(tool, index, args, prefix))
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "calls": calls,
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput": round(calls / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0
+    }
+
+async def _measure_allocations(call: CallTool, tool: str, calls: int,
+                               args: argparse.Namespace, prefix: str) -> Dict[str, Any]:
+    '''Sequential pass under tracemalloc: peak and retained bytes per call.'''
+    peaks = []
+    retained = 0
+    tracemalloc.start()
+    try:
+        for index in range(calls):
+            arguments = _arguments(tool, index, args, prefix)
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await call(TOOLS[tool], arguments)
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained += current - before
+    finally:
+        tracemalloc.stop()
+    return {
+        "alloc_calls": calls,
+        "alloc_peak_kib_per_call": round(sum(peaks) / len(peaks) / 1024, 2) if peaks else 0.0,
+        "alloc_retained_kib_per_call": round(retained / calls / 1024, 2) if calls else 0.0
+    }
+
+def _server_env(args: argparse.Namespace, mock_url: str, cache_dir: str, cache_url: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "WEATHER_GEOCODING_API": mock_url,
+        "WEATHER_OPEN_METEO_BASE_URL": mock_url,
+        "WEATHER_CACHE_DIR": cache_dir,
+        "WEATHER_CACHE_URL": cache_url,
+        "WEATHER_PREFETCH": "0",
+        "PYTHONPATH": os.pathsep.join(filter(None, (str(ROOT), env.get("PYTHONPATH"))))
+    })
+    if args.upstream_rate is not None:
+        env.update(WEATHER_UPSTREAM_RATE=str(args.upstream_rate), WEATHER_UPSTREAM_BURST=str(args.upstream_rate))
+    return env
+
+def _text_ok(content: List[Any], is_error: bool = False) -> bool:
+    return not is_error and not any(_is_error_text(getattr(block, "text", "")) for block in content)
+
+@asynccontextmanager
+async def _inprocess_transport(args: argparse.Namespace, env: Dict[str, str]) -> AsyncIterator[CallTool]:
+    os.environ.update(env)
+    sys.path.insert(0, str(ROOT))
+    import weather
+
+    async def call(name: str, arguments: Dict[str, Any]) -> bool:
+        result = await weather.mcp.call_tool(name, arguments)
+        return _text_ok(result[0] if isinstance(result, tuple) else result)
+
+    async with weather._service_lifespan():
+        yield call
+
+async def _session_call(session: Any) -> CallTool:
+    async def call(name: str, arguments: Dict[str, Any]) -> bool:
+        result = await session.call_tool(name, arguments)
+        return _text_ok(result.content, result.isError)
+    return call
+
+@asynccontextmanager
+async def _stdio_transport(args: argparse.Namespace, env: Dict[str, str]) -> AsyncIterator[CallTool]:
+    from mcp import ClientSession
+    from mcp.client.stdio import StdioServerParameters, stdio_client
+
+    server = StdioServerParameters(command=sys.executable, args=[str(ROOT / "weather.py")], env=env, cwd=str(ROOT))
+    with open(os.devnull, "w") as errlog:
+        async with stdio_client(server, errlog=errlog) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                yield await _session_call(session)
+
+@asynccontextmanager
+async def _http_transport(args: argparse.Namespace, env: Dict[str, str]) -> AsyncIterator[CallTool]:
+    from mcp import ClientSession
+    from mcp.client.streamable_http import streamablehttp_client
+
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, str(ROOT / "weather.py"), "--transport", "http", "--host", "127.0.0.1", "--port", str(port)],
+        env=env, cwd=str(ROOT), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        await _wait_for_port(port)
+        async with streamablehttp_client(f"http://127.0.0.1:{port}/mcp/") as (read, write, _):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                yield await _session_call(session)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def _import_times(env: Dict[str, str], runs: int, top: int = 10) -> Dict[str, Any]:
+    '''Median ``python -X importtime -c "import weather"`` figures over ``runs`` fresh interpreters.'''
+    totals: List[float] = []
+    own: List[float] = []
+    self_us: Dict[str, List[int]] = {}
+    for _ in range(runs):
+        stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import weather"], env=env, cwd=str(ROOT),
+                                capture_output=True, text=True, check=True).stderr
+        total = 0
+        for match in _IMPORTTIME_LINE.finditer(stderr):
+            self_time, cumulative, indent, module = int(match[1]), int(match[2]), len(match[3]), match[4]
+            if indent == 1:
+                total += cumulative
+            if module == "weather":
+                own.append(cumulative / 1000)
+            self_us.setdefault(module, []).append(self_time)
+        totals.append(total / 1000)
+    heaviest = sorted(self_us.items(), key=lambda item: statistics.median(item[1]), reverse=True)[:top]
+    return {
+        "import_ms": round(statistics.median(totals), 2),
+        "import_weather_ms": round(statistics.median(own), 2) if own else 0.0,
+        "import_top_self_ms": {module: round(statistics.median(times) / 1000, 2) for module, times in heaviest}
+    }
+
+async def _stdio_startup(env: Dict[str, str]) -> Dict[str, float]:
+    '''Milliseconds from spawning a stdio server until it answers initialize, tools/list and a first call.'''
+    from mcp import ClientSession
+    from mcp.client.stdio import StdioServerParameters, stdio_client
+
+    server = StdioServerParameters(command=sys.executable, args=[str(ROOT / "weather.py")], env=env, cwd=str(ROOT))
+    started = time.perf_counter()
+    marks: Dict[str, float] = {}
+    with open(os.devnull, "w") as errlog:
+        async with stdio_client(server, errlog=errlog) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                marks["initialize_ms"] = time.perf_counter() - started
+                await session.list_tools()
+                marks["list_tools_ms"] = time.perf_counter() - started
+                result = await session.call_tool(TOOLS["by_days"], {"params": {"city": "Benchville-0", "days_later": 1}})
+                marks["first_call_ms"] = time.perf_counter() - started
+                if not _text_ok(result.content, result.isError):
+                    raise RuntimeError(f"first call failed: {result.content}")
+    return {name: seconds * 1000 for name, seconds in marks.items()}
+
+async def _measure_startup(args: argparse.Namespace, env: Dict[str, str]) -> Dict[str, Any]:
+    '''Import-time profile plus cold (empty cache) and warm (cache dir + snapshot kept) stdio start-up.'''
+    results = _import_times(env, args.startup_runs)
+    print(f"{'startup':>9} import weather {results['import_ms']:.1f} ms "
+          f"(weather.py itself {results['import_weather_ms']:.1f} ms)", flush=True)
+    for variant in ("cold", "warm"):
+        samples: Dict[str, List[float]] = {}
+        with tempfile.TemporaryDirectory(prefix="weather-startup-") as cache_dir:
+            variant_env = dict(env, WEATHER_CACHE_DIR=cache_dir, WEATHER_CACHE_URL="",
+                               WEATHER_SNAPSHOT=str(Path(cache_dir) / "snapshot.marshal"))
+            if variant == "warm":
+                await _stdio_startup(variant_env)
+            for _ in range(args.startup_runs):
+                if variant == "cold":
+                    for entry in Path(cache_dir).iterdir():
+                        if entry.is_file():
+                            entry.unlink()
+                for name, value in (await _stdio_startup(variant_env)).items():
+                    samples.setdefault(name, []).append(value)
+        for name, values in samples.items():
+            results[f"{variant}_{name}"] = round(statistics.median(values), 2)
+        print(f"{'startup':>9} {variant:>4} initialize {results[f'{variant}_initialize_ms']:>8.1f} ms  "
+              f"tools/list {results[f'{variant}_list_tools_ms']:>8.1f} ms  "
+              f"first call {results[f'{variant}_first_call_ms']:>8.1f} ms", flush=True)
+    return results
+
+async def _limits_check(args: argparse.Namespace, env: Dict[str, str]) -> Dict[str, Any]:
+    '''One cold weather_query_batch over a stdio server using the production rate-limit defaults.'''
+    from mcp import ClientSession
+    from mcp.client.stdio import StdioServerParameters, stdio_client
+
+    with tempfile.TemporaryDirectory(prefix="weather-limits-") as cache_dir:
+        server_env = {name: value for name, value in env.items()
+                      if name not in ("WEATHER_UPSTREAM_RATE", "WEATHER_UPSTREAM_BURST")}
+        server_env.update(WEATHER_CACHE_DIR=cache_dir, WEATHER_CACHE_URL="", WEATHER_SNAPSHOT="")
+        server = StdioServerParameters(command=sys.executable, args=[str(ROOT / "weather.py")], env=server_env,
+                                       cwd=str(ROOT))
+        cities = [f"limits-{i}" for i in range(args.limits_check_cities)]
+        with open(os.devnull, "w") as errlog:
+            async with stdio_client(server, errlog=errlog) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    started = time.perf_counter()
+                    result = await session.call_tool(TOOLS["batch"], {"params": {
+                        "cities": cities, "days_later": 1, "response_format": "json"}})
+                    elapsed = time.perf_counter() - started
+    text = getattr(result.content[0], "text", "") if result.content else ""
+    try:
+        errors = sum("error" in entry for entry in json.loads(text)["results"])
+    except (ValueError, KeyError, TypeError):
+        errors = len(cities)
+    check = {"cities": len(cities), "errors": errors, "seconds": round(elapsed, 2)}
+    print(f"{'limits':>9} cold batch of {len(cities)} cities under default rate limits: "
+          f"{elapsed:.1f} s, {errors} errors", flush=True)
+    return check
+
+TRANSPORTS = {
+    "inprocess": _inprocess_transport,
+    "stdio": _stdio_transport,
+    "http": _http_transport
+}
+
+async def _run_transport(transport: str, args: argparse.Namespace, env: Dict[str, str]) -> List[Dict[str, Any]]:
+    results = []
+    async with TRANSPORTS[transport](args, env) as call:
+        for tool in args.tools:
+            if args.mode == "warm":
+                # prime geocode and forecast caches for the whole city pool
+                warmup = max(args.cities // (args.batch_size if tool == "batch" else 1), 1)
+                await _drive(call, tool, min(8, warmup), warmup, args, "warmup")
+            for concurrency in args.concurrency:
+                prefix = f"{transport}-{tool}-{concurrency}"
+                summary = await _drive(call, tool, concurrency, args.calls, args, prefix)
+                scenario = {"transport": transport, "tool": tool, "concurrency": concurrency,
+                            "mode": args.mode, **summary}
+                print(f"{transport:>9} {tool:>7} c={concurrency:<3} {summary['throughput']:>9.1f} calls/s  "
+                      f"p50 {summary['p50_ms']:>8.2f} ms  p95 {summary['p95_ms']:>8.2f} ms  "
+                      f"p99 {summary['p99_ms']:>8.2f} ms  errors {summary['errors']}", flush=True)
+                results.append(scenario)
+            if transport == "inprocess" and args.alloc_calls:
+                allocations = await _measure_allocations(call, tool, args.alloc_calls, args, f"alloc-{tool}")
+                for scenario in results:
+                    if scenario["tool"] == tool:
+                        scenario.update(allocations)
+                print(f"{transport:>9} {tool:>7} alloc peak {allocations['alloc_peak_kib_per_call']} KiB/call, "
+                      f"retained {allocations['alloc_retained_kib_per_call']} KiB/call", flush=True)
+    return results
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    mock_port = _free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}/v1"
+    mock = subprocess.Popen(
+        [sys.executable, str(BENCH_DIR / "mock_open_meteo.py"), "--port", str(mock_port),
+         "--latency", str(args.latency), "--jitter", str(args.jitter),
+         "--error-rate", str(args.error_rate), "--seed", str(args.seed)],
+        stdout=subprocess.DEVNULL
+    )
+    cache_server = None
+    cache_url = "memory://" if args.cache == "memory" else ""
+    if args.cache == "redis":
+        cache_port = _free_port()
+        cache_url = f"redis://127.0.0.1:{cache_port}/0"
+        cache_server = subprocess.Popen([sys.executable, str(BENCH_DIR / "resp_server.py"), "--port", str(cache_port)],
+                                        stdout=subprocess.DEVNULL)
+    scenarios: List[Dict[str, Any]] = []
+    startup: Dict[str, Any] = {}
+    limits: Dict[str, Any] = {}
+    try:
+        await _wait_for_port(mock_port)
+        if cache_server is not None:
+            await _wait_for_port(cache_port)
+        with tempfile.TemporaryDirectory(prefix="weather-bench-") as cache_dir:
+            env = _server_env(args, mock_url, cache_dir, cache_url)
+            if args.startup_runs:
+                startup = await _measure_startup(args, env)
+            if args.limits_check_cities:
+                limits = await _limits_check(args, env)
+            # subprocess transports first: the in-process run imports weather with the bench settings
+            for transport in sorted(args.transports, key=lambda t: t == "inprocess"):
+                scenarios.extend(await _run_transport(transport, args, env))
+    finally:
+        for process in filter(None, (mock, cache_server)):
+            process.terminate()
+            process.wait(timeout=10)
+
+    revision, dirty = _git_revision()
+    return {
+        "commit": revision,
+        "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {name: getattr(args, name) for name in (
+            "mode", "cache", "calls", "cities", "batch_size", "latency", "jitter", "error_rate", "upstream_rate", "seed",
+            "startup_runs", "limits_check_cities")},
+        "startup": startup,
+        "limits_check": limits,
+        "scenarios": scenarios
+    }
+
+def _scenario_key(scenario: Dict[str, Any]) -> Tuple:
+    return scenario["transport"], scenario["tool"], scenario["concurrency"], scenario.get("mode", "warm")
+
+def compare(base_path: str, head_path: str, threshold: float) -> int:
+    '''Print per-scenario deltas; return 1 if any scenario regressed beyond ``threshold``.'''
+    base = json.loads(Path(base_path).read_text(encoding="utf-8"))
+    head = json.loads(Path(head_path).read_text(encoding="utf-8"))
+    base_scenarios = {_scenario_key(s): s for s in base["scenarios"]}
+    print(f"base {base['commit']}{'+' if base.get('dirty') else ''}  ->  head {head['commit']}{'+' if head.get('dirty') else ''}")
+    print(f"{'scenario':<32} {'calls/s':>20} {'p95 ms':>22} {'p99 ms':>22}")
+
+    def delta(old: float, new: float) -> float:
+        return (new - old) / old if old else 0.0
+
+    regressions = 0
+    for scenario in head["scenarios"]:
+        key = _scenario_key(scenario)
+        old = base_scenarios.get(key)
+        name = "/".join(map(str, key))
+        if old is None:
+            print(f"{name:<32} (new scenario)")
+            continue
+        throughput = delta(old["throughput"], scenario["throughput"])
+        p95 = delta(old["p95_ms"], scenario["p95_ms"])
+        p99 = delta(old["p99_ms"], scenario["p99_ms"])
+        regressed = throughput < -threshold or p95 > threshold
+        regressions += regressed
+        print(f"{name:<32} {old['throughput']:>8.1f} -> {scenario['throughput']:>8.1f} ({throughput:+.0%})"
+              f" {old['p95_ms']:>7.2f} -> {scenario['p95_ms']:>7.2f} ({p95:+.0%})"
+              f" {old['p99_ms']:>7.2f} -> {scenario['p99_ms']:>7.2f} ({p99:+.0%}){'  REGRESSION' if regressed else ''}")
+    base_startup, head_startup = base.get("startup") or {}, head.get("startup") or {}
+    for name, value in head_startup.items():
+        old = base_startup.get(name)
+        if not name.endswith("_ms") or not isinstance(old, (int, float)):
+            continue
+        change = delta(old, value)
+        regressed = change > threshold
+        regressions += regressed
+        print(f"{'startup/' + name:<32} {old:>8.1f} -> {value:>8.1f} ms ({change:+.0%}){'  REGRESSION' if regressed else ''}")
+    return 1 if regressions else 0
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="weather.py benchmark suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmark and write a JSON result file")
+    run_parser.add_argument("--transports", nargs="*", choices=sorted(TRANSPORTS), default=["inprocess", "stdio", "http"])
+    run_parser.add_argument("--tools", nargs="+", choices=sorted(TOOLS), default=["by_days", "range", "batch"])
+    run_parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    run_parser.add_argument("--calls", type=int, default=200, help="calls per scenario")
+    run_parser.add_argument("--mode", choices=["warm", "cold"], default="warm")
+    run_parser.add_argument("--cache", choices=["sqlite", "memory", "redis"], default="sqlite",
+                            help="shared cache tier (redis uses the bench/resp_server.py stand-in)")
+    run_parser.add_argument("--cities", type=int, default=50, help="size of the city pool in warm mode")
+    run_parser.add_argument("--batch-size", type=int, default=10, help="cities per weather_query_batch call")
+    run_parser.add_argument("--latency", type=float, default=0.0, help="stand-in server latency in seconds")
+    run_parser.add_argument("--jitter", type=float, default=0.0)
+    run_parser.add_argument("--error-rate", type=float, default=0.0)
+    run_parser.add_argument("--upstream-rate", type=float,
+                            help="override WEATHER_UPSTREAM_RATE/BURST for the scenarios (default: the server's "
+                                 "own limits; e.g. 10000 measures throughput without the limiter)")
+    run_parser.add_argument("--alloc-calls", type=int, default=50, help="sequential calls traced per in-process tool")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--startup-runs", type=int, default=5,
+                            help="fresh processes per start-up measurement (0 skips it)")
+    run_parser.add_argument("--limits-check-cities", type=int, default=200,
+                            help="cities in the cold batch run under the default rate limits (0 skips the check)")
+    run_parser.add_argument("--startup-budget-ms", type=float,
+                            help="exit with status 1 if a cold stdio server takes longer to answer its first call")
+    run_parser.add_argument("--output", help="result file (default bench/results/<commit>.json)")
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("head")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="relative throughput drop / p95 increase counted as a regression")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        sys.exit(compare(args.base, args.head, args.threshold))
+
+    logging.basicConfig(level=logging.WARNING)
+    results = asyncio.run(run(args))
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{results['commit']}{'-dirty' if results['dirty'] else ''}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"results written to {output}")
+    if results["limits_check"].get("errors"):
+        print(f"{results['limits_check']['errors']} cities failed under the default rate limits")
+        sys.exit(1)
+    budget = args.startup_budget_ms
+    first_call = results["startup"].get("cold_first_call_ms")
+    if budget is not None and first_call is not None and first_call > budget:
+        print(f"cold start {first_call:.1f} ms exceeds the {budget:.0f} ms budget")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
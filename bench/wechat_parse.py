@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+'''
+Benchmark: extracting a WeChat article page with BeautifulSoup vs the fast scanner.
+
+Times wechat_mcp_streamable._soup_wechat_html (full html.parser tree) and
+_scan_wechat_html (regex scan of the meta tags and the few elements the tool
+reads) on every page, reports the median parse time and the tracemalloc peak
+per page, and checks that both engines extract the same fields.
+
+Pass saved article pages (e.g. `curl -o article.html <url>`) as fixtures;
+without any, synthetic pages shaped like mp.weixin.qq.com articles are
+generated (large inline scripts and styles, heavily styled nested sections,
+entities and comments).
+
+Usage:
+    python bench/wechat_parse.py --synthetic 5 --paragraphs 400
+    python bench/wechat_parse.py saved/*.html --repeat 20
+'''
+
+import argparse
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import wechat_mcp_streamable as wechat  # noqa: E402
+
+ENGINES = {
+    "bs4": wechat._soup_wechat_html,
+    "fast": wechat._scan_wechat_html
+}
+
+def _script(rng: random.Random, kib: int) -> str:
+    '''Minified-looking inline JS, including markup inside string literals.'''
+    parts = ['var tpl = "<div id=\\"js_content\\"><meta property=\\"og:title\\" content=\\"not this\\"></div>";']
+    while sum(map(len, parts)) < kib * 1024:
+        name = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(8))
+        parts.append(f'function {name}(a,b){{if(a<b&&b>0){{return "{name}"+a*b}}return document.getElementById("x{name}")}}')
+    return f"<script type=\"text/javascript\">{''.join(parts)}</script>\n"
+
+def _paragraph(rng: random.Random, index: int) -> str:
+    words = "".join(rng.choice("投资公司融资估值产业基金战略轮次领投跟投") for _ in range(rng.randint(40, 160)))
+    style = ("margin: 0px 8px; padding: 0px; outline: 0px; max-width: 100%; box-sizing: border-box !important; "
+             "overflow-wrap: break-word !important; color: rgb(62, 62, 62); font-size: 15px; line-height: 1.75em;")
+    return (f'<section style="{style}" data-index="{index}"><p style="{style}">'
+            f'<span style="{style}" data-role="text">{words}</span>'
+            f'<span style="{style}"><strong>{index}.</strong> A&amp;B &lt;Capital&gt;&nbsp;</span></p>'
+            f'<!-- paragraph {index} --><p style="{style}"><br  /></p>'
+            f'<img class="rich_pages wxw-img" data-ratio="0.56" data-src="https://mmbiz.qpic.cn/{index}.png" '
+            f'style="{style}" /></section>\n')
+
+def synthetic_page(seed: int, paragraphs: int) -> str:
+    '''An article page laid out like mp.weixin.qq.com, roughly 1 KiB per paragraph plus ~200 KiB of scripts.'''
+    rng = random.Random(seed)
+    head = [
+        '<!DOCTYPE html><html><head><meta charset="utf-8">',
+        '<meta name="viewport" content="width=device-width,initial-scale=1.0">',
+        f'<meta property="og:title" content="第{seed}期 | 被投企业动态 &amp; 融资进展">',
+        '<meta property="og:type" content="article">',
+        '<meta name="author" content="某某资本">',
+        '<meta property="article:published_time" content="2025-12-16T08:00:00+08:00">',
+        "<style>.rich_media_content{overflow:hidden}" + ".x{color:red}" * 2000 + "</style>",
+        _script(rng, 120),
+        "</head><body>"
+    ]
+    body = [
+        '<div id="js_article" class="rich_media"><div class="rich_media_inner">',
+        f'<h1 class="rich_media_title" id="activity-name">\n  第{seed}期 | 被投企业动态\n</h1>',
+        '<div id="meta_content"><span class="rich_media_meta rich_media_meta_text">',
+        '<a href="javascript:void(0);" id="js_author_name">某某资本</a></span>',
+        '<em id="publish_time" class="rich_media_meta rich_media_meta_text">2025-12-16 08:00</em></div>',
+        '<div class="rich_media_content js_underline_content" id="js_content" style="visibility: hidden;">',
+        *(_paragraph(rng, i) for i in range(paragraphs)),
+        "</div></div></div>",
+        _script(rng, 80),
+        "</body></html>"
+    ]
+    return "".join(head + body)
+
+def _measure(parse, page: str, repeat: int) -> tuple[float, int]:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse(page)
+        times.append(time.perf_counter() - started)
+    tracemalloc.start()
+    parse(page)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(times), peak
+
+def main(paths: list[str], synthetic: int, paragraphs: int, repeat: int) -> int:
+    fixtures = [(path, Path(path).read_text(encoding="utf-8", errors="replace")) for path in paths]
+    if not fixtures:
+        fixtures = [(f"synthetic-{seed}", synthetic_page(seed, paragraphs)) for seed in range(synthetic)]
+
+    print(f"{'page':<24} {'KiB':>7} {'bs4 ms':>9} {'fast ms':>9} {'speedup':>8} {'bs4 peak KiB':>13} {'fast peak KiB':>14}")
+    mismatches = 0
+    totals = {name: [] for name in ENGINES}
+    for name, page in fixtures:
+        results = {engine: parse(page) for engine, parse in ENGINES.items()}
+        if results["fast"] is None:
+            print(f"{name:<24} fast scanner declined the page (falls back to bs4)")
+            continue
+        if results["fast"] != results["bs4"]:
+            mismatches += 1
+            diff = [field for field in results["bs4"] if results["bs4"][field] != results["fast"].get(field)]
+            print(f"{name:<24} MISMATCH in {', '.join(diff)}")
+        measured = {engine: _measure(parse, page, repeat) for engine, parse in ENGINES.items()}
+        for engine, value in measured.items():
+            totals[engine].append(value)
+        (soup_s, soup_peak), (fast_s, fast_peak) = measured["bs4"], measured["fast"]
+        print(f"{name:<24} {len(page.encode()) / 1024:>7.0f} {soup_s * 1000:>9.2f} {fast_s * 1000:>9.2f} "
+              f"{soup_s / fast_s:>7.1f}x {soup_peak / 1024:>13.0f} {fast_peak / 1024:>14.0f}")
+
+    if totals["fast"]:
+        soup_ms = statistics.mean(t for t, _ in totals["bs4"]) * 1000
+        fast_ms = statistics.mean(t for t, _ in totals["fast"]) * 1000
+        print(f"mean per page: bs4 {soup_ms:.2f} ms, fast {fast_ms:.2f} ms ({soup_ms / fast_ms:.1f}x)")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("paths", nargs="*", help="saved article pages (default: synthetic pages)")
+    parser.add_argument("--synthetic", type=int, default=5, help="synthetic pages when no paths are given")
+    parser.add_argument("--paragraphs", type=int, default=300, help="paragraphs per synthetic page")
+    parser.add_argument("--repeat", type=int, default=10, help="timed parses per page and engine")
+    args = parser.parse_args()
+    sys.exit(main(args.paths, args.synthetic, args.paragraphs, args.repeat))
@@ -0,0 +1,188 @@
+'''
+Lightweight in-process metrics with Prometheus text exposition.
+
+Shared by weather.py and wechat_mcp_streamable.py. Provides labelled
+counters, gauges and latency histograms, a hook for values computed at
+scrape time (e.g. cache statistics), a Starlette ``/metrics`` route for the
+HTTP transports and a dump-on-exit helper for stdio processes.
+'''
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from contextlib import contextmanager
+import atexit
+import functools
+import inspect
+import math
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Counter:
+    '''Monotonically increasing value per label set.'''
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterable[Tuple[str, LabelKey, float]]:
+        for key, value in self._values.items():
+            yield self.name, key, value
+
+class Gauge(Counter):
+    '''Value that can go up and down; ``track`` counts in-flight work.'''
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        self._values[_label_key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels: Any):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram:
+    '''Cumulative-bucket histogram, typically of latencies in seconds.'''
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # one slot per bucket, then +Inf count and sum
+            state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+        state[-2] += 1
+        state[-1] += value
+
+    @contextmanager
+    def time(self, **labels: Any):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def timed(self, **labels: Any) -> Callable:
+        '''Decorator timing every call of a sync or async function.'''
+        def decorator(func: Callable) -> Callable:
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.time(**labels):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def samples(self) -> Iterable[Tuple[str, LabelKey, float]]:
+        for key, state in self._values.items():
+            for bound, count in zip(self.buckets, state):
+                yield f"{self.name}_bucket", key + (("le", _format_value(bound)),), count
+            yield f"{self.name}_bucket", key + (("le", "+Inf"),), state[-2]
+            yield f"{self.name}_count", key, state[-2]
+            yield f"{self.name}_sum", key, state[-1]
+
+# A collector returns (name, kind, help, [(labels, value), ...]) tuples computed at scrape time
+Collector = Callable[[], Iterable[Tuple[str, str, str, Iterable[Tuple[Dict[str, Any], float]]]]]
+
+class Registry:
+    '''Holds metrics and renders them in the Prometheus text format.'''
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Collector] = []
+
+    def counter(self, name: str, help: str) -> Counter:
+        metric = Counter(name, help)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        metric = Gauge(name, help)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func: Collector) -> Collector:
+        '''Register a function producing metrics at scrape time; usable as a decorator.'''
+        self._collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        for collect in self._collectors:
+            for name, kind, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(_label_key(labels))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def metrics_route(registry: Registry, path: str = "/metrics"):
+    '''Return a Starlette route serving ``registry`` in the Prometheus text format.'''
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Route
+
+    async def metrics(_request):
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    return Route(path, metrics, methods=["GET"])
+
+def dump_on_exit(registry: Registry, path: str) -> None:
+    '''Write the final metrics to ``path`` when the process exits (for stdio servers).'''
+    def dump() -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(registry.render())
+
+    atexit.register(dump)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+'''
+Build a weather_gazetteer.tsv from a GeoNames cities dump.
+
+Download e.g. https://download.geonames.org/export/dump/cities15000.zip,
+unzip it, then run:
+
+    python scripts/build_gazetteer.py cities15000.txt -o weather_gazetteer.tsv
+
+Rows are written in descending population order so that, for ambiguous
+names, weather.py resolves to the largest city. The display name is the
+first Chinese alternate name when GeoNames has one (matching what the
+geocoding API returns with language=zh), otherwise the GeoNames name.
+Point WEATHER_GAZETTEER at the output to use it without replacing the
+bundled file.
+'''
+
+import argparse
+import re
+
+# ISO 3166 country code -> Chinese country name for the most common countries;
+# anything else falls back to the ISO code.
+COUNTRY_NAMES = {
+    "CN": "中国", "HK": "中国", "MO": "中国", "JP": "日本", "KR": "韩国", "SG": "新加坡",
+    "TH": "泰国", "MY": "马来西亚", "ID": "印度尼西亚", "PH": "菲律宾", "VN": "越南",
+    "IN": "印度", "AE": "阿拉伯联合酋长国", "GB": "英国", "FR": "法国", "DE": "德国",
+    "ES": "西班牙", "IT": "意大利", "NL": "荷兰", "BE": "比利时", "AT": "奥地利",
+    "CH": "瑞士", "SE": "瑞典", "DK": "丹麦", "NO": "挪威", "FI": "芬兰", "RU": "俄罗斯",
+    "TR": "土耳其", "EG": "埃及", "ZA": "南非", "US": "美国", "CA": "加拿大",
+    "MX": "墨西哥", "BR": "巴西", "AR": "阿根廷", "AU": "澳大利亚", "NZ": "新西兰",
+}
+
+CJK = re.compile(r"[一-鿿]")
+
+def _rows(path: str, min_population: int):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 15:
+                continue
+            population = int(fields[14] or 0)
+            if population < min_population:
+                continue
+            name, ascii_name, alternates = fields[1], fields[2], fields[3].split(",")
+            chinese = [alt for alt in alternates if CJK.search(alt)][:3]
+            display = chinese[0] if chinese else name
+            aliases = dict.fromkeys(alias for alias in (name, ascii_name, *chinese) if alias and alias != display)
+            yield population, (display, COUNTRY_NAMES.get(fields[8], fields[8]), fields[4], fields[5], "|".join(aliases))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="GeoNames cities*.txt file")
+    parser.add_argument("-o", "--output", default="weather_gazetteer.tsv")
+    parser.add_argument("--min-population", type=int, default=15000)
+    args = parser.parse_args()
+
+    rows = sorted(_rows(args.source, args.min_population), key=lambda row: -row[0])
+    with open(args.output, "w", encoding="utf-8") as out:
+        out.write("# Generated by scripts/build_gazetteer.py from GeoNames (CC BY 4.0).\n")
+        for _, row in rows:
+            out.write("\t".join(row) + "\n")
+    print(f"Wrote {len(rows)} cities to {args.output}")
+
+if __name__ == "__main__":
+    main()
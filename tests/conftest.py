@@ -0,0 +1,78 @@
+'''
+Shared fixtures for the weather.py tests.
+
+weather.py reads its settings at import time, so the environment is set up
+here before any test module imports it: caches live in a throwaway
+directory, nothing runs in the background, and every upstream URL points at
+a host that is only reachable through the in-memory transport installed by
+the ``upstream`` fixture.
+'''
+
+import os
+import tempfile
+
+os.environ.update({
+    "WEATHER_CACHE_DIR": tempfile.mkdtemp(prefix="weather-tests-"),
+    "WEATHER_CACHE_URL": "memory://",
+    "WEATHER_GEOCODING_API": "http://open-meteo.test/v1",
+    "WEATHER_OPEN_METEO_BASE_URL": "http://open-meteo.test/v1",
+    "WEATHER_ARCHIVE_API": "http://open-meteo.test/v1",
+    "WEATHER_WARM_UP": "0",
+    "WEATHER_PREFETCH": "0",
+    "WEATHER_SNAPSHOT": "",
+    "WEATHER_UPSTREAM_RATE": "0",
+    "WECHAT_CACHE_DB": ""
+})
+
+from typing import Awaitable, Callable, List, Optional  # noqa: E402
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+import weather  # noqa: E402
+from bench.mock_open_meteo import MockOpenMeteo  # noqa: E402
+
+UPSTREAM_HOST = "open-meteo.test"
+
+class Upstream:
+    '''Answers weather.py's requests like Open-Meteo (bench/mock_open_meteo.py) and records them.
+
+    Set ``override`` to an async callable returning a response (or ``None``
+    to fall through to the stand-in) to inject failures or delays.
+    '''
+
+    def __init__(self):
+        self.mock = MockOpenMeteo()
+        self.requests: List[httpx.Request] = []
+        self.override: Optional[Callable[[httpx.Request], Awaitable[Optional[httpx.Response]]]] = None
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.override is not None:
+            response = await self.override(request)
+            if response is not None:
+                return response
+        status, payload = self.mock.respond(str(request.url))
+        return httpx.Response(status, json=payload)
+
+    def paths(self) -> List[str]:
+        return [request.url.path for request in self.requests]
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    '''Start every test with empty caches, closed circuits and no client.'''
+    weather._geocode_cache._entries.clear()
+    weather._forecast_cache._entries.clear()
+    weather._hourly_cache._entries.clear()
+    weather._cache_store._entries.clear()
+    weather._circuit_breakers.clear()
+    weather._host_semaphores.clear()
+    weather._http_client = None
+    yield
+    weather._http_client = None
+
+@pytest.fixture
+def upstream() -> Upstream:
+    fake = Upstream()
+    weather._http_client = httpx.AsyncClient(transport=httpx.MockTransport(fake.handle))
+    return fake
@@ -0,0 +1,76 @@
+import asyncio
+import os
+from datetime import date
+
+import pytest
+
+import weather
+
+np = pytest.importorskip("numpy")
+
+KEY = (39.9075, 116.3972)
+START = date(2020, 1, 1).toordinal()
+
+def _data(days: int, value: float):
+    return np.full((len(weather.ARCHIVE_VARIABLES), days), value)
+
+@pytest.fixture
+def store(tmp_path):
+    return weather._ArchiveStore(tmp_path, max_open=4)
+
+def test_save_writes_a_new_version_and_drops_the_old_one(store):
+    first = store.put(np, KEY, START, START + 10, _data(10, 1.0))
+    view = first.window(START, START + 10)[1]
+    second = store.put(np, KEY, START, START + 20, _data(20, 2.0))
+    assert len(store.versions(KEY)) == 1
+    assert second.length == 20 and float(second.data[0, 19]) == 2.0
+    # the earlier mapping is untouched by the rewrite
+    assert float(view[0, 9]) == 1.0
+
+def test_other_processes_see_the_newest_version(store, tmp_path):
+    other = weather._ArchiveStore(tmp_path, max_open=4)
+    store.put(np, KEY, START, START + 10, _data(10, 1.0))
+    assert other.get(np, KEY).length == 10
+    store.put(np, KEY, START, START + 30, _data(30, 3.0))
+    assert other.get(np, KEY).length == 10  # the open memmap is kept until a reload
+    assert other.get(np, KEY, reload=True).length == 30
+
+def test_undeletable_versions_are_skipped_and_retried(store, monkeypatch):
+    store.put(np, KEY, START, START + 10, _data(10, 1.0))
+
+    def locked(path):
+        raise PermissionError("mapped by another process")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(weather.os, "remove", locked)
+        store.put(np, KEY, START, START + 20, _data(20, 2.0))
+        assert len(store.versions(KEY)) == 2
+        assert store.get(np, KEY, reload=True).length == 20
+    store.put(np, KEY, START, START + 30, _data(30, 3.0))
+    assert len(store.versions(KEY)) == 1
+
+def test_unreadable_newest_version_falls_back(store):
+    store.put(np, KEY, START, START + 10, _data(10, 1.0))
+    newest = store.versions(KEY)[-1] + 1
+    store.path(KEY, newest).write_bytes(b"partial")
+    assert store.get(np, KEY, reload=True).length == 10
+
+def test_ignores_temporary_and_foreign_files(store, tmp_path):
+    (tmp_path / f"{KEY[0]:.4f}_{KEY[1]:.4f}.5.f8c.123.tmp").write_bytes(b"")
+    (tmp_path / f"{KEY[0]:.4f}_{KEY[1]:.4f}9.7.f8c").write_bytes(b"")
+    assert store.versions(KEY) == []
+    assert store.get(np, KEY) is None
+
+def test_history_downloads_only_missing_days(upstream, monkeypatch, tmp_path):
+    monkeypatch.setattr(weather, "_archive_store", weather._ArchiveStore(tmp_path, max_open=4))
+
+    def history(start: str, end: str) -> str:
+        return asyncio.run(weather.weather_query_history(weather.HistoryQueryInput(
+            city="北京", start_date=start, end_date=end, response_format="json")))
+
+    history("2020-01-10", "2020-01-20")
+    history("2020-01-12", "2020-01-18")
+    history("2020-01-05", "2020-01-25")
+    ranges = [(request.url.params["start_date"], request.url.params["end_date"]) for request in upstream.requests]
+    assert sorted(ranges) == [("2020-01-05", "2020-01-09"), ("2020-01-10", "2020-01-20"), ("2020-01-21", "2020-01-25")]
+    assert len(os.listdir(tmp_path)) == 1
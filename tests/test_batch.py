@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from pydantic import ValidationError
+
+import weather
+
+def _batch(**params):
+    return asyncio.run(weather.weather_query_batch(weather.BatchQueryInput(**params)))
+
+def _forecast_requests(upstream):
+    return [request for request in upstream.requests if request.url.path.endswith("/forecast")]
+
+def test_cities_share_one_multi_location_request(upstream):
+    cities = [f"Town {i}" for i in range(30)]
+    result = json.loads(_batch(cities=cities, days_later=1, response_format="json"))
+    forecasts = _forecast_requests(upstream)
+    assert len(forecasts) == 1
+    assert len(forecasts[0].url.params["latitude"].split(",")) == 30
+    assert [entry["query"] for entry in result["results"]] == cities
+    assert all(entry["date"] == result["date"] for entry in result["results"])
+
+def test_large_batches_are_chunked(upstream, monkeypatch):
+    monkeypatch.setattr(weather, "BATCH_LOCATIONS_PER_REQUEST", 4)
+    _batch(cities=[f"Town {i}" for i in range(10)], days_later=0, response_format="json")
+    assert [len(request.url.params["latitude"].split(",")) for request in _forecast_requests(upstream)] == [4, 4, 2]
+
+def test_cached_locations_are_not_requested_again(upstream):
+    _batch(cities=["Tokyo", "Osaka"], days_later=0)
+    _batch(cities=["Osaka", "Kyoto", "Tokyo"], days_later=2)
+    forecasts = _forecast_requests(upstream)
+    assert [len(request.url.params["latitude"].split(",")) for request in forecasts] == [2, 1]
+
+def test_errors_stay_with_their_city(upstream):
+    upstream.mock.not_found = frozenset({"Atlantis"})
+    result = json.loads(_batch(cities=["Tokyo", "Atlantis", "Osaka"], days_later=0, response_format="json"))
+    assert "not found" in result["results"][1]["error"]
+    assert result["results"][1]["query"] == "Atlantis"
+    assert "weather" in result["results"][0] and "weather" in result["results"][2]
+
+def test_failed_chunk_is_reported_per_city(upstream, monkeypatch):
+    monkeypatch.setattr(weather, "UPSTREAM_RETRIES", 0)
+
+    async def broken(request):
+        if request.url.path.endswith("/forecast"):
+            return httpx.Response(500, json={"error": True})
+
+    upstream.override = broken
+    markdown = _batch(cities=["Tokyo", "Osaka"], days_later=0)
+    assert markdown.count("Error: API request failed with status 500") == 2
+
+def test_formats_agree(upstream):
+    as_json = json.loads(_batch(cities=["Tokyo", "Osaka"], target_weekday="Friday", response_format="json"))
+    compact = json.loads(_batch(cities=["Tokyo", "Osaka"], target_weekday="Friday", response_format="compact"))
+    assert compact == as_json
+    markdown = _batch(cities=["Tokyo", "Osaka"], target_weekday="Friday")
+    assert markdown.count("# 天气预报 - ") == 2
+
+@pytest.mark.parametrize("params", [
+    {"cities": ["Tokyo"]},
+    {"cities": ["Tokyo"], "days_later": 1, "target_weekday": "Monday"},
+    {"cities": [], "days_later": 1},
+    {"cities": ["Tokyo"], "days_later": 16}
+])
+def test_invalid_requests(params):
+    with pytest.raises(ValidationError):
+        weather.BatchQueryInput(**params)
@@ -0,0 +1,81 @@
+import asyncio
+import sqlite3
+import time
+
+import weather
+
+def test_sqlite_round_trip(tmp_path):
+    backend = weather._SqliteBackend(str(tmp_path / "cache.db"))
+    expires = time.time() + 60
+
+    async def scenario():
+        await backend.put("geocode", "beijing", b"payload", expires)
+        await backend.put_many("geocode", [("nowhere", None, expires), ("gone", b"old", time.time() - 1)])
+        return (
+            await backend.get("geocode", "beijing"),
+            await backend.get_many("geocode", ["nowhere", "gone", "beijing", "unknown"]),
+            await backend.get("forecast", "beijing")
+        )
+
+    single, many, other_namespace = asyncio.run(scenario())
+    assert single == (b"payload", expires)
+    assert many == [(None, expires), None, (b"payload", expires), None]
+    assert other_namespace is None
+
+def test_sqlite_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    expires = time.time() + 60
+    asyncio.run(weather._SqliteBackend(path).put("forecast", "k", b"v", expires))
+    assert asyncio.run(weather._SqliteBackend(path).get("forecast", "k")) == (b"v", expires)
+
+def test_sqlite_unavailable_is_a_miss(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    backend = weather._SqliteBackend(str(blocker / "cache.db"))
+
+    async def scenario():
+        await backend.put("geocode", "k", b"v", time.time() + 60)
+        return await backend.get_many("geocode", ["k"])
+
+    assert asyncio.run(scenario()) == [None]
+
+def test_sqlite_lock_wait_does_not_block_the_loop(tmp_path):
+    path = str(tmp_path / "cache.db")
+    backend = weather._SqliteBackend(path)
+    asyncio.run(backend.put("geocode", "k", b"v", time.time() + 60))
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN EXCLUSIVE")
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await backend.put("geocode", "k", b"new", time.time() + 60)
+        task.cancel()
+        return ticks
+
+    try:
+        # the put waits out the 1 s busy timeout while the loop keeps running
+        assert asyncio.run(scenario()) >= 20
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = weather._MemoryBackend(max_entries=2)
+    expires = time.time() + 60
+
+    async def scenario():
+        await backend.put("ns", "a", b"1", expires)
+        await backend.put("ns", "b", b"2", expires)
+        await backend.get("ns", "a")
+        await backend.put("ns", "c", b"3", expires)
+        return await backend.get_many("ns", ["a", "b", "c"])
+
+    assert asyncio.run(scenario()) == [(b"1", expires), None, (b"3", expires)]
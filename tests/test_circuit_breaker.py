@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import weather
+from conftest import UPSTREAM_HOST
+
+FORECAST_URL = f"http://{UPSTREAM_HOST}/v1/forecast"
+PARAMS = {"latitude": 1.0, "longitude": 2.0, "daily": "weathercode", "forecast_days": 1}
+
+def _half_open_breaker() -> weather._CircuitBreaker:
+    breaker = weather._CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    breaker.opened_at = time.monotonic() - 31
+    weather._circuit_breakers[UPSTREAM_HOST] = breaker
+    assert breaker.state == "half-open"
+    return breaker
+
+def test_opens_after_threshold_and_rejects():
+    breaker = weather._CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+        breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(weather._UpstreamUnavailable):
+        breaker.before_request()
+    assert breaker.rejected == 1
+
+def test_half_open_allows_a_single_trial():
+    breaker = _half_open_breaker()
+    breaker.before_request()
+    with pytest.raises(weather._UpstreamUnavailable):
+        breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+def test_failed_trial_reopens():
+    breaker = _half_open_breaker()
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+def test_cancelled_trial_releases_the_circuit(upstream):
+    breaker = _half_open_breaker()
+    arrived = asyncio.Event()
+
+    async def hang(request):
+        arrived.set()
+        await asyncio.Event().wait()
+
+    upstream.override = hang
+
+    async def scenario():
+        task = asyncio.create_task(weather._http_get(FORECAST_URL, PARAMS, timeout=5))
+        await arrived.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert breaker.state == "half-open"
+    breaker.before_request()  # the next request becomes the trial
+
+def test_unexpected_error_releases_the_trial(upstream):
+    breaker = _half_open_breaker()
+
+    async def broken(request):
+        raise RuntimeError("bug in the transport")
+
+    upstream.override = broken
+    with pytest.raises(RuntimeError):
+        asyncio.run(weather._http_get(FORECAST_URL, PARAMS, timeout=5))
+    breaker.before_request()
+
+def test_rate_limit_rejection_does_not_take_the_trial(upstream, monkeypatch):
+    breaker = _half_open_breaker()
+    limiter = weather._TokenBucket(rate=0.001, capacity=1)
+    limiter._reserve()
+    monkeypatch.setattr(weather, "_upstream_limiter", limiter)
+    with pytest.raises(weather._UpstreamUnavailable, match="rate limit"):
+        asyncio.run(weather._http_get(FORECAST_URL, PARAMS, timeout=5, max_queue_wait=0))
+    breaker.before_request()
+
+def test_successful_trial_closes_the_circuit(upstream):
+    breaker = _half_open_breaker()
+    response = asyncio.run(weather._http_get(FORECAST_URL, PARAMS, timeout=5))
+    assert response.status_code == 200
+    assert breaker.state == "closed"
+
+def test_server_errors_open_the_circuit(upstream, monkeypatch):
+    monkeypatch.setattr(weather, "UPSTREAM_RETRIES", 0)
+    monkeypatch.setattr(weather, "CIRCUIT_FAILURE_THRESHOLD", 2)
+
+    async def unavailable(request):
+        return httpx.Response(503, json={"error": True})
+
+    upstream.override = unavailable
+
+    async def scenario():
+        for _ in range(2):
+            assert (await weather._http_get(FORECAST_URL, PARAMS, timeout=5)).status_code == 503
+        with pytest.raises(weather._UpstreamUnavailable):
+            await weather._http_get(FORECAST_URL, PARAMS, timeout=5)
+
+    asyncio.run(scenario())
+    assert len(upstream.requests) == 2
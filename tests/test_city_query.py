@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+import weather
+
+CITIES = ["Tokyo", "London", "Paris", "Berlin"]
+
+def _query(**params):
+    params.setdefault("cities", CITIES)
+    params.setdefault("response_format", "json")
+    return json.loads(asyncio.run(weather.weather_query_cities(weather.CityQueryInput(**params))))
+
+def _all_days():
+    result = _query(preset="next_7_days", variables=["precipitation_sum", "uv_index_max"], limit=1000)
+    assert len(result["rows"]) == len(CITIES) * 7
+    return result["rows"]
+
+def test_filter_selects_the_same_days_as_a_scan(upstream):
+    rows = _all_days()
+    expected = [row for row in rows if row["precipitation_sum"] is not None and row["precipitation_sum"] > 2]
+    assert 0 < len(expected) < len(rows)
+    result = _query(preset="next_7_days", where=[{"variable": "precipitation_sum", "op": "gt", "value": 2}],
+                    sort_by="precipitation_sum", limit=1000)
+    assert result["matched"] == len(expected)
+    assert sorted((row["query"], row["date"]) for row in result["rows"]) == \
+        sorted((row["query"], row["date"]) for row in expected)
+    amounts = [row["precipitation_sum"] for row in result["rows"]]
+    assert amounts == sorted(amounts, reverse=True)
+
+def test_aggregates_rank_cities(upstream):
+    rows = _all_days()
+    expected = {city: max(row["uv_index_max"] for row in rows if row["query"] == city) for city in CITIES}
+    result = _query(preset="next_7_days", aggregates=[{"variable": "uv_index_max", "function": "max"}],
+                    sort_by="max_uv_index_max", descending=False)
+    assert {row["query"]: row["max_uv_index_max"] for row in result["rows"]} == expected
+    assert [row["query"] for row in result["rows"]] == sorted(expected, key=expected.get)
+
+def test_aggregate_filter_selects_cities(upstream):
+    rows = _all_days()
+    totals = {city: sum(row["precipitation_sum"] for row in rows if row["query"] == city) for city in CITIES}
+    threshold = sorted(totals.values())[1]
+    result = _query(preset="next_7_days", aggregates=[{"variable": "precipitation_sum", "function": "sum"}],
+                    where=[{"variable": "precipitation_sum", "op": "gt", "value": threshold, "aggregate": "sum"}])
+    assert {row["query"] for row in result["rows"]} == {city for city, total in totals.items() if total > threshold}
+
+def test_cities_are_fetched_in_one_batch_and_failures_are_reported(upstream):
+    upstream.mock.not_found = frozenset({"Atlantis"})
+    result = _query(cities=CITIES + ["Atlantis"], limit=1000)
+    assert [error["query"] for error in result["errors"]] == ["Atlantis"]
+    assert len(result["rows"]) == len(CITIES)
+    assert upstream.paths().count("/v1/forecast") == 1
+    _query(limit=1000)
+    assert upstream.paths().count("/v1/forecast") == 1
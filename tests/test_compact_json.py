@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+import pytest
+
+import weather
+
+DAYS = ["2026-10-17", "2026-10-18"]
+CITY = {"name": '北京 "Peking"', "country": "中国", "latitude": 39.9, "longitude": 116.4}
+
+def _window() -> weather._DailyForecast:
+    return weather._DailyForecast.from_json({"daily": {
+        "time": DAYS,
+        "weathercode": [1, 61],
+        "temperature_2m_max": [21.5, None],
+        "sunrise": ["2026-10-17T06:21", "2026-10-18T06:22"],
+        "sunset": [None, "2026-10-18T17:31"]
+    }})
+
+@pytest.mark.parametrize("variables", [None, ("temperature_2m_max", "sunset")])
+def test_compact_matches_the_indented_result(variables):
+    forecast = _window()
+    for day in DAYS + ["2026-11-01"]:
+        compact = weather._format_weather_compact(forecast, CITY, day, variables)
+        assert json.loads(compact) == json.loads(weather._format_weather_json(forecast, CITY, day, variables))
+        assert "\n" not in compact and ": " not in compact
+
+def test_row_encoding_is_reused():
+    forecast = _window()
+    first = weather._format_weather_compact(forecast, CITY, DAYS[1])
+    assert forecast._encoded_days[1] is not None and forecast._encoded_days[0] is None
+    assert weather._format_weather_compact(forecast, CITY, DAYS[1]) == first
+
+def test_tool_compact_format_round_trips(upstream):
+    def query(response_format):
+        return asyncio.run(weather.weather_query_by_days(
+            weather.WeatherQueryInput(city="Tokyo", days_later=1, response_format=response_format)))
+
+    compact = query("compact")
+    assert json.loads(compact) == json.loads(query("json"))
+    assert len(compact) < len(query("json"))
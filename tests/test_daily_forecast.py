@@ -0,0 +1,56 @@
+import math
+
+import pytest
+
+import weather
+
+PAYLOAD = {
+    "utc_offset_seconds": 32400,
+    "daily": {
+        "time": ["2026-03-01", "2026-03-02", "2026-03-03"],
+        "weathercode": [3, 61, 0],
+        "temperature_2m_max": [12.5, 9, None],
+        "sunrise": ["2026-03-01T06:10", None, "2026-03-03T06:07"],
+        "note": ["a", "b", "c"]
+    }
+}
+
+@pytest.fixture
+def window():
+    return weather._DailyForecast.from_json(PAYLOAD)
+
+def test_rows_match_the_source_json(window):
+    for i, day in enumerate(PAYLOAD["daily"]["time"]):
+        assert window.day(i) == {name: values[i] for name, values in PAYLOAD["daily"].items()}
+        assert window.index(day) == i
+
+def test_columns_are_typed(window):
+    assert window.columns["weathercode"].typecode == "q"
+    assert window.columns["temperature_2m_max"].typecode == "d"
+    assert type(window.columns["sunrise"]) is weather._ClockColumn
+    assert window.columns["note"] == ("a", "b", "c")
+    assert math.isnan(window.columns["temperature_2m_max"][2])
+
+def test_dates_outside_the_window(window):
+    assert window.index("2026-02-28") is None
+    assert window.index("2026-03-04") is None
+
+def test_projection_and_missing_variables(window):
+    assert window.day(1, ("temperature_2m_max", "uv_index_max")) == {
+        "time": "2026-03-02", "temperature_2m_max": 9, "uv_index_max": None}
+
+def test_bytes_round_trip(window):
+    restored = weather._DailyForecast.from_bytes(window.to_bytes())
+    assert [restored.day(i) for i in range(3)] == [window.day(i) for i in range(3)]
+    assert restored.utc_offset == 32400
+
+def test_encoded_day_is_the_compact_row(window):
+    assert weather._dumps_compact(window.day(0)) == window.encoded_day(0)
+    assert window.encoded_day(0) is window.encoded_day(0)
+
+def test_select_gives_columns_over_rows(window):
+    assert window.select([2, None, 0])["sunrise"] == ["2026-03-03T06:07", None, "2026-03-01T06:10"]
+
+def test_gaps_in_the_dates_are_rejected():
+    with pytest.raises(ValueError, match="not consecutive"):
+        weather._DailyForecast.from_json({"daily": {"time": ["2026-03-01", "2026-03-03"]}})
@@ -0,0 +1,43 @@
+import asyncio
+import json
+
+import pytest
+
+import weather
+
+def _by_days(city: str, days_later: int) -> dict:
+    return json.loads(asyncio.run(weather.weather_query_by_days(
+        weather.WeatherQueryInput(city=city, days_later=days_later, response_format="json"))))
+
+def test_one_request_serves_every_day_of_the_window(upstream):
+    results = [_by_days("Tokyo", days_later) for days_later in range(weather.FORECAST_WINDOW_DAYS)]
+    assert len(upstream.requests) == 1
+    assert upstream.requests[0].url.params["forecast_days"] == "16"
+    assert len({result["date"] for result in results}) == 16
+    assert all("error" not in result for result in results)
+
+def test_locations_are_cached_separately(upstream):
+    _by_days("Tokyo", 0)
+    _by_days("Osaka", 0)
+    _by_days("Tokyo", 3)
+    assert len(upstream.requests) == 2
+
+@pytest.mark.parametrize("now, expected", [
+    (7200.0, 7800.0),     # just after the hour: this hour's run lands at :10
+    (7799.0, 7800.0),
+    (7800.0, 11400.0),    # published: next run
+    (10000.0, 11400.0)
+])
+def test_entries_expire_when_the_next_model_run_is_published(now, expected):
+    assert weather._next_model_update(now) == expected
+
+def test_shared_tier_serves_other_processes(upstream):
+    _by_days("Tokyo", 0)
+    weather._forecast_cache._entries.clear()  # a fresh worker, same backend
+    shared_hits = weather._forecast_cache.shared_hits
+    _by_days("Tokyo", 5)
+    assert len(upstream.requests) == 1
+    assert weather._forecast_cache.shared_hits == shared_hits + 1
+
+def test_nearby_coordinates_share_an_entry():
+    assert weather._ForecastCache.key(35.68951, 139.69171) == weather._ForecastCache.key(35.68949, 139.69169)
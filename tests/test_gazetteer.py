@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+import weather
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    return weather._Gazetteer(weather.GAZETTEER_PATH, tmp_path)
+
+@pytest.mark.parametrize("query", ["北京", "北京市", "Beijing", "BEIJING", "  bei   jing ", "Peking"])
+def test_lookup_names_and_aliases(gazetteer, query):
+    city = gazetteer.lookup(query)
+    assert city == {"latitude": 39.9075, "longitude": 116.3972, "name": "北京", "country": "中国"}
+
+@pytest.mark.parametrize("query", ["Zurich", "zürich", "Sao-Paulo", "montreal"])
+def test_lookup_folds_accents_and_punctuation(gazetteer, query):
+    assert gazetteer.lookup(query) is not None
+
+def test_miss_and_suggestions(gazetteer):
+    assert gazetteer.lookup("Atlantis") is None
+    assert (gazetteer.hits, gazetteer.misses) == (0, 1)
+    assert "上海" in gazetteer.suggest("shang")
+    assert gazetteer.suggest("") == []
+
+def test_compiled_index_is_reused(gazetteer, tmp_path, monkeypatch):
+    gazetteer.lookup("北京")
+    assert list(tmp_path.glob("gazetteer-*.marshal"))
+
+    def unexpected_parse(self):
+        raise AssertionError("parsed the TSV again")
+
+    monkeypatch.setattr(weather._Gazetteer, "_parse", unexpected_parse)
+    assert weather._Gazetteer(weather.GAZETTEER_PATH, tmp_path).lookup("Shanghai")["name"] == "上海"
+
+def test_missing_file_falls_back_to_the_api(tmp_path):
+    assert weather._Gazetteer(str(tmp_path / "missing.tsv"), tmp_path).lookup("北京") is None
+
+def test_resolution_skips_the_api_for_known_cities(upstream):
+    city = asyncio.run(weather._get_city_coordinates("Tokyo"))
+    assert city["name"] == "东京"
+    assert upstream.requests == []
+
+def test_unknown_city_goes_to_the_api_once(upstream):
+    async def scenario():
+        first = await weather._get_city_coordinates("Springfield")
+        second = await weather._get_city_coordinates("springfield")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == second
+    assert upstream.paths() == ["/v1/search"]
+
+def test_unknown_city_error_suggests_names(upstream):
+    upstream.mock.not_found = frozenset({"Shangh"})
+    with pytest.raises(ValueError, match="Did you mean: .*上海"):
+        asyncio.run(weather._get_city_coordinates("Shangh"))
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import weather
+
+BEIJING = {"latitude": 39.9, "longitude": 116.4, "name": "北京", "country": "中国"}
+
+def _cache(store=None, **overrides):
+    settings = {"max_entries": 8, "ttl": 60.0, "negative_ttl": 5.0}
+    settings.update(overrides)
+    return weather._GeocodeCache(store=store or weather._MemoryBackend(64), **settings)
+
+def test_hit_negative_entry_and_miss():
+    cache = _cache()
+
+    async def scenario():
+        await cache.put("beijing", BEIJING)
+        await cache.put("nowhere", None)
+        return await cache.get("beijing"), await cache.get("nowhere"), await cache.get("unknown")
+
+    assert asyncio.run(scenario()) == ((True, BEIJING), (True, None), (False, None))
+    assert (cache.hits, cache.negative_hits, cache.misses) == (2, 1, 1)
+
+def test_negative_entries_use_the_shorter_ttl():
+    cache = _cache()
+
+    async def scenario():
+        before = time.time()
+        await cache.put("beijing", BEIJING)
+        await cache.put("nowhere", None)
+        return before
+
+    before = asyncio.run(scenario())
+    assert cache._entries["beijing"][0] >= before + 60
+    assert before + 5 <= cache._entries["nowhere"][0] < before + 60
+
+def test_expired_entries_are_misses():
+    store = weather._MemoryBackend(64)
+    cache = _cache(store, ttl=-1.0)
+
+    async def scenario():
+        await cache.put("beijing", BEIJING)
+        return await cache.get("beijing")
+
+    assert asyncio.run(scenario()) == (False, None)
+    assert "beijing" not in cache._entries
+
+def test_shared_tier_serves_another_process():
+    store = weather._MemoryBackend(64)
+
+    async def scenario():
+        await _cache(store).put("beijing", BEIJING)
+        await _cache(store).put("nowhere", None)
+        fresh = _cache(store)
+        return fresh, await fresh.get("beijing"), await fresh.get("nowhere")
+
+    fresh, found, negative = asyncio.run(scenario())
+    assert found == (True, BEIJING)
+    assert negative == (True, None)
+    assert fresh.shared_hits == 2
+    assert set(fresh._entries) == {"beijing", "nowhere"}
+
+def test_memory_tier_is_lru_bounded():
+    cache = _cache(max_entries=2)
+
+    async def scenario():
+        await cache.put("a", BEIJING)
+        await cache.put("b", BEIJING)
+        await cache.get("a")
+        await cache.put("c", BEIJING)
+
+    asyncio.run(scenario())
+    assert list(cache._entries) == ["a", "c"]
+
+def test_preload_fetches_missing_keys_in_one_round_trip():
+    store = weather._MemoryBackend(64)
+    calls = []
+    get_many = store.get_many
+
+    async def counting(namespace, keys):
+        calls.append(list(keys))
+        return await get_many(namespace, keys)
+
+    store.get_many = counting
+
+    async def scenario():
+        await _cache(store).put("a", BEIJING)
+        await _cache(store).put("b", None)
+        cache = _cache(store)
+        await cache.put("c", BEIJING)
+        await cache.preload(["a", "b", "c", "a", "d"])
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert calls == [["a", "b", "d"]]
+    assert set(cache._entries) == {"a", "b", "c"}
+
+def test_city_lookups_are_cached(upstream):
+    async def scenario():
+        await weather._get_city_coordinates("Springfield")
+        await weather._get_city_coordinates("  SPRINGFIELD ")
+        weather._geocode_cache._entries.clear()
+        await weather._get_city_coordinates("springfield")  # from the shared tier
+
+    asyncio.run(scenario())
+    assert upstream.paths() == ["/v1/search"]
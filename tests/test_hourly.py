@@ -0,0 +1,62 @@
+import asyncio
+import json
+import re
+from datetime import date
+from types import SimpleNamespace
+
+import weather
+
+class FakeContext:
+    '''Stands in for FastMCP's Context: request metadata plus recorded progress notifications.'''
+
+    def __init__(self, progress_token=None):
+        meta = SimpleNamespace(progressToken=progress_token) if progress_token is not None else None
+        self.request_context = SimpleNamespace(meta=meta)
+        self.progress = []
+
+    async def report_progress(self, progress, total, message):
+        self.progress.append((progress, total, message))
+
+def _hourly(ctx, **params):
+    return asyncio.run(weather.weather_query_hourly(weather.HourlyQueryInput(city="Tokyo", **params), ctx))
+
+def test_without_a_progress_token_nothing_is_streamed(upstream):
+    ctx = FakeContext()
+    markdown = _hourly(ctx, num_days=2, chunk_hours=6)
+    assert ctx.progress == []
+    assert len(re.findall(r"^\| \d\d-\d\d \d\d:00 \|", markdown, re.MULTILINE)) == 48
+
+def test_markdown_chunks_concatenate_to_the_result(upstream):
+    ctx = FakeContext(progress_token="t")
+    markdown = _hourly(ctx, num_days=1, chunk_hours=10)
+    assert [(progress, total) for progress, total, _ in ctx.progress] == [(10, 24), (20, 24), (24, 24)]
+    assert "".join(message for _, _, message in ctx.progress) == markdown
+
+def test_json_chunks_reassemble_the_result(upstream):
+    ctx = FakeContext(progress_token=7)
+    result = json.loads(_hourly(ctx, num_days=1, chunk_hours=5, response_format="json",
+                               variables=["temperature_2m", "cloudcover"]))
+    blocks = [json.loads(message) for _, _, message in ctx.progress]
+    assert [block["offset"] for block in blocks] == [0, 5, 10, 15, 20]
+    assert sum((block["times"] for block in blocks), []) == result["times"]
+    for name in ("temperature_2m", "cloudcover"):
+        assert sum((block["hourly"][name] for block in blocks), []) == result["hourly"][name]
+    assert set(result["hourly"]) == {"temperature_2m", "cloudcover"}
+
+def test_only_requested_variables_are_fetched_and_the_cache_grows(upstream):
+    ctx = FakeContext()
+    _hourly(ctx, variables=["uv_index"], response_format="json")
+    _hourly(ctx, variables=["cloudcover"], response_format="json")
+    _hourly(ctx, variables=["uv_index", "cloudcover"], response_format="json")
+    assert [request.url.params["hourly"] for request in upstream.requests] == ["uv_index", "cloudcover,uv_index"]
+
+def test_range_is_clipped_to_the_forecast_window(upstream):
+    result = json.loads(_hourly(FakeContext(), start_days_later=14, num_days=5, response_format="compact"))
+    assert len(result["times"]) == 48
+
+def test_span_handles_daylight_saving_gaps():
+    times = ["2026-03-29T00:00", "2026-03-29T01:00", "2026-03-29T03:00", "2026-03-30T00:00"]
+    forecast = weather._HourlyForecast.from_json({"hourly": {"time": times, "temperature_2m": [1, 2, 3, 4]}})
+    start, stop = forecast.span(date(2026, 3, 29), 1)
+    assert (start, stop) == (0, 3)
+    assert [forecast.time(i) for i in range(start, stop)] == times[:3]
@@ -0,0 +1,87 @@
+import asyncio
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+import weather
+from bench.mock_open_meteo import forecast_location
+
+# Kiritimati is UTC+14 and Baker Island UTC-12: at any moment at least one of
+# them is on a different calendar date from a UTC server
+OFFSETS = [14 * 3600, -12 * 3600]
+
+def _local_today(offset: int) -> date:
+    return (datetime.now(timezone.utc) + timedelta(seconds=offset)).date()
+
+def _serve_in_timezone(upstream, offset: int) -> None:
+    '''Answer forecasts the way Open-Meteo does for timezone=auto at a location ``offset`` seconds from UTC.'''
+    async def local(request: httpx.Request):
+        if not request.url.path.endswith("/forecast"):
+            return None
+        query = {key: [value] for key, value in request.url.params.items()}
+        start = _local_today(offset)
+        query["start_date"] = [start.isoformat()]
+        query["end_date"] = [(start + timedelta(days=int(query["forecast_days"][0]) - 1)).isoformat()]
+        bodies = []
+        for latitude, longitude in zip(query["latitude"][0].split(","), query["longitude"][0].split(",")):
+            bodies.append({**forecast_location(float(latitude), float(longitude), query), "utc_offset_seconds": offset})
+        return httpx.Response(200, json=bodies if len(bodies) > 1 else bodies[0])
+
+    upstream.override = local
+
+def _call(tool, params, *args):
+    return asyncio.run(tool(params, *args))
+
+@pytest.mark.parametrize("offset", OFFSETS)
+def test_days_later_counts_from_the_city_date(upstream, offset):
+    _serve_in_timezone(upstream, offset)
+    result = json.loads(_call(weather.weather_query_by_days,
+                              weather.WeatherQueryInput(city="Tokyo", days_later=1, response_format="json")))
+    assert result["date"] == (_local_today(offset) + timedelta(days=1)).isoformat()
+    assert "error" not in result
+
+@pytest.mark.parametrize("offset", OFFSETS)
+def test_range_starts_on_the_city_date(upstream, offset):
+    _serve_in_timezone(upstream, offset)
+    result = json.loads(_call(weather.weather_query_range,
+                              weather.RangeQueryInput(city="Tokyo", num_days=16, response_format="json")))
+    days = [day["date"] for day in result["days"]]
+    assert days[0] == _local_today(offset).isoformat()
+    assert all("error" not in day for day in result["days"])
+
+@pytest.mark.parametrize("offset", OFFSETS)
+def test_weekday_is_after_the_city_date(upstream, offset):
+    _serve_in_timezone(upstream, offset)
+    today = _local_today(offset)
+    result = json.loads(_call(weather.weather_query_by_weekday, weather.WeekdayQueryInput(
+        city="Tokyo", target_weekday=today.strftime("%A"), response_format="json")))
+    assert result["date"] == (today + timedelta(days=7)).isoformat()
+
+@pytest.mark.parametrize("offset", OFFSETS)
+def test_batch_uses_the_city_date(upstream, offset):
+    _serve_in_timezone(upstream, offset)
+    result = json.loads(_call(weather.weather_query_batch, weather.BatchQueryInput(
+        cities=["Tokyo", "Osaka"], days_later=0, response_format="json")))
+    assert result["date"] == _local_today(offset).isoformat()
+    assert [entry["date"] for entry in result["results"]] == [result["date"]] * 2
+
+@pytest.mark.parametrize("offset", OFFSETS)
+def test_hourly_starts_at_the_city_midnight(upstream, offset):
+    _serve_in_timezone(upstream, offset)
+    result = json.loads(_call(weather.weather_query_hourly, weather.HourlyQueryInput(
+        city="Tokyo", start_days_later=1, response_format="json"), weather.mcp.get_context()))
+    tomorrow = (_local_today(offset) + timedelta(days=1)).isoformat()
+    assert result["times"][0] == f"{tomorrow}T00:00"
+    assert len(result["times"]) == 24
+
+def test_offset_survives_the_shared_cache():
+    window = weather._DailyForecast.from_json({"utc_offset_seconds": 3600, "daily": {"time": ["2026-01-01"]}})
+    assert weather._DailyForecast.from_bytes(window.to_bytes()).utc_offset == 3600
+
+def test_entries_without_an_offset_use_the_server_date():
+    import marshal
+    legacy = weather._DailyForecast.from_bytes(marshal.dumps((date.today().toordinal(), 1, {})))
+    assert legacy.utc_offset is None
+    assert legacy.today() == date.today()
@@ -0,0 +1,99 @@
+import asyncio
+
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+import mcp_metrics
+import weather
+from conftest import UPSTREAM_HOST
+
+def _value(metric, **labels):
+    return metric._values.get(mcp_metrics._label_key(labels))
+
+def test_render_counters_gauges_and_escaped_labels():
+    registry = mcp_metrics.Registry()
+    requests = registry.counter("requests_total", "Requests")
+    in_flight = registry.gauge("in_flight", "Busy")
+    requests.inc(path='a"b\\c')
+    requests.inc(2, path='a"b\\c')
+    with in_flight.track():
+        assert _value(in_flight) == 1
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{path="a\\"b\\\\c"} 3' in text
+    assert "in_flight 0" in text
+
+def test_histogram_buckets_are_cumulative():
+    registry = mcp_metrics.Registry()
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, stage="x")
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{stage="x",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="x",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="x",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{stage="x"} 3' in lines
+    assert 'latency_seconds_sum{stage="x"} 5.55' in lines
+
+def test_timed_wraps_sync_and_async_functions():
+    latency = mcp_metrics.Histogram("latency_seconds", "Latency")
+
+    @latency.timed(kind="sync")
+    def double(x):
+        return x * 2
+
+    @latency.timed(kind="async")
+    async def triple(x):
+        return x * 3
+
+    assert double(2) == 4
+    assert asyncio.run(triple(2)) == 6
+    assert _value(latency, kind="sync")[-2] == 1
+    assert _value(latency, kind="async")[-2] == 1
+
+def test_collectors_run_at_scrape_time():
+    registry = mcp_metrics.Registry()
+    size = [0]
+
+    @registry.collector
+    def collect():
+        yield "queue_size", "gauge", "Queue size", [({"queue": "q"}, size[0])]
+
+    size[0] = 4
+    assert 'queue_size{queue="q"} 4' in registry.render()
+
+def test_metrics_route_serves_the_registry():
+    registry = mcp_metrics.Registry()
+    registry.counter("hits_total", "Hits").inc()
+    client = TestClient(Starlette(routes=[mcp_metrics.metrics_route(registry)]))
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "hits_total 1" in response.text
+
+def test_dump_on_exit_writes_the_final_metrics(tmp_path, monkeypatch):
+    registered = []
+    monkeypatch.setattr(mcp_metrics.atexit, "register", registered.append)
+    registry = mcp_metrics.Registry()
+    counter = registry.counter("calls_total", "Calls")
+    path = tmp_path / "metrics.prom"
+    mcp_metrics.dump_on_exit(registry, str(path))
+    counter.inc()
+    registered[0]()
+    assert "calls_total 1" in path.read_text()
+
+def test_tool_calls_record_tool_stage_and_upstream_metrics(upstream):
+    tool = "weather_query_by_days"
+    calls_before = (_value(weather._TOOL_SECONDS, tool=tool) or [0] * 16)[-2]
+    geocode_before = (_value(weather._STAGE_SECONDS, stage="geocode") or [0] * 16)[-2]
+    ok_before = _value(weather._UPSTREAM_REQUESTS, host=UPSTREAM_HOST, status=200) or 0
+
+    asyncio.run(weather.weather_query_by_days(weather.WeatherQueryInput(city="Tokyo", days_later=1)))
+
+    assert _value(weather._TOOL_SECONDS, tool=tool)[-2] == calls_before + 1
+    assert _value(weather._TOOL_IN_FLIGHT, tool=tool) == 0
+    assert _value(weather._STAGE_SECONDS, stage="geocode")[-2] == geocode_before + 1
+    assert _value(weather._UPSTREAM_REQUESTS, host=UPSTREAM_HOST, status=200) == ok_before + len(upstream.requests)
+    text = weather._metrics.render()
+    assert 'weather_cache_events_total{cache="geocode",result="misses"}' in text
+    assert 'weather_cache_hit_ratio{cache="forecast"}' in text
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import weather
+
+LAT, LON = 35.6895, 139.6917
+KEY = weather._ForecastCache.key(LAT, LON)
+
+def _by_days(**params) -> dict:
+    return json.loads(asyncio.run(weather.weather_query_by_days(
+        weather.WeatherQueryInput(city="Tokyo", response_format="json", **params))))
+
+def _requested(upstream) -> list:
+    return [tuple(request.url.params["daily"].split(",")) for request in upstream.requests]
+
+def _window(days: list, **columns) -> weather._DailyForecast:
+    return weather._DailyForecast.from_json({"daily": {"time": days, **columns}})
+
+def test_fields_limit_what_is_fetched_and_rendered(upstream):
+    result = _by_days(days_later=1, fields=["temperature", "sun"])
+    assert _requested(upstream) == [("temperature_2m_max", "temperature_2m_min", "sunrise", "sunset")]
+    assert set(result["weather"]) == {"time", "temperature_2m_max", "temperature_2m_min", "sunrise", "sunset"}
+
+def test_narrower_query_is_served_from_a_wider_window(upstream):
+    _by_days(days_later=0)
+    result = _by_days(days_later=2, fields=["uv"])
+    assert len(upstream.requests) == 1
+    assert set(result["weather"]) == {"time", "uv_index_max"}
+
+def test_missing_fields_fetch_the_union(upstream):
+    _by_days(days_later=0, fields=["wind"])
+    _by_days(days_later=0, fields=["humidity"])
+    _by_days(days_later=0, fields=["wind", "humidity"])
+    assert _requested(upstream) == [
+        ("windspeed_10m_max",),
+        ("windspeed_10m_max", "relative_humidity_2m_max", "relative_humidity_2m_min")
+    ]
+
+def test_markdown_omits_unrequested_sections(upstream):
+    markdown = asyncio.run(weather.weather_query_by_days(
+        weather.WeatherQueryInput(city="Tokyo", days_later=0, fields=["precipitation"])))
+    assert "降水量" in markdown
+    assert "温度" not in markdown and "日出" not in markdown
+
+def test_put_many_keeps_columns_from_a_concurrent_fetch():
+    days = ["2026-01-01", "2026-01-02"]
+    cache = weather._ForecastCache(8)
+
+    async def scenario():
+        # the wider fetch lands first, the narrower one last
+        await cache.put_many([(KEY, _window(days, temperature_2m_max=[1, 2], precipitation_sum=[0.5, 0]))])
+        await cache.put_many([(KEY, _window(days, temperature_2m_max=[3, 4]))])
+        return await cache.get(*KEY)
+
+    window = asyncio.run(scenario())
+    assert window.variables == {"temperature_2m_max", "precipitation_sum"}
+    # the newest values win for the columns both fetches returned
+    assert window.value("temperature_2m_max", 0) == 3
+    assert window.value("precipitation_sum", 0) == 0.5
+
+def test_put_many_does_not_merge_different_dates_or_expired_entries():
+    cache = weather._ForecastCache(8)
+
+    async def scenario():
+        await cache.put_many([(KEY, _window(["2026-01-01"], precipitation_sum=[1]))])
+        await cache.put_many([(KEY, _window(["2026-01-02"], temperature_2m_max=[2]))])
+        shifted = await cache.get(*KEY)
+        cache._entries[KEY] = (0.0, shifted)
+        await cache.put_many([(KEY, _window(["2026-01-02"], weathercode=[3]))])
+        return shifted, await cache.get(*KEY)
+
+    shifted, after_expiry = asyncio.run(scenario())
+    assert shifted.variables == {"temperature_2m_max"}
+    assert after_expiry.variables == {"weathercode"}
+
+def test_hourly_windows_merge_too():
+    hours = ["2026-01-01T00:00", "2026-01-01T01:00"]
+    cache = weather._ForecastCache(8)
+
+    def window(**columns):
+        return weather._HourlyForecast.from_json({"hourly": {"time": hours, **columns}})
+
+    async def scenario():
+        await cache.put_many([(KEY, window(cloudcover=[10, 20], uv_index=[0, 0]))])
+        await cache.put_many([(KEY, window(cloudcover=[30, 40]))])
+        return await cache.get(*KEY)
+
+    merged = asyncio.run(scenario())
+    assert merged.variables == {"cloudcover", "uv_index"}
+    assert merged.select(["cloudcover"], 0, 2) == {"cloudcover": [30, 40]}
@@ -0,0 +1,70 @@
+import asyncio
+import json
+from datetime import date
+
+import pytest
+from pydantic import ValidationError
+
+import weather
+
+def _range(**params) -> str:
+    return asyncio.run(weather.weather_query_range(weather.RangeQueryInput(city="Tokyo", **params)))
+
+@pytest.mark.parametrize("start, num_days", [(0, 16), (15, 1), (9, 7)])
+def test_windows_inside_the_forecast_are_accepted(start, num_days):
+    weather.RangeQueryInput(city="Tokyo", start_days_later=start, num_days=num_days)
+
+@pytest.mark.parametrize("start, num_days", [(1, 16), (15, 2), (10, 7)])
+def test_windows_past_the_forecast_are_rejected(start, num_days):
+    with pytest.raises(ValidationError, match="must not exceed 16"):
+        weather.RangeQueryInput(city="Tokyo", start_days_later=start, num_days=num_days)
+
+@pytest.mark.parametrize("field, value", [("start_days_later", 16), ("start_days_later", -1),
+                                          ("num_days", 0), ("num_days", 17)])
+def test_out_of_range_fields_are_rejected(field, value):
+    with pytest.raises(ValidationError):
+        weather.RangeQueryInput(city="Tokyo", **{field: value})
+
+def test_preset_ignores_the_explicit_window():
+    weather.RangeQueryInput(city="Tokyo", start_days_later=15, num_days=16, preset="weekend")
+
+def test_city_query_window_is_validated_too():
+    with pytest.raises(ValidationError, match="must not exceed 16"):
+        weather.CityQueryInput(cities=["Tokyo"], start_days_later=10, num_days=7)
+    weather.CityQueryInput(cities=["Tokyo"], start_days_later=10, num_days=7, target_weekday="Monday")
+
+@pytest.mark.parametrize("today, expected", [
+    (date(2026, 10, 14), ["2026-10-17", "2026-10-18"]),  # Wednesday: the coming weekend
+    (date(2026, 10, 17), ["2026-10-17", "2026-10-18"]),  # Saturday: this weekend
+    (date(2026, 10, 18), ["2026-10-18"])                 # Sunday: what is left of it
+])
+def test_weekend_preset(today, expected):
+    params = weather.RangeQueryInput(city="Tokyo", preset="weekend")
+    assert weather._range_dates(params, today) == expected
+
+def test_explicit_window_dates():
+    params = weather.RangeQueryInput(city="Tokyo", start_days_later=3, num_days=2)
+    assert weather._range_dates(params, date(2026, 12, 30)) == ["2027-01-02", "2027-01-03"]
+
+def test_whole_range_from_one_request(upstream):
+    result = json.loads(_range(num_days=16, response_format="json"))
+    assert len(upstream.requests) == 1
+    assert len(result["days"]) == 16
+    assert all("weather" in day for day in result["days"])
+    assert result["start_date"] == result["days"][0]["date"]
+    assert result["end_date"] == result["days"][-1]["date"]
+
+def test_layouts_and_formats_agree(upstream):
+    rows = json.loads(_range(start_days_later=2, num_days=4, response_format="json"))
+    compact = json.loads(_range(start_days_later=2, num_days=4, response_format="compact"))
+    columns = json.loads(_range(start_days_later=2, num_days=4, response_format="compact", layout="columns"))
+    assert compact == rows
+    assert columns["dates"] == [day["date"] for day in rows["days"]]
+    assert columns["unavailable"] == []
+    for name, values in columns["columns"].items():
+        assert values == [day["weather"][name] for day in rows["days"]]
+
+def test_markdown_has_one_row_per_day(upstream):
+    markdown = _range(num_days=5)
+    rows = [line for line in markdown.splitlines() if line.startswith("| 20")]
+    assert len(rows) == 5
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+import weather
+
+@pytest.fixture
+def clock(monkeypatch):
+    '''Drive the bucket's monotonic clock and record requested sleeps instead of sleeping.'''
+    state = {"now": 1000.0, "slept": []}
+    monkeypatch.setattr(weather.time, "monotonic", lambda: state["now"])
+
+    async def fake_sleep(seconds):
+        state["slept"].append(seconds)
+
+    monkeypatch.setattr(weather.asyncio, "sleep", fake_sleep)
+    return state
+
+def test_burst_passes_without_waiting(clock):
+    bucket = weather._TokenBucket(rate=2, capacity=3)
+
+    async def scenario():
+        for _ in range(3):
+            await bucket.acquire(max_wait=0)
+
+    asyncio.run(scenario())
+    assert clock["slept"] == []
+
+def test_requests_past_the_burst_are_paced(clock):
+    bucket = weather._TokenBucket(rate=2, capacity=1)
+
+    async def scenario():
+        for _ in range(4):
+            await bucket.acquire(max_wait=10)
+
+    asyncio.run(scenario())
+    assert clock["slept"] == [0.5, 1.0, 1.5]
+
+def test_fails_fast_past_the_queue_budget_and_returns_the_token(clock):
+    bucket = weather._TokenBucket(rate=1, capacity=1)
+
+    async def scenario():
+        await bucket.acquire(max_wait=0)
+        with pytest.raises(weather._UpstreamUnavailable, match="rate limit"):
+            await bucket.acquire(max_wait=0.5)
+        clock["now"] += 1
+        await bucket.acquire(max_wait=0)  # the refused request did not keep its reservation
+
+    asyncio.run(scenario())
+    assert clock["slept"] == []
+
+def test_tokens_refill_up_to_capacity(clock):
+    bucket = weather._TokenBucket(rate=1, capacity=2)
+
+    async def scenario():
+        await bucket.acquire(max_wait=0)
+        await bucket.acquire(max_wait=0)
+        clock["now"] += 60
+        await bucket.acquire(max_wait=0)
+        await bucket.acquire(max_wait=0)
+        with pytest.raises(weather._UpstreamUnavailable):
+            await bucket.acquire(max_wait=0)
+
+    asyncio.run(scenario())
+
+def test_zero_rate_disables_the_limiter(clock):
+    bucket = weather._TokenBucket(rate=0, capacity=0)
+
+    async def scenario():
+        for _ in range(100):
+            await bucket.acquire(max_wait=0)
+
+    asyncio.run(scenario())
+
+def test_tools_report_the_local_limit(upstream, monkeypatch):
+    monkeypatch.setattr(weather, "_upstream_limiter", weather._TokenBucket(rate=0.001, capacity=1))
+    first = asyncio.run(weather.weather_query_by_days(weather.WeatherQueryInput(city="Tokyo", days_later=0)))
+    second = asyncio.run(weather.weather_query_by_days(weather.WeatherQueryInput(city="Osaka", days_later=0)))
+    assert first.startswith("# 天气预报")
+    assert "rate limit" in second
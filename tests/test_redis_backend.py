@@ -0,0 +1,65 @@
+import asyncio
+import contextlib
+import socket
+import time
+
+import weather
+from bench.resp_server import RespServer
+
+@contextlib.asynccontextmanager
+async def _serving(server: RespServer):
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    async with listener:
+        yield listener.sockets[0].getsockname()[1]
+
+def test_round_trip_with_auth_and_database():
+    server = RespServer(password="secret")
+    expires = time.time() + 60
+
+    async def scenario():
+        async with _serving(server) as port:
+            backend = weather._RedisBackend(f"redis://:secret@127.0.0.1:{port}/2")
+            await backend.put_many("geocode", [
+                ("beijing", b"payload", expires), ("nowhere", None, expires), ("gone", b"old", time.time() - 1)
+            ])
+            results = await asyncio.gather(
+                backend.get("geocode", "beijing"),
+                backend.get_many("geocode", ["nowhere", "gone", "beijing", "unknown"]),
+                backend.get("forecast", "beijing")
+            )
+            backend._disconnect()
+            return results
+
+    single, many, other_namespace = asyncio.run(scenario())
+    assert single == (b"payload", expires)
+    assert many == [(None, expires), None, (b"payload", expires), None]
+    assert other_namespace is None
+    assert set(server.databases[2]) == {b"weather:geocode:beijing", b"weather:geocode:nowhere"}
+
+def test_rejected_auth_is_a_miss():
+    server = RespServer(password="secret")
+
+    async def scenario():
+        async with _serving(server) as port:
+            backend = weather._RedisBackend(f"redis://:wrong@127.0.0.1:{port}/0")
+            await backend.put("geocode", "k", b"v", time.time() + 60)
+            return await backend.get("geocode", "k")
+
+    assert asyncio.run(scenario()) is None
+    assert not server.databases.get(0)
+
+def test_unreachable_server_is_a_miss_and_backs_off():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    backend = weather._RedisBackend(f"redis://127.0.0.1:{port}/0", retry_interval=60)
+
+    async def scenario():
+        first = await backend.get_many("geocode", ["a", "b"])
+        started = time.monotonic()
+        second = await backend.get("geocode", "a")
+        return first, second, time.monotonic() - started
+
+    first, second, elapsed = asyncio.run(scenario())
+    assert first == [None, None] and second is None
+    assert elapsed < 0.05  # no reconnect attempt inside the retry interval
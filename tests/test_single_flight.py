@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+import weather
+
+def test_concurrent_calls_share_one_task():
+    flight = weather._SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        mine = calls
+        await asyncio.sleep(0.01)
+        return mine
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("k", work) for _ in range(5)), flight.do("other", work))
+
+    assert asyncio.run(scenario()) == [1, 1, 1, 1, 1, 2]
+    assert flight.coalesced == 4
+    assert flight.stats()["in_flight"] == 0
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    flight = weather._SingleFlight()
+    attempts = 0
+
+    async def failing():
+        nonlocal attempts
+        attempts += 1
+        await asyncio.sleep(0)
+        raise RuntimeError("upstream down")
+
+    async def scenario():
+        results = await asyncio.gather(flight.do("k", failing), flight.do("k", failing), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        with pytest.raises(RuntimeError):
+            await flight.do("k", failing)
+
+    asyncio.run(scenario())
+    assert attempts == 2
+
+def test_a_cancelled_waiter_does_not_cancel_the_others():
+    flight = weather._SingleFlight()
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def work():
+            await gate.wait()
+            return "done"
+
+        first = asyncio.create_task(flight.do("k", work))
+        second = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        gate.set()
+        return await second, first.cancelled()
+
+    assert asyncio.run(scenario()) == ("done", True)
+
+def test_work_is_cancelled_when_the_last_waiter_leaves():
+    flight = weather._SingleFlight()
+    cancelled = False
+
+    async def scenario():
+        nonlocal cancelled
+
+        async def work():
+            nonlocal cancelled
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+        waiter = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        await asyncio.sleep(0)
+        # a late caller starts fresh instead of joining the cancelled task
+        return await flight.do("k", lambda: asyncio.sleep(0, result="fresh"))
+
+    assert asyncio.run(scenario()) == "fresh"
+    assert cancelled
+
+def test_concurrent_tool_calls_hit_upstream_once(upstream):
+    async def slow(request):
+        await asyncio.sleep(0.01)
+
+    upstream.override = slow
+
+    async def scenario():
+        return await asyncio.gather(*(weather.weather_query_by_days(
+            weather.WeatherQueryInput(city="Springfield", days_later=day)) for day in range(8)))
+
+    results = asyncio.run(scenario())
+    assert all(result.startswith("# 天气预报") for result in results)
+    assert upstream.paths() == ["/v1/search", "/v1/forecast"]
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import weather
+
+LAT, LON = 31.2222, 121.4581
+KEY = weather._ForecastCache.key(LAT, LON)
+TEMPERATURE = ("temperature_2m_max", "temperature_2m_min")
+RAIN = ("precipitation_sum",)
+
+def _requested(request) -> tuple:
+    return tuple(request.url.params["daily"].split(","))
+
+def _expire():
+    expires, window = weather._forecast_cache._entries[KEY]
+    weather._forecast_cache._entries[KEY] = (time.time() - 1, window)
+    weather._cache_store._entries.clear()  # the shared tier still holds the fresh copy
+
+def test_stale_window_is_served_and_refreshed_in_background(upstream):
+    async def scenario():
+        await weather._fetch_weather_data(LAT, LON, TEMPERATURE)
+        _expire()
+        stale_hits = weather._forecast_cache.stale_hits
+        window = await weather._fetch_weather_data(LAT, LON, TEMPERATURE[:1])
+        assert weather._forecast_cache.stale_hits == stale_hits + 1
+        assert len(upstream.requests) == 1  # answered before the refresh went out
+        await asyncio.gather(*weather._revalidations)
+        return window
+
+    window = asyncio.run(scenario())
+    assert window.covers(TEMPERATURE)
+    assert [_requested(request) for request in upstream.requests] == [TEMPERATURE, TEMPERATURE]
+    assert weather._forecast_cache._entries[KEY][0] > time.time()
+
+def test_stale_window_missing_variables_is_a_miss(upstream):
+    async def scenario():
+        await weather._fetch_weather_data(LAT, LON, TEMPERATURE)
+        _expire()
+        stale_hits = weather._forecast_cache.stale_hits
+        window = await weather._fetch_weather_data(LAT, LON, RAIN)
+        assert weather._forecast_cache.stale_hits == stale_hits
+        assert not weather._revalidations
+        return window
+
+    window = asyncio.run(scenario())
+    # fetched in the foreground, together with the columns the expired window held
+    assert _requested(upstream.requests[-1]) == ("temperature_2m_max", "temperature_2m_min", "precipitation_sum")
+    assert window.covers(TEMPERATURE + RAIN)
+
+def test_window_past_the_stale_ttl_is_refetched(upstream):
+    async def scenario():
+        await weather._fetch_weather_data(LAT, LON)
+        _, window = weather._forecast_cache._entries[KEY]
+        weather._forecast_cache._entries[KEY] = (time.time() - weather._forecast_cache.stale_ttl - 1, window)
+        weather._cache_store._entries.clear()
+        await weather._fetch_weather_data(LAT, LON)
+
+    asyncio.run(scenario())
+    assert len(upstream.requests) == 2
+    assert not weather._revalidations
+
+def test_batch_skips_stale_windows_without_every_variable(upstream):
+    async def scenario():
+        await weather._fetch_weather_data(LAT, LON, TEMPERATURE)
+        _expire()
+        stale_hits = weather._forecast_cache.stale_hits
+        results = await weather._fetch_weather_data_batch([(LAT, LON)])
+        assert weather._forecast_cache.stale_hits == stale_hits
+        return results
+
+    results = asyncio.run(scenario())
+    assert results[KEY].covers(weather.DAILY_VARIABLES)
+    assert len(upstream.requests) == 2
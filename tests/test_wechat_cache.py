@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+import wechat_mcp_streamable as wechat
+
+def _sizes(cache: wechat._DiskCache):
+    return dict(((ns, key), size) for ns, key, size in cache._db.execute("SELECT namespace, key, size FROM cache"))
+
+def test_round_trip_and_running_total(tmp_path):
+    cache = wechat._DiskCache(str(tmp_path / "cache.db"), max_bytes=1000)
+    expires = time.time() + 60
+    cache.put("article", "a", "x" * 100, expires)
+    cache.put("article", "b", "是" * 10, expires)
+    cache.put("article", "a", "y" * 40, expires)
+    assert cache.get("article", "a") == ("y" * 40, expires)
+    assert cache._total == 40 + 30 == sum(_sizes(cache).values())
+    # a new process sees what is already in the file
+    reopened = wechat._DiskCache(cache.path, max_bytes=1000)
+    assert reopened._connect() is not None
+    assert reopened._total == 70
+
+def test_trims_least_recently_used_only_past_the_cap(tmp_path):
+    cache = wechat._DiskCache(str(tmp_path / "cache.db"), max_bytes=250)
+    expires = time.time() + 60
+    for key in "abc":
+        cache.put("article", key, "x" * 80, expires)
+        time.sleep(0.001)
+    cache.get("article", "a")
+    assert len(_sizes(cache)) == 3
+    cache.put("article", "d", "x" * 80, expires)
+    assert set(_sizes(cache)) == {("article", "a"), ("article", "c"), ("article", "d")}
+    assert cache._total == 240
+
+def test_trim_drops_expired_entries_first(tmp_path):
+    cache = wechat._DiskCache(str(tmp_path / "cache.db"), max_bytes=250)
+    cache.put("result", "old", "x" * 200, time.time() - 1)
+    cache.put("result", "new", "x" * 100, time.time() + 60)
+    assert set(_sizes(cache)) == {("result", "new")}
+    assert cache._total == 100
+
+def test_two_level_cache_reads_through_disk(tmp_path):
+    disk = wechat._DiskCache(str(tmp_path / "cache.db"), max_bytes=10_000)
+    writer = wechat._TwoLevelCache("article", 60, 8, disk)
+    reader = wechat._TwoLevelCache("article", 60, 8, disk)
+
+    async def scenario():
+        await writer.put("url", {"title": "标题", "content": "正文"})
+        return await reader.get("url"), await reader.get("missing")
+
+    assert asyncio.run(scenario()) == ({"title": "标题", "content": "正文"}, None)
+    assert "url" in reader._entries
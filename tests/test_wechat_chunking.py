@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+import wechat_mcp_streamable as wechat
+
+class FakeLLM:
+    '''Replaces ``_parse_with_openai``: records each call and answers with a short result.'''
+
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.fail_on = fail_on
+
+    async def __call__(self, prompt, content, api_key, on_delta=None):
+        self.calls.append((prompt, content))
+        if self.fail_on is not None and self.fail_on in content:
+            raise RuntimeError("LLM unavailable")
+        result = f"result {len(self.calls)}"
+        if on_delta is not None:
+            await on_delta(result)
+        return result
+
+    def steps(self):
+        return ["reduce" if prompt.startswith(PROMPT + "\n\n") else "map" for prompt, _ in self.calls]
+
+PROMPT = "抽取公司信息"
+
+@pytest.fixture
+def llm(monkeypatch):
+    fake = FakeLLM()
+    monkeypatch.setattr(wechat, "_parse_with_openai", fake)
+    monkeypatch.setattr(wechat, "CHUNK_TOKENS", 40)
+    wechat._result_cache._entries.clear()
+    return fake
+
+def _article(paragraphs: int) -> str:
+    return "\n".join(f"第{i}段：公司甲投资了公司乙。" for i in range(paragraphs))
+
+def _extract(content, on_delta=None):
+    return asyncio.run(wechat._extract(PROMPT, content, "key", on_delta))
+
+def test_split_respects_the_budget_and_keeps_every_paragraph():
+    content = _article(30)
+    chunks = wechat._split_content(content, 40)
+    assert len(chunks) > 1
+    assert all(wechat._estimate_tokens(chunk) <= 40 for chunk in chunks)
+    assert "\n".join(chunks) == content
+
+def test_oversized_paragraphs_are_cut_at_sentences_then_sliced():
+    sentences = "公司甲完成了新一轮融资。" * 6
+    run_on = "x" * 500
+    chunks = wechat._split_content(sentences + "\n" + run_on, 20)
+    assert all(wechat._estimate_tokens(chunk) <= 20 for chunk in chunks)
+    assert "".join(chunks).replace("\n", "") == sentences + run_on
+    assert any(chunk.endswith("。") for chunk in chunks)
+
+def test_groups_always_shrink_the_list():
+    groups = wechat._group_partials(["x" * 400] * 5, 40)
+    assert [len(group) for group in groups] == [2, 2, 1]
+    assert sum(groups, []) == ["x" * 400] * 5
+
+def test_short_article_is_one_streamed_call(llm):
+    deltas = []
+
+    async def on_delta(text):
+        deltas.append(text)
+
+    assert _extract(_article(2), on_delta) == "result 1"
+    assert llm.calls == [(PROMPT, _article(2))]
+    assert deltas == ["result 1"]
+
+def test_long_article_is_mapped_then_reduced(llm):
+    content = _article(30)
+    parts = len(wechat._split_content(content, 40))
+    result = _extract(content)
+    assert llm.steps() == ["map"] * parts + ["reduce"]
+    assert result == f"result {parts + 1}"
+    reduce_prompt, reduce_input = llm.calls[-1]
+    assert reduce_prompt == wechat.REDUCE_PROMPT.format(prompt=PROMPT, parts=parts)
+    assert all(f"## 第 {i} 段的抽取结果" in reduce_input for i in range(1, parts + 1))
+
+def test_retry_only_repeats_unfinished_chunks(llm):
+    content = _article(30)
+    parts = len(wechat._split_content(content, 40))
+    llm.fail_on = "第29段"
+    with pytest.raises(RuntimeError):
+        _extract(content)
+    llm.calls.clear()
+    llm.fail_on = None
+    _extract(content)
+    assert llm.steps() == ["map", "reduce"]
+    assert f"以下为第 {parts} 段" in llm.calls[0][1]
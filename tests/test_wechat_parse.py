@@ -0,0 +1,64 @@
+import pytest
+
+import wechat_mcp_streamable as wechat
+from bench.wechat_parse import synthetic_page
+
+def _article(head: str = "", body: str = "") -> str:
+    return f"<html><head>{head}</head><body>{body}</body></html>"
+
+CONTENT = '<div id="js_content"><p>第一段</p><p>第二段</p></div>'
+
+PAGES = {
+    "synthetic": synthetic_page(seed=1, paragraphs=20),
+    "element text without meta tags": _article(body=(
+        '<h1 id="activity-name">\n  标题 \n</h1><a id="js_author_name">作者</a>'
+        '<em id="publish_time">2025-12-16</em>' + CONTENT)),
+    "meta tags win over elements": _article(
+        '<meta property="og:title" content="Meta 标题"><meta name="author" content="Meta 作者">'
+        '<meta property="article:published_time" content="2025-01-01">',
+        '<h1 id="activity-name">元素标题</h1>' + CONTENT),
+    "first meta of a kind wins": _article(
+        '<meta property="og:title" content="first"><meta property="og:title" content="second">', CONTENT),
+    "quoted > and entities in attributes": _article(
+        '<meta property="og:title" content="A &gt; B &amp; C">',
+        '<div title="x > y" id="js_content">a &lt;b&gt; &amp;&nbsp;c</div>'),
+    "single-quoted and unquoted attributes": _article(
+        "<meta property='og:title' content='单引号'><meta name=author content=Bare>", "<div id=js_content>正文</div>"),
+    "nested elements of the same name": _article(body=(
+        '<div id="js_content"><div>外<div>内</div></div><div>后</div></div><div>页脚</div>')),
+    "markup inside scripts, styles and comments": _article(
+        '<script>var s = "<div id=\\"js_content\\">fake</div>";</script>'
+        '<style>#js_content:after{content:"<p>"}</style>',
+        '<!-- <div id="js_content">old</div> -->' + '<div id="js_content">真<script>"</div>"</script>文</div>'),
+    "self-closing and void tags": _article(body='<div id="js_content">一<br/>二<img src="x.png">三<br /></div>'),
+    "id prefixed attribute is not the element": _article(body=(
+        '<div data-id="js_content">不是</div><div id="js_content">是</div>')),
+}
+
+@pytest.mark.parametrize("name", PAGES)
+def test_scanner_matches_beautifulsoup(name):
+    page = PAGES[name]
+    scanned = wechat._scan_wechat_html(page)
+    assert scanned is not None
+    assert scanned == wechat._soup_wechat_html(page)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_scanner_matches_beautifulsoup_on_large_pages(seed):
+    page = synthetic_page(seed=seed, paragraphs=200)
+    assert wechat._scan_wechat_html(page) == wechat._soup_wechat_html(page)
+
+@pytest.mark.parametrize("page", [
+    _article('<meta property="og:title" content="没有正文">'),
+    _article(body='<div id="js_content"><p>never closed'),
+])
+def test_unexpected_pages_fall_back_to_beautifulsoup(page):
+    assert wechat._scan_wechat_html(page) is None
+    assert wechat._parse_wechat_html(page) == wechat._soup_wechat_html(page)
+
+def test_forced_bs4_parser(monkeypatch):
+    page = PAGES["synthetic"]
+    calls = []
+    monkeypatch.setattr(wechat, "HTML_PARSER", "bs4")
+    monkeypatch.setattr(wechat, "_scan_wechat_html", lambda html: calls.append(html))
+    assert wechat._parse_wechat_html(page)["content"]
+    assert calls == []
@@ -6,25 +6,493 @@ This server provides tools to query weather forecasts using Open-Meteo API,
 supporting queries for specific cities and future dates.
 '''
 
-from typing import Dict, Any
+from typing import Dict, Any, Optional, AsyncIterator, Tuple, Callable, Awaitable, Hashable, List, TypeVar
 from enum import Enum
+from array import array
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from pathlib import Path
+from urllib.parse import urlsplit
+import abc
+import asyncio
+import importlib.util
+import bisect
+import calendar
+import functools
+import json
+import logging
+import marshal
+import os
+import random
+import socket
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+import warnings
 import httpx
-from pydantic import BaseModel, Field, field_validator, ConfigDict
-from mcp.server.fastmcp import FastMCP
-from datetime import datetime, timedelta
+from pydantic import BaseModel, Field, field_validator, model_validator, ConfigDict
+from mcp.server.fastmcp import Context, FastMCP
+import mcp_metrics
+from datetime import date, datetime, timedelta, timezone
 
-# Initialize the MCP server
-mcp = FastMCP("weather_mcp")
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
 
 # Constants
-OPEN_METEO_BASE_URL = "https://api.open-meteo.com/v1"
-GEOCODING_API = "https://geocoding-api.open-meteo.com/v1"
+OPEN_METEO_BASE_URL = os.environ.get("WEATHER_OPEN_METEO_BASE_URL", "https://api.open-meteo.com/v1")
+GEOCODING_API = os.environ.get("WEATHER_GEOCODING_API", "https://geocoding-api.open-meteo.com/v1")
+
+# HTTP connection pool settings (overridable through environment variables)
+HTTP_MAX_CONNECTIONS = int(os.environ.get("WEATHER_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("WEATHER_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("WEATHER_HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("WEATHER_HTTP_MAX_PER_HOST", "10"))
+HTTP2_ENABLED = os.environ.get("WEATHER_HTTP2", "").lower() in ("1", "true", "yes")
+
+# Directory for on-disk caches
+CACHE_DIR = Path(os.environ.get("WEATHER_CACHE_DIR", str(Path.home() / ".cache" / "openmeteo-weather-mcp")))
+
+# Offline gazetteer consulted before the geocoding API ("" disables it)
+GAZETTEER_PATH = os.environ.get("WEATHER_GAZETTEER", str(Path(__file__).with_name("weather_gazetteer.tsv")))
+
+# Upstream resilience: client-side rate limit, retries and circuit breaker
+UPSTREAM_RATE = float(os.environ.get("WEATHER_UPSTREAM_RATE", "10"))
+UPSTREAM_BURST = float(os.environ.get("WEATHER_UPSTREAM_BURST", "20"))
+UPSTREAM_MAX_QUEUE_WAIT = float(os.environ.get("WEATHER_UPSTREAM_MAX_QUEUE_WAIT", "5"))
+# Multi-city tools geocode through this many workers that queue for rate-limit tokens instead of failing fast
+GEOCODE_BATCH_CONCURRENCY = int(os.environ.get("WEATHER_GEOCODE_BATCH_CONCURRENCY", "8"))
+UPSTREAM_RETRIES = int(os.environ.get("WEATHER_UPSTREAM_RETRIES", "2"))
+UPSTREAM_BACKOFF_BASE = float(os.environ.get("WEATHER_UPSTREAM_BACKOFF_BASE", "0.2"))
+UPSTREAM_BACKOFF_MAX = float(os.environ.get("WEATHER_UPSTREAM_BACKOFF_MAX", "3"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("WEATHER_CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get("WEATHER_CIRCUIT_RESET_TIMEOUT", "30"))
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+# Geocoding cache settings
+GEOCODE_CACHE_SIZE = int(os.environ.get("WEATHER_GEOCODE_CACHE_SIZE", "1024"))
+GEOCODE_CACHE_TTL = float(os.environ.get("WEATHER_GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+GEOCODE_NEGATIVE_TTL = float(os.environ.get("WEATHER_GEOCODE_NEGATIVE_TTL", "3600"))
+
+# Persistent cache database shared by geocoding and forecast caches ("" disables it)
+CACHE_DB_PATH = os.environ.get("WEATHER_CACHE_DB", str(CACHE_DIR / "cache.sqlite3"))
+
+# Shared cache backend: "" (SQLite at WEATHER_CACHE_DB), "sqlite:///path", "memory://" or
+# "redis://[:password@]host:port/db" to share one cache between replicas
+CACHE_URL = os.environ.get("WEATHER_CACHE_URL", "")
+CACHE_TIMEOUT = float(os.environ.get("WEATHER_CACHE_TIMEOUT", "0.25"))
+CACHE_KEY_PREFIX = os.environ.get("WEATHER_CACHE_PREFIX", "weather:")
+CACHE_MEMORY_ENTRIES = int(os.environ.get("WEATHER_CACHE_MEMORY_ENTRIES", "10000"))
+
+# Forecast window cache settings
+FORECAST_WINDOW_DAYS = 16
+FORECAST_CACHE_SIZE = int(os.environ.get("WEATHER_FORECAST_CACHE_SIZE", "4096"))
+FORECAST_UPDATE_INTERVAL = float(os.environ.get("WEATHER_FORECAST_UPDATE_INTERVAL", "3600"))
+FORECAST_UPDATE_DELAY = float(os.environ.get("WEATHER_FORECAST_UPDATE_DELAY", "600"))
+FORECAST_STALE_TTL = float(os.environ.get("WEATHER_FORECAST_STALE_TTL", str(6 * 3600)))
+FORECAST_CACHE_SHARED = os.environ.get("WEATHER_FORECAST_CACHE_SHARED", "1").lower() in ("1", "true", "yes")
+DAILY_VARIABLES = (
+    "weathercode", "temperature_2m_max", "temperature_2m_min",
+    "apparent_temperature_max", "apparent_temperature_min",
+    "precipitation_sum", "precipitation_probability_max", "windspeed_10m_max",
+    "relative_humidity_2m_max", "relative_humidity_2m_min", "uv_index_max",
+    "sunrise", "sunset"
+)
+
+# Hourly forecast windows kept in memory (one per location, holding the requested variables)
+HOURLY_CACHE_SIZE = int(os.environ.get("WEATHER_HOURLY_CACHE_SIZE", "512"))
+
+# Historical archive: daily series persisted per location as memory-mapped column files
+ARCHIVE_API = os.environ.get("WEATHER_ARCHIVE_API", "https://archive-api.open-meteo.com/v1")
+ARCHIVE_DIR = Path(os.environ.get("WEATHER_ARCHIVE_DIR", str(CACHE_DIR / "archive")))
+ARCHIVE_FIRST_DATE = date(1940, 1, 1)
+ARCHIVE_LAG_DAYS = int(os.environ.get("WEATHER_ARCHIVE_LAG_DAYS", "5"))
+ARCHIVE_RECHECK_INTERVAL = float(os.environ.get("WEATHER_ARCHIVE_RECHECK_INTERVAL", str(6 * 3600)))
+ARCHIVE_OPEN_FILES = int(os.environ.get("WEATHER_ARCHIVE_OPEN_FILES", "64"))
+ARCHIVE_VARIABLES = (
+    "weathercode", "temperature_2m_max", "temperature_2m_min", "temperature_2m_mean",
+    "apparent_temperature_max", "apparent_temperature_min", "precipitation_sum", "windspeed_10m_max"
+)
+
+# Maximum number of locations per multi-location forecast request
+BATCH_LOCATIONS_PER_REQUEST = int(os.environ.get("WEATHER_BATCH_LOCATIONS_PER_REQUEST", "100"))
+
+# Background prefetch of hot locations after each model update
+PREFETCH_ENABLED = os.environ.get("WEATHER_PREFETCH", "1").lower() in ("1", "true", "yes")
+PREFETCH_TOP_N = int(os.environ.get("WEATHER_PREFETCH_TOP_N", "100"))
+PREFETCH_CONCURRENCY = int(os.environ.get("WEATHER_PREFETCH_CONCURRENCY", "4"))
+PREFETCH_JITTER = float(os.environ.get("WEATHER_PREFETCH_JITTER", "60"))
+
+# Streamable HTTP transport settings (read by every uvicorn worker)
+HTTP_STATELESS = os.environ.get("WEATHER_HTTP_STATELESS", "").lower() in ("1", "true", "yes")
+HTTP_JSON_RESPONSE = os.environ.get("WEATHER_HTTP_JSON_RESPONSE", "").lower() in ("1", "true", "yes")
+
+# Write final metrics to this file when a stdio process exits ("" disables it)
+METRICS_DUMP_PATH = os.environ.get("WEATHER_METRICS_DUMP", "")
+
+# Cold start: one-off work moved off the first request, and an optional warm-cache snapshot
+WARM_UP_ENABLED = os.environ.get("WEATHER_WARM_UP", "1").lower() in ("1", "true", "yes")
+SNAPSHOT_PATH = os.environ.get("WEATHER_SNAPSHOT", "")
+SNAPSHOT_ENTRIES = int(os.environ.get("WEATHER_SNAPSHOT_ENTRIES", "1000"))
+
+# Shared HTTP client state
+_http_client: Optional[httpx.AsyncClient] = None
+_http_client_lock = threading.Lock()
+_service_users = 0
+_service_generation = 0  # bumped whenever the last lifespan user leaves
+_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+def _build_http_client() -> httpx.AsyncClient:
+    '''Create the pooled client used for every Open-Meteo request.'''
+    http2 = HTTP2_ENABLED
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("WEATHER_HTTP2 is set but the 'h2' package is missing; falling back to HTTP/1.1")
+        http2 = False
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    )
+    return httpx.AsyncClient(limits=limits, http2=http2, timeout=30.0)
+
+def _get_http_client() -> httpx.AsyncClient:
+    '''Return the shared client, creating it on first use (possibly from the warm-up thread).'''
+    global _http_client
+    client = _http_client
+    if client is None or client.is_closed:
+        with _http_client_lock:
+            if _http_client is None or _http_client.is_closed:
+                _http_client = _build_http_client()
+            client = _http_client
+    return client
+
+def _warm_http_client(generation: int) -> None:
+    '''Build the shared client for the warm-up thread, unless the lifespan that started it has ended.'''
+    global _http_client
+    with _http_client_lock:
+        if _service_generation == generation and _http_client is None:
+            _http_client = _build_http_client()
+
+async def _close_http_client() -> None:
+    '''Close the shared client and drop per-host limiters bound to it.'''
+    global _http_client, _service_generation
+    with _http_client_lock:
+        client, _http_client = _http_client, None
+        _service_generation += 1
+    _host_semaphores.clear()
+    if client is not None:
+        await client.aclose()
+
+@asynccontextmanager
+async def _service_lifespan() -> AsyncIterator[None]:
+    '''Hold the shared client and background prefetcher; the last user to leave stops them.
+
+    The low-level MCP server enters its lifespan once per session, so these
+    are reference counted instead of being recreated for every session. The
+    client itself is built by the warm-up thread (or on first use), so the
+    lifespan returns at once and the client handshake is not delayed.
+    '''
+    global _service_users
+    _service_users += 1
+    if _service_users == 1:
+        if WARM_UP_ENABLED:
+            threading.Thread(target=_warm_up, args=(asyncio.get_running_loop(), _service_generation),
+                             name="weather-warm-up", daemon=True).start()
+        elif SNAPSHOT_PATH:
+            _restore_snapshot(_read_snapshot(SNAPSHOT_PATH))
+        if PREFETCH_ENABLED:
+            _prefetcher.start()
+    try:
+        yield
+    finally:
+        _service_users -= 1
+        if _service_users == 0:
+            await _prefetcher.stop()
+            await _close_http_client()
+            if SNAPSHOT_PATH:
+                _write_snapshot(SNAPSHOT_PATH)
+
+@asynccontextmanager
+async def _server_lifespan(_: FastMCP) -> AsyncIterator[Dict[str, Any]]:
+    '''FastMCP lifespan: keep the pooled HTTP client and prefetcher alive while serving.'''
+    async with _service_lifespan():
+        yield {}
+
+class _UpstreamUnavailable(RuntimeError):
+    '''Raised without contacting upstream: circuit open or local rate limit exhausted.'''
+
+class _TokenBucket:
+    '''Client-side rate limiter keeping the whole process under the upstream quota.'''
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _reserve(self) -> float:
+        '''Take a token (possibly going into debt) and return how long to wait for it.'''
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self, max_wait: float) -> None:
+        if self.rate <= 0:
+            return
+        wait = self._reserve()
+        if wait > max_wait:
+            self._tokens += 1  # give the reservation back
+            raise _UpstreamUnavailable("Local rate limit reached. Please wait before making more requests.")
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+class _CircuitBreaker:
+    '''Per-host circuit breaker: fail fast after consecutive upstream failures.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    requests fail immediately for ``reset_timeout`` seconds; then a single
+    trial request is let through (half-open) and its outcome closes or
+    re-opens the circuit.
+    '''
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_request(self) -> None:
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half-open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return
+        self.rejected += 1
+        retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise _UpstreamUnavailable(
+            f"Weather service is temporarily unavailable. Please try again in {retry_in:.0f} seconds."
+        )
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def release(self) -> None:
+        '''Forget a request that ended without an upstream outcome (cancelled or failed locally).
+
+        Lets the next request become the half-open trial instead of leaving
+        the circuit waiting forever for a result that will never arrive.
+        '''
+        self._trial_in_flight = False
+
+# Metrics
+_metrics = mcp_metrics.Registry()
+_STAGE_SECONDS = _metrics.histogram("weather_stage_seconds", "Latency of tool stages (geocode, forecast, format)")
+_TOOL_SECONDS = _metrics.histogram("weather_tool_seconds", "End-to-end latency of tool calls")
+_TOOL_IN_FLIGHT = _metrics.gauge("weather_tool_in_flight", "Tool calls currently being served")
+_UPSTREAM_SECONDS = _metrics.histogram("weather_upstream_seconds", "Latency of upstream HTTP requests")
+_UPSTREAM_REQUESTS = _metrics.counter(
+    "weather_upstream_requests_total",
+    "Upstream HTTP requests by host and status (status is 'error' for transport failures)"
+)
+_UPSTREAM_IN_FLIGHT = _metrics.gauge("weather_upstream_in_flight", "Upstream HTTP requests currently in flight")
+
+def _instrumented(func: Callable) -> Callable:
+    '''Record latency and in-flight count of a tool coroutine.'''
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with _TOOL_IN_FLIGHT.track(tool=name), _TOOL_SECONDS.time(tool=name):
+            return await func(*args, **kwargs)
+    return wrapper
+
+_upstream_limiter = _TokenBucket(UPSTREAM_RATE, UPSTREAM_BURST)
+_circuit_breakers: Dict[str, _CircuitBreaker] = {}
+
+def _backoff_delay(attempt: int, response: Optional[httpx.Response]) -> float:
+    '''Full-jitter exponential backoff, honouring a short Retry-After header.'''
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after", ""))
+        except ValueError:
+            retry_after = None
+        if retry_after is not None and 0 <= retry_after <= UPSTREAM_BACKOFF_MAX:
+            return retry_after
+    return random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * 2 ** attempt))
+
+async def _http_get(url: str, params: Dict[str, Any], timeout: float,
+                    max_queue_wait: float = UPSTREAM_MAX_QUEUE_WAIT) -> httpx.Response:
+    '''GET through the shared pool with rate limiting, retries and a circuit breaker.
+
+    A request that would wait longer than ``max_queue_wait`` for a rate-limit
+    token fails fast; batch callers that bound their own concurrency pass
+    ``float("inf")`` to queue instead. Concurrent requests per host are capped. Timeouts, transport errors and
+    retryable statuses (429/5xx) are retried with jittered backoff and count
+    as failures for the host's circuit breaker. After the last attempt the
+    response is returned as-is for the caller to ``raise_for_status``.
+    '''
+    host = urlsplit(url).netloc
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = _host_semaphores[host] = asyncio.Semaphore(HTTP_MAX_CONNECTIONS_PER_HOST)
+    breaker = _circuit_breakers.get(host)
+    if breaker is None:
+        breaker = _circuit_breakers[host] = _CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+
+    attempt = 0
+    while True:
+        # Take the token first: a fail-fast limiter error must not strand a half-open trial
+        await _upstream_limiter.acquire(max_queue_wait)
+        breaker.before_request()
+        response = None
+        try:
+            async with semaphore:
+                with _UPSTREAM_IN_FLIGHT.track(host=host), _UPSTREAM_SECONDS.time(host=host):
+                    response = await _get_http_client().get(url, params=params, timeout=timeout)
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            _UPSTREAM_REQUESTS.inc(host=host, status="timeout" if isinstance(e, httpx.TimeoutException) else "error")
+            breaker.record_failure()
+            if attempt >= UPSTREAM_RETRIES:
+                raise
+        except BaseException:
+            # Cancelled (e.g. the last single-flight waiter left) or failed locally: no outcome to record
+            breaker.release()
+            raise
+        else:
+            _UPSTREAM_REQUESTS.inc(host=host, status=response.status_code)
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if attempt >= UPSTREAM_RETRIES:
+                return response
+        await asyncio.sleep(_backoff_delay(attempt, response))
+        attempt += 1
+
+# Initialize the MCP server
+mcp = FastMCP("weather_mcp", lifespan=_server_lifespan)
 
 # Enums
 class ResponseFormat(str, Enum):
     '''Output format for tool responses.'''
     MARKDOWN = "markdown"
     JSON = "json"
+    COMPACT = "compact"
+
+class RangeLayout(str, Enum):
+    '''Shape of multi-day JSON/compact results.'''
+    ROWS = "rows"
+    COLUMNS = "columns"
+
+class HourlyVariable(str, Enum):
+    '''Open-Meteo hourly variables offered by weather_query_hourly.'''
+    TEMPERATURE = "temperature_2m"
+    APPARENT_TEMPERATURE = "apparent_temperature"
+    RELATIVE_HUMIDITY = "relative_humidity_2m"
+    PRECIPITATION = "precipitation"
+    PRECIPITATION_PROBABILITY = "precipitation_probability"
+    WEATHERCODE = "weathercode"
+    WINDSPEED = "windspeed_10m"
+    WINDDIRECTION = "winddirection_10m"
+    WINDGUSTS = "windgusts_10m"
+    CLOUDCOVER = "cloudcover"
+    UV_INDEX = "uv_index"
+
+class WeatherField(str, Enum):
+    '''Groups of daily variables a single-day query can be narrowed to.'''
+    WEATHER = "weather"
+    TEMPERATURE = "temperature"
+    APPARENT_TEMPERATURE = "apparent_temperature"
+    PRECIPITATION = "precipitation"
+    PRECIPITATION_PROBABILITY = "precipitation_probability"
+    WIND = "wind"
+    HUMIDITY = "humidity"
+    UV = "uv"
+    SUN = "sun"
+
+_FIELD_VARIABLES = {
+    WeatherField.WEATHER: ("weathercode",),
+    WeatherField.TEMPERATURE: ("temperature_2m_max", "temperature_2m_min"),
+    WeatherField.APPARENT_TEMPERATURE: ("apparent_temperature_max", "apparent_temperature_min"),
+    WeatherField.PRECIPITATION: ("precipitation_sum",),
+    WeatherField.PRECIPITATION_PROBABILITY: ("precipitation_probability_max",),
+    WeatherField.WIND: ("windspeed_10m_max",),
+    WeatherField.HUMIDITY: ("relative_humidity_2m_max", "relative_humidity_2m_min"),
+    WeatherField.UV: ("uv_index_max",),
+    WeatherField.SUN: ("sunrise", "sunset")
+}
+
+class DailyVariable(str, Enum):
+    '''Numeric daily variables that cross-city queries can filter, sort and aggregate.'''
+    WEATHERCODE = "weathercode"
+    TEMPERATURE_MAX = "temperature_2m_max"
+    TEMPERATURE_MIN = "temperature_2m_min"
+    APPARENT_TEMPERATURE_MAX = "apparent_temperature_max"
+    APPARENT_TEMPERATURE_MIN = "apparent_temperature_min"
+    PRECIPITATION_SUM = "precipitation_sum"
+    PRECIPITATION_PROBABILITY_MAX = "precipitation_probability_max"
+    WINDSPEED_MAX = "windspeed_10m_max"
+    RELATIVE_HUMIDITY_MAX = "relative_humidity_2m_max"
+    RELATIVE_HUMIDITY_MIN = "relative_humidity_2m_min"
+    UV_INDEX_MAX = "uv_index_max"
+
+class FilterOperator(str, Enum):
+    '''Comparison applied by a query filter.'''
+    GT = "gt"
+    GE = "ge"
+    LT = "lt"
+    LE = "le"
+    EQ = "eq"
+    NE = "ne"
+
+class AggregateFunction(str, Enum):
+    '''Per-city reduction over the matching days.'''
+    MIN = "min"
+    MAX = "max"
+    MEAN = "mean"
+    SUM = "sum"
+    COUNT = "count"
+
+class ArchiveVariable(str, Enum):
+    '''Daily variables kept in the historical archive.'''
+    WEATHERCODE = "weathercode"
+    TEMPERATURE_MAX = "temperature_2m_max"
+    TEMPERATURE_MIN = "temperature_2m_min"
+    TEMPERATURE_MEAN = "temperature_2m_mean"
+    APPARENT_TEMPERATURE_MAX = "apparent_temperature_max"
+    APPARENT_TEMPERATURE_MIN = "apparent_temperature_min"
+    PRECIPITATION_SUM = "precipitation_sum"
+    WINDSPEED_MAX = "windspeed_10m_max"
+
+def _field_variables(fields: Optional[List[WeatherField]]) -> Tuple[str, ...]:
+    '''Daily variables needed for ``fields`` (all of them for ``None``), in DAILY_VARIABLES order.'''
+    if fields is None:
+        return DAILY_VARIABLES
+    wanted = {variable for field in fields for variable in _FIELD_VARIABLES[field]}
+    return tuple(variable for variable in DAILY_VARIABLES if variable in wanted)
 
 # Pydantic Models for Input Validation
 class WeatherQueryInput(BaseModel):
@@ -32,7 +500,8 @@ class WeatherQueryInput(BaseModel):
     model_config = ConfigDict(
         str_strip_whitespace=True,
         validate_assignment=True,
-        extra='forbid'
+        extra='forbid',
+        defer_build=True
     )
 
     city: str = Field(
@@ -45,11 +514,16 @@ class WeatherQueryInput(BaseModel):
         ...,
         description="Number of days in the future to query (e.g., 1 for tomorrow, 2 for day after tomorrow)",
         ge=0,
-        le=16
+        le=FORECAST_WINDOW_DAYS - 1
+    )
+    fields: Optional[List[WeatherField]] = Field(
+        default=None,
+        description="Only fetch and return these groups (e.g. ['temperature', 'precipitation_probability']); all when omitted",
+        min_length=1
     )
     response_format: ResponseFormat = Field(
         default=ResponseFormat.MARKDOWN,
-        description="Output format: 'markdown' for human-readable or 'json' for machine-readable"
+        description="Output format: 'markdown' for human-readable, 'json' for machine-readable or 'compact' for minified JSON"
     )
 
     @field_validator('city')
@@ -64,7 +538,8 @@ class WeekdayQueryInput(BaseModel):
     model_config = ConfigDict(
         str_strip_whitespace=True,
         validate_assignment=True,
-        extra='forbid'
+        extra='forbid',
+        defer_build=True
     )
 
     city: str = Field(
@@ -79,9 +554,14 @@ class WeekdayQueryInput(BaseModel):
         min_length=1,
         max_length=20
     )
+    fields: Optional[List[WeatherField]] = Field(
+        default=None,
+        description="Only fetch and return these groups (e.g. ['temperature', 'precipitation_probability']); all when omitted",
+        min_length=1
+    )
     response_format: ResponseFormat = Field(
         default=ResponseFormat.MARKDOWN,
-        description="Output format: 'markdown' for human-readable or 'json' for machine-readable"
+        description="Output format: 'markdown' for human-readable, 'json' for machine-readable or 'compact' for minified JSON"
     )
 
     @field_validator('target_weekday')
@@ -93,30 +573,1779 @@ class WeekdayQueryInput(BaseModel):
             raise ValueError(f"Invalid weekday. Must be one of: {', '.join(valid_days)}")
         return v.strip()
 
-# Shared utility functions
-async def _get_city_coordinates(city: str) -> Dict[str, float]:
-    '''Get latitude and longitude for a city using geocoding API.'''
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{GEOCODING_API}/search",
-                params={"name": city, "count": 1, "language": "zh", "format": "json"},
-                timeout=10.0
+class RangePreset(str, Enum):
+    '''Named date ranges for range queries.'''
+    WEEKEND = "weekend"
+    NEXT_7_DAYS = "next_7_days"
+
+class RangeQueryInput(BaseModel):
+    '''Input model for multi-day weather queries.'''
+    model_config = ConfigDict(
+        str_strip_whitespace=True,
+        validate_assignment=True,
+        extra='forbid',
+        defer_build=True
+    )
+
+    city: str = Field(
+        ...,
+        description="City name (e.g., '北京', '上海', 'New York', 'London')",
+        min_length=1,
+        max_length=100
+    )
+    start_days_later: int = Field(
+        default=0,
+        description="First day of the range as days from today (0=today). Ignored when preset is given",
+        ge=0,
+        le=FORECAST_WINDOW_DAYS - 1
+    )
+    num_days: int = Field(
+        default=7,
+        description="Number of days in the range (1-16). Ignored when preset is given",
+        ge=1,
+        le=16
+    )
+    preset: Optional[RangePreset] = Field(
+        default=None,
+        description="Named range: 'weekend' (the coming Saturday and Sunday) or 'next_7_days'"
+    )
+    layout: RangeLayout = Field(
+        default=RangeLayout.ROWS,
+        description="JSON/compact only: 'rows' (one object per day) or 'columns' (one array per variable)"
+    )
+    response_format: ResponseFormat = Field(
+        default=ResponseFormat.MARKDOWN,
+        description="Output format: 'markdown' for human-readable, 'json' for machine-readable or 'compact' for minified JSON"
+    )
+
+    @field_validator('city')
+    @classmethod
+    def validate_city(cls, v: str) -> str:
+        if not v.strip():
+            raise ValueError("City name cannot be empty")
+        return v.strip()
+
+    @model_validator(mode='after')
+    def validate_window(self) -> 'RangeQueryInput':
+        if self.preset is None and self.start_days_later + self.num_days > FORECAST_WINDOW_DAYS:
+            raise ValueError(
+                f"start_days_later + num_days must not exceed {FORECAST_WINDOW_DAYS}: the forecast covers "
+                f"today through day {FORECAST_WINDOW_DAYS - 1} (got {self.start_days_later} + {self.num_days})"
             )
-            response.raise_for_status()
-            data = response.json()
+        return self
+
+class BatchQueryInput(BaseModel):
+    '''Input model for multi-city weather queries.'''
+    model_config = ConfigDict(
+        str_strip_whitespace=True,
+        validate_assignment=True,
+        extra='forbid',
+        defer_build=True
+    )
+
+    cities: List[str] = Field(
+        ...,
+        description="List of city names (e.g., ['北京', '上海', 'London'])",
+        min_length=1,
+        max_length=200
+    )
+    days_later: Optional[int] = Field(
+        default=None,
+        description="Number of days in the future to query (0-15). Mutually exclusive with target_weekday",
+        ge=0,
+        le=FORECAST_WINDOW_DAYS - 1
+    )
+    target_weekday: Optional[str] = Field(
+        default=None,
+        description="Target weekday in English (e.g., 'Saturday'). Mutually exclusive with days_later",
+        min_length=1,
+        max_length=20
+    )
+    response_format: ResponseFormat = Field(
+        default=ResponseFormat.MARKDOWN,
+        description="Output format: 'markdown' for human-readable, 'json' for machine-readable or 'compact' for minified JSON"
+    )
 
-            if not data.get("results"):
-                raise ValueError(f"City '{city}' not found. Please check the city name.")
+    @field_validator('cities')
+    @classmethod
+    def validate_cities(cls, v: List[str]) -> List[str]:
+        cities = [city.strip() for city in v]
+        if any(not city or len(city) > 100 for city in cities):
+            raise ValueError("City names must be 1-100 characters long")
+        return cities
+
+    @field_validator('target_weekday')
+    @classmethod
+    def validate_weekday(cls, v: Optional[str]) -> Optional[str]:
+        if v is None:
+            return v
+        return WeekdayQueryInput.validate_weekday(v)
+
+    @model_validator(mode='after')
+    def validate_target(self) -> 'BatchQueryInput':
+        if (self.days_later is None) == (self.target_weekday is None):
+            raise ValueError("Exactly one of days_later or target_weekday must be given")
+        return self
+
+class HourlyQueryInput(BaseModel):
+    '''Input model for hourly weather queries.'''
+    model_config = ConfigDict(
+        str_strip_whitespace=True,
+        validate_assignment=True,
+        extra='forbid',
+        defer_build=True
+    )
 
-            result = data["results"][0]
-            return {"latitude": result["latitude"], "longitude": result["longitude"],
-                   "name": result.get("name", city), "country": result.get("country", "")}
+    city: str = Field(
+        ...,
+        description="City name (e.g., '北京', '上海', 'New York', 'London')",
+        min_length=1,
+        max_length=100
+    )
+    start_days_later: int = Field(
+        default=0,
+        description="First day as days from today (0=today)",
+        ge=0,
+        le=FORECAST_WINDOW_DAYS - 1
+    )
+    num_days: int = Field(
+        default=1,
+        description="Number of days of hourly data (1-16)",
+        ge=1,
+        le=16
+    )
+    variables: List[HourlyVariable] = Field(
+        default=[HourlyVariable.TEMPERATURE, HourlyVariable.PRECIPITATION, HourlyVariable.WINDSPEED],
+        description="Hourly variables to return; only these are requested from Open-Meteo",
+        min_length=1
+    )
+    chunk_hours: int = Field(
+        default=24,
+        description="Hours per progress notification when the client sent a progress token",
+        ge=1,
+        le=384
+    )
+    response_format: ResponseFormat = Field(
+        default=ResponseFormat.MARKDOWN,
+        description="Output format: 'markdown' for human-readable, 'json' for machine-readable or 'compact' for minified JSON"
+    )
+
+    @field_validator('city')
+    @classmethod
+    def validate_city(cls, v: str) -> str:
+        if not v.strip():
+            raise ValueError("City name cannot be empty")
+        return v.strip()
+
+    @field_validator('variables')
+    @classmethod
+    def validate_variables(cls, v: List[HourlyVariable]) -> List[HourlyVariable]:
+        return list(dict.fromkeys(v))
+
+class QueryFilter(BaseModel):
+    '''One comparison of a cross-city query, e.g. precipitation_sum gt 10.'''
+    model_config = ConfigDict(extra='forbid', defer_build=True)
+
+    variable: DailyVariable = Field(..., description="Daily variable to compare")
+    op: FilterOperator = Field(..., description="Comparison: 'gt', 'ge', 'lt', 'le', 'eq' or 'ne'")
+    value: float = Field(..., description="Value to compare against")
+    aggregate: Optional[AggregateFunction] = Field(
+        default=None,
+        description="Compare the per-city aggregate (e.g. 'sum' over the days) instead of each day"
+    )
+
+    @property
+    def column(self) -> str:
+        return self.variable.value if self.aggregate is None else f"{self.aggregate.value}_{self.variable.value}"
+
+class QueryAggregate(BaseModel):
+    '''One per-city aggregate column of a cross-city query, named "<function>_<variable>".'''
+    model_config = ConfigDict(extra='forbid', defer_build=True)
+
+    variable: DailyVariable = Field(..., description="Daily variable to aggregate")
+    function: AggregateFunction = Field(..., description="'min', 'max', 'mean', 'sum' or 'count' over the matching days")
+
+    @property
+    def column(self) -> str:
+        return f"{self.function.value}_{self.variable.value}"
+
+class CityQueryInput(BaseModel):
+    '''Input model for filtering, ranking and aggregating daily forecasts across many cities.'''
+    model_config = ConfigDict(
+        str_strip_whitespace=True,
+        validate_assignment=True,
+        extra='forbid',
+        defer_build=True
+    )
+
+    cities: List[str] = Field(
+        ...,
+        description="List of city names (e.g., ['北京', '上海', 'London'])",
+        min_length=1,
+        max_length=500
+    )
+    start_days_later: int = Field(
+        default=0,
+        description="First day of the range as days from today (0=today). Ignored when preset or target_weekday is given",
+        ge=0,
+        le=FORECAST_WINDOW_DAYS - 1
+    )
+    num_days: int = Field(
+        default=1,
+        description="Number of days in the range (1-16). Ignored when preset or target_weekday is given",
+        ge=1,
+        le=16
+    )
+    preset: Optional[RangePreset] = Field(
+        default=None,
+        description="Named range: 'weekend' (the coming Saturday and Sunday) or 'next_7_days'"
+    )
+    target_weekday: Optional[str] = Field(
+        default=None,
+        description="Query a single weekday in English (e.g., 'Saturday') instead of a range",
+        min_length=1,
+        max_length=20
+    )
+    where: List[QueryFilter] = Field(
+        default_factory=list,
+        description="Filters that must all hold; without 'aggregate' they select days, with it they select cities",
+        max_length=20
+    )
+    aggregates: List[QueryAggregate] = Field(
+        default_factory=list,
+        description="Per-city aggregates over the matching days; when given the result has one row per city",
+        max_length=20
+    )
+    sort_by: Optional[str] = Field(
+        default=None,
+        description="Column to sort by: a daily variable, or '<function>_<variable>' when aggregating (e.g., 'max_uv_index_max')"
+    )
+    descending: bool = Field(default=True, description="Sort from largest to smallest")
+    limit: int = Field(default=50, description="Maximum number of rows to return", ge=1, le=1000)
+    variables: List[DailyVariable] = Field(
+        default_factory=list,
+        description="Extra daily variables to include in per-day rows (filtered and sorted variables are always included)"
+    )
+    response_format: ResponseFormat = Field(
+        default=ResponseFormat.MARKDOWN,
+        description="Output format: 'markdown' for human-readable, 'json' for machine-readable or 'compact' for minified JSON"
+    )
+
+    @field_validator('cities')
+    @classmethod
+    def validate_cities(cls, v: List[str]) -> List[str]:
+        return BatchQueryInput.validate_cities(v)
+
+    @field_validator('target_weekday')
+    @classmethod
+    def validate_weekday(cls, v: Optional[str]) -> Optional[str]:
+        if v is None:
+            return v
+        return WeekdayQueryInput.validate_weekday(v)
+
+    @property
+    def aggregated(self) -> bool:
+        return bool(self.aggregates) or any(f.aggregate is not None for f in self.where)
+
+    def output_columns(self) -> List[str]:
+        '''Value columns of the result, in display order.'''
+        if self.aggregated:
+            columns = [a.column for a in self.aggregates]
+            columns += [f.column for f in self.where if f.aggregate is not None]
+        else:
+            columns = [f.variable.value for f in self.where] + [v.value for v in self.variables]
+            if self.sort_by is not None:
+                columns.append(self.sort_by)
+        return list(dict.fromkeys(columns))
+
+    @model_validator(mode='after')
+    def validate_sort(self) -> 'CityQueryInput':
+        if self.sort_by is None:
+            return self
+        if self.aggregated:
+            if self.sort_by not in self.output_columns():
+                raise ValueError("sort_by must name one of the aggregate columns, e.g. 'max_uv_index_max'")
+        elif self.sort_by not in DailyVariable._value2member_map_:
+            raise ValueError(f"sort_by must be a daily variable: {', '.join(DailyVariable._value2member_map_)}")
+        return self
+
+    @model_validator(mode='after')
+    def validate_window(self) -> 'CityQueryInput':
+        if (self.preset is None and self.target_weekday is None
+                and self.start_days_later + self.num_days > FORECAST_WINDOW_DAYS):
+            raise ValueError(
+                f"start_days_later + num_days must not exceed {FORECAST_WINDOW_DAYS}: the forecast covers "
+                f"today through day {FORECAST_WINDOW_DAYS - 1} (got {self.start_days_later} + {self.num_days})"
+            )
+        return self
+
+def _parse_iso_date(v: str) -> date:
+    try:
+        return date.fromisoformat(v)
+    except ValueError:
+        raise ValueError(f"Invalid date '{v}'. Use the YYYY-MM-DD format") from None
+
+class HistoryQueryInput(BaseModel):
+    '''Input model for historical daily weather queries.'''
+    model_config = ConfigDict(
+        str_strip_whitespace=True,
+        validate_assignment=True,
+        extra='forbid',
+        defer_build=True
+    )
+
+    city: str = Field(
+        ...,
+        description="City name (e.g., '北京', '上海', 'New York', 'London')",
+        min_length=1,
+        max_length=100
+    )
+    start_date: str = Field(..., description="First day, YYYY-MM-DD (1940-01-01 or later)")
+    end_date: str = Field(..., description="Last day, YYYY-MM-DD; at most 366 days after start_date")
+    variables: Optional[List[ArchiveVariable]] = Field(
+        default=None,
+        description="Daily variables to return (default: all)",
+        min_length=1
+    )
+    response_format: ResponseFormat = Field(
+        default=ResponseFormat.MARKDOWN,
+        description="Output format: 'markdown' for human-readable, 'json' for machine-readable or 'compact' for minified JSON"
+    )
+
+    @field_validator('city')
+    @classmethod
+    def validate_city(cls, v: str) -> str:
+        if not v.strip():
+            raise ValueError("City name cannot be empty")
+        return v.strip()
+
+    @field_validator('start_date', 'end_date')
+    @classmethod
+    def validate_date(cls, v: str) -> str:
+        if _parse_iso_date(v) < ARCHIVE_FIRST_DATE:
+            raise ValueError(f"The archive starts on {ARCHIVE_FIRST_DATE.isoformat()}")
+        return v
+
+    @model_validator(mode='after')
+    def validate_span(self) -> 'HistoryQueryInput':
+        days = (date.fromisoformat(self.end_date) - date.fromisoformat(self.start_date)).days
+        if not 0 <= days <= 365:
+            raise ValueError("end_date must be on or after start_date and at most 366 days later")
+        return self
+
+class ClimateQueryInput(BaseModel):
+    '''Input model for comparing a day with its climatological normal.'''
+    model_config = ConfigDict(
+        str_strip_whitespace=True,
+        validate_assignment=True,
+        extra='forbid',
+        defer_build=True
+    )
+
+    city: str = Field(
+        ...,
+        description="City name (e.g., '北京', '上海', 'New York', 'London')",
+        min_length=1,
+        max_length=100
+    )
+    target_date: Optional[str] = Field(
+        default=None,
+        description="Day to compare, YYYY-MM-DD (default: today). Past days use the archive, the next 16 days the forecast"
+    )
+    baseline_start_year: int = Field(default=1991, description="First year of the baseline period", ge=1940)
+    baseline_end_year: int = Field(default=2020, description="Last year of the baseline period", ge=1940)
+    window_days: int = Field(
+        default=7,
+        description="Also use this many days either side of the calendar day in every baseline year",
+        ge=0,
+        le=30
+    )
+    response_format: ResponseFormat = Field(
+        default=ResponseFormat.MARKDOWN,
+        description="Output format: 'markdown' for human-readable, 'json' for machine-readable or 'compact' for minified JSON"
+    )
+
+    @field_validator('city')
+    @classmethod
+    def validate_city(cls, v: str) -> str:
+        if not v.strip():
+            raise ValueError("City name cannot be empty")
+        return v.strip()
+
+    @field_validator('target_date')
+    @classmethod
+    def validate_target_date(cls, v: Optional[str]) -> Optional[str]:
+        if v is not None and _parse_iso_date(v) < ARCHIVE_FIRST_DATE:
+            raise ValueError(f"The archive starts on {ARCHIVE_FIRST_DATE.isoformat()}")
+        return v
+
+    @model_validator(mode='after')
+    def validate_baseline(self) -> 'ClimateQueryInput':
+        if self.baseline_start_year > self.baseline_end_year:
+            raise ValueError("baseline_start_year must not be after baseline_end_year")
+        if self.baseline_end_year >= date.today().year:
+            raise ValueError("The baseline must end before the current year")
+        return self
+
+# Forecast representation
+def _numeric_column(values: List[Any]) -> Optional[array]:
+    '''Pack an all-numeric JSON column: ``q`` if every value is an int, else ``d`` with NaN for nulls.'''
+    if all(type(v) is int for v in values):
+        return array("q", values)
+    if all(v is None or isinstance(v, (int, float)) for v in values):
+        return array("d", (float("nan") if v is None else v for v in values))
+    return None
+
+class _ClockColumn(array):
+    '''Local times of day on each row's own date (e.g. sunrise), as minutes; -1 if missing.'''
+
+def _local_today(utc_offset: Optional[int]) -> date:
+    '''Today's date at a location ``utc_offset`` seconds from UTC; the server's date when unknown.'''
+    if utc_offset is None:
+        return date.today()
+    return (datetime.now(timezone.utc) + timedelta(seconds=utc_offset)).date()
+
+class _DailyForecast:
+    '''Compact columnar form of an Open-Meteo ``daily`` block.
+
+    Numeric variables are stored as typed arrays (``q`` for all-integer
+    columns such as weather codes, ``d`` otherwise, with NaN for missing
+    values). Sunrise/sunset style timestamps on the row's own date are kept
+    as minutes in a ``_ClockColumn``; other text stays as tuples. Open-Meteo
+    returns consecutive dates, so a date maps to its row by ordinal offset
+    without any per-record index. Dates are local to the location, whose
+    UTC offset is kept so "today" can be resolved there rather than on the
+    server.
+    '''
+    __slots__ = ("start_ordinal", "length", "columns", "utc_offset", "_encoded_days")
+
+    def __init__(self, start_ordinal: int, length: int, columns: Dict[str, Any], utc_offset: Optional[int] = None):
+        self.start_ordinal = start_ordinal
+        self.length = length
+        self.columns = columns
+        self.utc_offset = utc_offset
+        self._encoded_days: Optional[List[Optional[str]]] = None
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "_DailyForecast":
+        daily = data.get("daily", {})
+        dates = daily.get("time", [])
+        start_ordinal = date.fromisoformat(dates[0]).toordinal() if dates else 0
+        if any(date.fromisoformat(d).toordinal() != start_ordinal + i for i, d in enumerate(dates)):
+            raise ValueError("Forecast dates are not consecutive")
+
+        columns: Dict[str, Any] = {}
+        for key, values in daily.items():
+            if key == "time":
+                continue
+            numeric = _numeric_column(values)
+            if numeric is not None:
+                columns[key] = numeric
+            elif all(v is None or (isinstance(v, str) and len(v) == 16 and v[:10] == d and v[10] == "T")
+                     for v, d in zip(values, dates)):
+                columns[key] = _ClockColumn("h", (-1 if v is None else int(v[11:13]) * 60 + int(v[14:16])
+                                                  for v in values))
+            else:
+                columns[key] = tuple(values)
+        return cls(start_ordinal, len(dates), columns, data.get("utc_offset_seconds"))
+
+    def index(self, target_date: str) -> Optional[int]:
+        '''Return the row for ``target_date`` (YYYY-MM-DD), or ``None`` if outside the window.'''
+        offset = date.fromisoformat(target_date).toordinal() - self.start_ordinal
+        return offset if 0 <= offset < self.length else None
+
+    def date(self, index: int) -> str:
+        return date.fromordinal(self.start_ordinal + index).isoformat()
+
+    def today(self) -> date:
+        return _local_today(self.utc_offset)
+
+    @staticmethod
+    def _cell(column: Any, index: int, day: str) -> Any:
+        if index >= len(column):
+            return None
+        v = column[index]
+        if type(column) is _ClockColumn:
+            return None if v < 0 else f"{day}T{v // 60:02d}:{v % 60:02d}"
+        return None if v != v else v  # NaN marks a missing value
+
+    def value(self, name: str, index: int) -> Any:
+        '''Return one value, or ``None`` if the variable or the value is missing.'''
+        column = self.columns.get(name)
+        if column is None:
+            return None
+        return self._cell(column, index, self.date(index) if type(column) is _ClockColumn else "")
+
+    def to_bytes(self) -> bytes:
+        '''Serialize compactly (raw array buffers) for shared cache tiers.'''
+        packed = {}
+        for name, column in self.columns.items():
+            if isinstance(column, array):
+                packed[name] = ("clock" if type(column) is _ClockColumn else column.typecode, column.tobytes())
+            else:
+                packed[name] = ("text", column)
+        return marshal.dumps((self.start_ordinal, self.length, packed, self.utc_offset))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "_DailyForecast":
+        # entries written before the UTC offset was kept have three fields
+        start_ordinal, length, packed, *utc_offset = marshal.loads(data)
+        columns: Dict[str, Any] = {}
+        for name, (kind, payload) in packed.items():
+            if kind == "text":
+                columns[name] = tuple(payload)
+            else:
+                column = _ClockColumn("h") if kind == "clock" else array(kind)
+                column.frombytes(payload)
+                columns[name] = column
+        return cls(start_ordinal, length, columns, utc_offset[0] if utc_offset else None)
+
+    @property
+    def variables(self) -> frozenset:
+        return frozenset(self.columns)
+
+    def covers(self, variables: Tuple[str, ...]) -> bool:
+        return all(name in self.columns for name in variables)
+
+    def merged(self, other: "_DailyForecast") -> "_DailyForecast":
+        '''This window plus the columns only ``other`` holds, when both cover the same dates.'''
+        if (other.start_ordinal, other.length) != (self.start_ordinal, self.length) or other.variables <= self.variables:
+            return self
+        columns = {**other.columns, **self.columns}
+        ordered = {name: columns[name] for name in DAILY_VARIABLES if name in columns}
+        return _DailyForecast(self.start_ordinal, self.length, {**ordered, **columns}, self.utc_offset)
+
+    def day(self, index: int, variables: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+        '''Return one row shaped like the Open-Meteo JSON, limited to ``variables`` if given.'''
+        day = self.date(index)
+        result: Dict[str, Any] = {"time": day}
+        if index >= self.length:
+            return result
+        for name in self.columns if variables is None else variables:
+            column = self.columns.get(name)
+            if column is None:
+                result[name] = None
+                continue
+            v = column[index]
+            if type(column) is _ClockColumn:
+                result[name] = None if v < 0 else f"{day}T{v // 60:02d}:{v % 60:02d}"
+            else:
+                result[name] = None if v != v else v
+        return result
+
+    def encoded_day(self, index: int) -> str:
+        '''Return ``day(index)`` as compact JSON, serialized once per row.'''
+        if self._encoded_days is None:
+            self._encoded_days = [None] * self.length
+        encoded = self._encoded_days[index]
+        if encoded is None:
+            encoded = self._encoded_days[index] = _dumps_compact(self.day(index))
+        return encoded
+
+    def select(self, indices: List[Optional[int]]) -> Dict[str, List[Any]]:
+        '''Return every variable as a list over ``indices``; ``None`` rows give ``None``.'''
+        result: Dict[str, List[Any]] = {}
+        for name, column in self.columns.items():
+            clock = type(column) is _ClockColumn
+            result[name] = [None if i is None else self._cell(column, i, self.date(i) if clock else "")
+                            for i in indices]
+        return result
+
+class _HourlyForecast:
+    '''Columnar form of an Open-Meteo ``hourly`` block.
+
+    Timestamps are kept as local minutes since 0001-01-01 in a ``q`` array
+    (8 bytes per hour, no per-row strings) and looked up by bisection, which
+    also copes with DST gaps. Only the requested variables are present.
+    '''
+    __slots__ = ("minutes", "columns", "utc_offset")
+
+    def __init__(self, minutes: array, columns: Dict[str, Any], utc_offset: Optional[int] = None):
+        self.minutes = minutes
+        self.columns = columns
+        self.utc_offset = utc_offset
+
+    @staticmethod
+    def to_minutes(timestamp: str) -> int:
+        '''``YYYY-MM-DDTHH:MM`` -> minutes since 0001-01-01.'''
+        return date.fromisoformat(timestamp[:10]).toordinal() * 1440 + int(timestamp[11:13]) * 60 + int(timestamp[14:16])
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "_HourlyForecast":
+        hourly = data.get("hourly", {})
+        minutes = array("q", map(cls.to_minutes, hourly.get("time", [])))
+        columns = {}
+        for key, values in hourly.items():
+            if key != "time":
+                numeric = _numeric_column(values)
+                columns[key] = numeric if numeric is not None else tuple(values)
+        return cls(minutes, columns, data.get("utc_offset_seconds"))
+
+    @property
+    def variables(self) -> frozenset:
+        return frozenset(self.columns)
+
+    def merged(self, other: "_HourlyForecast") -> "_HourlyForecast":
+        '''This window plus the columns only ``other`` holds, when both cover the same hours.'''
+        if other.variables <= self.variables or other.minutes != self.minutes:
+            return self
+        return _HourlyForecast(self.minutes, {**other.columns, **self.columns}, self.utc_offset)
+
+    def today(self) -> date:
+        return _local_today(self.utc_offset)
+
+    def span(self, start_day: date, num_days: int) -> Tuple[int, int]:
+        '''Row range ``[start, stop)`` covering ``num_days`` days from ``start_day``.'''
+        first = start_day.toordinal() * 1440
+        return (bisect.bisect_left(self.minutes, first),
+                bisect.bisect_left(self.minutes, first + num_days * 1440))
+
+    def time(self, index: int) -> str:
+        day, minute = divmod(self.minutes[index], 1440)
+        return f"{date.fromordinal(day).isoformat()}T{minute // 60:02d}:{minute % 60:02d}"
+
+    def select(self, variables: List[str], start: int, stop: int) -> Dict[str, List[Any]]:
+        '''Return ``variables`` for rows ``[start, stop)`` as lists, NaN replaced by ``None``.'''
+        result = {}
+        for name in variables:
+            column = self.columns.get(name, ())
+            result[name] = [None if v != v else v for v in column[start:stop]]
+        return result
+
+# Compact JSON: orjson when installed, else a preconfigured stdlib encoder
+def _dumps_compact(obj: Any) -> str:
+    '''Minified JSON. The encoder is chosen on first use, keeping orjson out of the startup path.'''
+    global _dumps_compact
+    if importlib.util.find_spec("orjson") is not None:
+        import orjson
+
+        def _dumps_compact(obj: Any) -> str:
+            return orjson.dumps(obj).decode()
+    else:
+        _dumps_compact = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    return _dumps_compact(obj)
+
+# Historical archive storage
+class _ArchiveSeries:
+    '''Daily archive series of one location, memory-mapped from a columnar file.
+
+    Layout: the magic bytes, a little-endian header (first day ordinal, day
+    count, end of the last requested range, time of that request, size of
+    the name list), the JSON list of variable names, zero padding to a
+    64-byte boundary, then one contiguous float64 column per variable with
+    NaN for missing values. ``data`` is a read-only (variables x days)
+    memmap, so slices are views onto the page cache rather than copies.
+    '''
+    __slots__ = ("start_ordinal", "length", "checked_ordinal", "checked_at", "variables", "data")
+    MAGIC = b"WXARCH1\n"
+    _HEADER = struct.Struct("<qqqdI")
+
+    def __init__(self, start_ordinal: int, length: int, checked_ordinal: int, checked_at: float,
+                 variables: Tuple[str, ...], data: Any):
+        self.start_ordinal = start_ordinal
+        self.length = length
+        self.checked_ordinal = checked_ordinal
+        self.checked_at = checked_at
+        self.variables = variables
+        self.data = data
+
+    @classmethod
+    def _data_offset(cls, names_size: int) -> int:
+        return (len(cls.MAGIC) + cls._HEADER.size + names_size + 63) // 64 * 64
+
+    @classmethod
+    def load(cls, np: Any, path: Path) -> Optional["_ArchiveSeries"]:
+        try:
+            with open(path, "rb") as f:
+                head = f.read(len(cls.MAGIC) + cls._HEADER.size)
+                if head[:len(cls.MAGIC)] != cls.MAGIC:
+                    return None
+                start, length, checked, checked_at, names_size = cls._HEADER.unpack_from(head, len(cls.MAGIC))
+                variables = tuple(json.loads(f.read(names_size)))
+            if length == 0:
+                data = np.empty((len(variables), 0))
+            else:
+                data = np.memmap(path, dtype="<f8", mode="r", offset=cls._data_offset(names_size),
+                                 shape=(len(variables), length))
+        except (OSError, ValueError, struct.error):
+            return None
+        return cls(start, length, checked, checked_at, variables, data)
+
+    @classmethod
+    def save(cls, np: Any, path: Path, start_ordinal: int, checked_ordinal: int,
+             variables: Tuple[str, ...], data: Any) -> None:
+        '''Write ``path`` atomically; it must be a new name, never a file that may be mapped.'''
+        names = json.dumps(list(variables)).encode()
+        header = cls.MAGIC + cls._HEADER.pack(start_ordinal, data.shape[1], checked_ordinal, time.time(),
+                                              len(names)) + names
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(header.ljust(cls._data_offset(len(names)), b"\0"))
+            np.ascontiguousarray(data, dtype="<f8").tofile(f)
+        os.replace(tmp, path)
+
+    @property
+    def end_ordinal(self) -> int:
+        return self.start_ordinal + self.length
+
+    def covers(self, start_ordinal: int, end_ordinal: int) -> bool:
+        '''Whether days [start, end) are stored, or were asked for recently and are not published yet.'''
+        if start_ordinal < self.start_ordinal:
+            return False
+        if end_ordinal <= self.end_ordinal:
+            return True
+        return end_ordinal <= self.checked_ordinal and time.time() - self.checked_at < ARCHIVE_RECHECK_INTERVAL
+
+    def window(self, start_ordinal: int, end_ordinal: int) -> Tuple[int, Any]:
+        '''Return the first stored day in [start, end) and a zero-copy (variables x days) view.'''
+        lo = min(max(start_ordinal - self.start_ordinal, 0), self.length)
+        hi = min(max(end_ordinal - self.start_ordinal, lo), self.length)
+        return self.start_ordinal + lo, self.data[:, lo:hi]
+
+class _ArchiveStore:
+    '''Archive files under ``directory``, one per location, with an LRU of open memmaps.
+
+    A file is never rewritten in place while something may map it: every save
+    writes a new version (``<lat>_<lon>.<version>.f8c``) and readers open the
+    newest one. Older versions are deleted once nothing maps them; on Windows
+    a version still mapped by this or another process stays until a later
+    save, on POSIX the mappings simply keep the unlinked file alive.
+    '''
+
+    def __init__(self, directory: Path, max_open: int):
+        self.directory = directory
+        self.max_open = max_open
+        self._open: "OrderedDict[Tuple[float, float], _ArchiveSeries]" = OrderedDict()
+        self.downloads = 0
+
+    def path(self, key: Tuple[float, float], version: int) -> Path:
+        return self.directory / f"{key[0]:.4f}_{key[1]:.4f}.{version}.f8c"
+
+    def versions(self, key: Tuple[float, float]) -> List[int]:
+        '''Versions on disk for ``key``, oldest first.'''
+        prefix = f"{key[0]:.4f}_{key[1]:.4f}."
+        found = []
+        try:
+            for entry in os.scandir(self.directory):
+                version = entry.name[len(prefix):-len(".f8c")]
+                if entry.name.startswith(prefix) and entry.name.endswith(".f8c") and version.isdigit():
+                    found.append(int(version))
+        except OSError:
+            pass
+        return sorted(found)
+
+    def get(self, np: Any, key: Tuple[float, float], reload: bool = False) -> Optional[_ArchiveSeries]:
+        series = None if reload else self._open.get(key)
+        if series is not None:
+            self._open.move_to_end(key)
+            return series
+        series = None
+        for version in reversed(self.versions(key)):
+            # a version may be deleted between listing and opening; fall back to an older one
+            series = _ArchiveSeries.load(np, self.path(key, version))
+            if series is not None:
+                break
+        if series is None or series.variables != ARCHIVE_VARIABLES:
+            return None
+        self._open[key] = series
+        self._open.move_to_end(key)
+        while len(self._open) > self.max_open:
+            self._open.popitem(last=False)
+        return series
+
+    def put(self, np: Any, key: Tuple[float, float], start_ordinal: int, checked_ordinal: int,
+            data: Any) -> _ArchiveSeries:
+        old = self.versions(key)
+        # nanosecond clock keeps concurrent writers apart; never below the newest version if the clock stepped back
+        version = max(old[-1] + 1 if old else 0, time.time_ns())
+        _ArchiveSeries.save(np, self.path(key, version), start_ordinal, checked_ordinal, ARCHIVE_VARIABLES, data)
+        self.downloads += 1
+        self._open.pop(key, None)
+        for stale in old:
+            try:
+                os.remove(self.path(key, stale))
+            except OSError:
+                pass  # still mapped (Windows) or already removed by another writer
+        series = self.get(np, key, reload=True)
+        if series is None:
+            raise RuntimeError("Failed to reopen the archive file just written")
+        return series
+
+    def stats(self) -> Dict[str, int]:
+        return {"open": len(self._open), "downloads": self.downloads}
+
+# Caches
+class _CacheBackend(abc.ABC):
+    '''Shared key/value tier behind the in-memory geocode and forecast caches.
+
+    Values are compact bytes (or ``None`` for negative entries) with an
+    absolute expiry time. Backends never raise: an unreachable backend acts
+    like an empty one and callers fall back to their memory tier. Methods are
+    coroutines so a network tier never blocks the event loop.
+    '''
+
+    @abc.abstractmethod
+    async def get(self, namespace: str, key: str) -> Optional[Tuple[Optional[bytes], float]]:
+        '''Return ``(value, expires)`` for an unexpired entry, else ``None``.'''
+
+    async def get_many(self, namespace: str, keys: List[str]) -> List[Optional[Tuple[Optional[bytes], float]]]:
+        '''``get`` for several keys, in order; backends override this with one round trip.'''
+        return [await self.get(namespace, key) for key in keys]
+
+    @abc.abstractmethod
+    async def put(self, namespace: str, key: str, value: Optional[bytes], expires: float) -> None:
+        '''Store ``value`` until ``expires`` (a ``time.time()`` timestamp).'''
+
+    async def put_many(self, namespace: str, items: List[Tuple[str, Optional[bytes], float]]) -> None:
+        for key, value, expires in items:
+            await self.put(namespace, key, value, expires)
+
+class _MemoryBackend(_CacheBackend):
+    '''Process-local backend (LRU); useful for tests or when nothing should touch disk.'''
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Optional[bytes], float]]" = OrderedDict()
+
+    async def get(self, namespace: str, key: str) -> Optional[Tuple[Optional[bytes], float]]:
+        entry = self._entries.get((namespace, key))
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            del self._entries[(namespace, key)]
+            return None
+        self._entries.move_to_end((namespace, key))
+        return entry
+
+    async def put(self, namespace: str, key: str, value: Optional[bytes], expires: float) -> None:
+        self._entries[(namespace, key)] = (value, expires)
+        self._entries.move_to_end((namespace, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+class _SqliteBackend(_CacheBackend):
+    '''Small persistent key/value store shared by the on-disk cache tiers.
+
+    WAL mode lets several processes (e.g. uvicorn workers) share one file.
+    If the database cannot be opened every call becomes a no-op, so callers
+    silently degrade to their in-memory tier. Queries run in a worker thread
+    so a slow disk or another process holding the write lock (up to the 1 s
+    busy timeout) stalls only that lookup, never the event loop; one lock
+    serialises use of the shared connection.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._failed = not path
+        self._lock = threading.Lock()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._db is None and not self._failed:
+            try:
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+                db = sqlite3.connect(self.path, isolation_level=None, timeout=1.0, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS cache (namespace TEXT NOT NULL, key TEXT NOT NULL, "
+                    "value BLOB, expires REAL NOT NULL, PRIMARY KEY (namespace, key))"
+                )
+                self._db = db
+            except (sqlite3.Error, OSError) as e:
+                logger.warning("Cache database %s unavailable (%s); using memory only", self.path, e)
+                self._failed = True
+        return self._db
+
+    async def get(self, namespace: str, key: str) -> Optional[Tuple[Optional[bytes], float]]:
+        return (await self.get_many(namespace, [key]))[0]
+
+    async def get_many(self, namespace: str, keys: List[str]) -> List[Optional[Tuple[Optional[bytes], float]]]:
+        if self._failed or not keys:
+            return [None] * len(keys)
+        return await asyncio.to_thread(self._get_many, namespace, keys)
+
+    def _get_many(self, namespace: str, keys: List[str]) -> List[Optional[Tuple[Optional[bytes], float]]]:
+        rows: Dict[str, Tuple[Optional[bytes], float]] = {}
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return [None] * len(keys)
+            try:
+                # stay under SQLite's bound-parameter limit
+                for i in range(0, len(keys), 500):
+                    chunk = keys[i:i + 500]
+                    for key, value, expires in db.execute(
+                        f"SELECT key, value, expires FROM cache WHERE namespace = ? AND expires > ? "
+                        f"AND key IN ({','.join('?' * len(chunk))})",
+                        (namespace, time.time(), *chunk)
+                    ):
+                        rows[key] = (value, expires)
+            except sqlite3.Error:
+                pass
+        return [rows.get(key) for key in keys]
+
+    async def put(self, namespace: str, key: str, value: Optional[bytes], expires: float) -> None:
+        await self.put_many(namespace, [(key, value, expires)])
+
+    async def put_many(self, namespace: str, items: List[Tuple[str, Optional[bytes], float]]) -> None:
+        if self._failed or not items:
+            return
+        await asyncio.to_thread(self._put_many, namespace, items)
+
+    def _put_many(self, namespace: str, items: List[Tuple[str, Optional[bytes], float]]) -> None:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return
+            try:
+                db.executemany(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                    [(namespace, key, value, expires) for key, value, expires in items]
+                )
+            except sqlite3.Error as e:
+                logger.warning("Failed to persist %s cache entry: %s", namespace, e)
+
+class _RedisError(Exception):
+    '''Error reply from a Redis-protocol server.'''
+
+class _RedisBackend(_CacheBackend):
+    '''Cache tier on a Redis-protocol server (Redis, Valkey, KeyDB, ...) shared by all replicas.
+
+    Speaks RESP over one asyncio stream connection shared by all coroutines:
+    commands are written as soon as they are issued (pipelined) and a reader
+    task hands replies to their waiters in order, so a slow server delays
+    only the cache lookups, never the event loop. Each value carries its
+    expiry in a 9-byte header and the key gets a matching PX TTL. Batch reads
+    use MGET and batch writes go out in a single write. A connection error or
+    a reply slower than ``timeout`` disables the backend for
+    ``retry_interval`` seconds.
+    '''
+    _HEADER = struct.Struct("<?d")
+
+    def __init__(self, url: str, timeout: float = 0.25, prefix: str = "weather:", retry_interval: float = 5.0):
+        parts = urlsplit(url)
+        self.address = (parts.hostname or "127.0.0.1", parts.port or 6379)
+        self.password = parts.password
+        self.db = int(parts.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self.prefix = prefix
+        self.retry_interval = retry_interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self._retry_at = 0.0
+
+    @staticmethod
+    def _command(*args: Any) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    @classmethod
+    async def _read_reply(cls, reader: asyncio.StreamReader) -> Any:
+        line = await reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by cache server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            return _RedisError(payload.decode(errors="replace"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return (await reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            length = int(payload)
+            return None if length < 0 else [await cls._read_reply(reader) for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply from cache server: {line[:20]!r}")
+
+    async def _read_replies(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                reply = await self._read_reply(reader)
+                waiter = self._waiters.popleft()
+                if not waiter.done():  # its caller may have timed out
+                    waiter.set_result(reply)
+        except (OSError, ValueError, EOFError, asyncio.IncompleteReadError, IndexError) as e:
+            if self._reader_task is asyncio.current_task():
+                logger.warning("Cache server %s:%s connection lost (%s)", *self.address, e)
+                self._disconnect()
+
+    def _disconnect(self) -> None:
+        writer, task = self._writer, self._reader_task
+        self._writer = self._reader_task = None
+        self._retry_at = time.monotonic() + self.retry_interval
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(ConnectionError("Cache server connection closed"))
+        if writer is not None:
+            writer.close()
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+    async def _connect(self) -> bool:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # streams belong to the loop that opened them (e.g. a second asyncio.run)
+            self._loop, self._connect_lock = loop, asyncio.Lock()
+            self._writer = self._reader_task = None
+            self._waiters.clear()
+        if self._writer is not None:
+            return True
+        if time.monotonic() < self._retry_at:
+            return False
+        async with self._connect_lock:
+            if self._writer is not None:
+                return True
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(*self.address), self.timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                logger.warning("Cache server %s:%s unavailable (%s); using memory only", *self.address, e)
+                self._disconnect()
+                return False
+            sock = writer.get_extra_info("socket")
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._writer = writer
+            self._reader_task = loop.create_task(self._read_replies(reader))
+            setup = ([("AUTH", self.password)] if self.password else []) + ([("SELECT", self.db)] if self.db else [])
+            if setup:
+                replies = await self._send(setup)
+                if replies is None or any(isinstance(reply, _RedisError) for reply in replies):
+                    logger.warning("Cache server %s:%s rejected AUTH/SELECT", *self.address)
+                    self._disconnect()
+                    return False
+        return True
+
+    async def _send(self, commands: List[Tuple[Any, ...]]) -> Optional[List[Any]]:
+        waiters = [self._loop.create_future() for _ in commands]
+        self._waiters.extend(waiters)
+        try:
+            self._writer.write(b"".join(self._command(*command) for command in commands))
+            return await asyncio.wait_for(asyncio.gather(*waiters), self.timeout)
+        except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+            logger.warning("Cache server %s:%s request failed (%s)", *self.address, e or "timed out")
+            self._disconnect()
+            return None
+
+    async def _execute(self, commands: List[Tuple[Any, ...]]) -> Optional[List[Any]]:
+        '''Pipeline ``commands`` and await their replies; ``None`` if the server is unavailable.'''
+        if not await self._connect():
+            return None
+        return await self._send(commands)
+
+    def _key(self, namespace: str, key: str) -> bytes:
+        return f"{self.prefix}{namespace}:{key}".encode()
+
+    def _decode(self, raw: Any) -> Optional[Tuple[Optional[bytes], float]]:
+        if not isinstance(raw, bytes) or len(raw) < self._HEADER.size:
+            return None
+        has_value, expires = self._HEADER.unpack_from(raw)
+        if expires <= time.time():
+            return None
+        return (raw[self._HEADER.size:] if has_value else None), expires
+
+    async def get(self, namespace: str, key: str) -> Optional[Tuple[Optional[bytes], float]]:
+        replies = await self._execute([("GET", self._key(namespace, key))])
+        return self._decode(replies[0]) if replies else None
+
+    async def get_many(self, namespace: str, keys: List[str]) -> List[Optional[Tuple[Optional[bytes], float]]]:
+        if not keys:
+            return []
+        replies = await self._execute([("MGET", *(self._key(namespace, key) for key in keys))])
+        if not replies or not isinstance(replies[0], list):
+            return [None] * len(keys)
+        return [self._decode(raw) for raw in replies[0]]
+
+    async def put(self, namespace: str, key: str, value: Optional[bytes], expires: float) -> None:
+        await self.put_many(namespace, [(key, value, expires)])
+
+    async def put_many(self, namespace: str, items: List[Tuple[str, Optional[bytes], float]]) -> None:
+        now = time.time()
+        commands = [
+            ("SET", self._key(namespace, key), self._HEADER.pack(value is not None, expires) + (value or b""),
+             "PX", int((expires - now) * 1000))
+            for key, value, expires in items if expires > now + 0.001
+        ]
+        if commands:
+            await self._execute(commands)
+
+def _cache_backend(url: str) -> _CacheBackend:
+    '''Create the shared cache tier selected by WEATHER_CACHE_URL.'''
+    scheme = urlsplit(url).scheme
+    if not url:
+        return _SqliteBackend(CACHE_DB_PATH)
+    if scheme == "sqlite":
+        return _SqliteBackend(urlsplit(url).path)
+    if scheme == "memory":
+        return _MemoryBackend(CACHE_MEMORY_ENTRIES)
+    if scheme == "redis":
+        return _RedisBackend(url, CACHE_TIMEOUT, CACHE_KEY_PREFIX)
+    raise ValueError(f"Unsupported WEATHER_CACHE_URL scheme: {scheme!r}")
+
+class _GeocodeCache:
+    '''Two-tier geocoding cache: in-memory LRU with TTL backed by a shared backend.
+
+    Values are city info dicts, or ``None`` for a cached "city not found"
+    result (kept for the shorter negative TTL). The backend tier (SQLite by
+    default, Redis for replicas) survives restarts so a freshly spawned
+    process does not start cold.
+    '''
+
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float, store: _CacheBackend):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.store = store
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, expires: float, value: Optional[Dict[str, Any]]) -> None:
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        '''Return ``(found, value)``; ``value`` is ``None`` for negative entries.'''
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if entry[1] is None:
+                    self.negative_hits += 1
+                return True, entry[1]
+            del self._entries[key]
+
+        row = await self.store.get("geocode", key)
+        if row is not None:
+            value = self._load(key, row)
+            self.shared_hits += 1
+            if value is None:
+                self.negative_hits += 1
+            return True, value
+
+        self.misses += 1
+        return False, None
+
+    def _load(self, key: str, row: Tuple[Optional[bytes], float]) -> Optional[Dict[str, Any]]:
+        value = json.loads(row[0]) if row[0] is not None else None
+        self._remember(key, row[1], value)
+        return value
+
+    async def preload(self, keys: List[str]) -> None:
+        '''Pull entries missing from memory out of the backend in one round trip (batch queries).'''
+        now = time.time()
+        wanted = list(dict.fromkeys(key for key in keys
+                                    if key not in self._entries or self._entries[key][0] <= now))
+        for key, row in zip(wanted, await self.store.get_many("geocode", wanted)):
+            if row is not None:
+                self._load(key, row)
+
+    def snapshot(self, limit: int) -> List[Tuple[str, float, Optional[Dict[str, Any]]]]:
+        '''The ``limit`` most recently used live entries, oldest first.'''
+        now = time.time()
+        entries = [(key, expires, value) for key, (expires, value) in self._entries.items() if expires > now]
+        return entries[-limit:] if limit > 0 else []
+
+    def restore(self, entries: List[Tuple[str, float, Optional[Dict[str, Any]]]]) -> None:
+        '''Load snapshot entries into memory without overriding anything already cached.'''
+        now = time.time()
+        for key, expires, value in entries:
+            if expires > now and key not in self._entries:
+                self._remember(key, expires, value)
+
+    async def put(self, key: str, value: Optional[Dict[str, Any]]) -> None:
+        expires = time.time() + (self.ttl if value is not None else self.negative_ttl)
+        self._remember(key, expires, value)
+        encoded = json.dumps(value, ensure_ascii=False).encode() if value is not None else None
+        await self.store.put("geocode", key, encoded, expires)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses
+        }
+
+def _next_model_update(now: float) -> float:
+    '''Return when the next Open-Meteo model run becomes available.
+
+    Open-Meteo refreshes forecasts on a fixed cadence; data is published a
+    little after each interval boundary, hence the delay.
+    '''
+    available = now - (now % FORECAST_UPDATE_INTERVAL) + FORECAST_UPDATE_DELAY
+    if available <= now:
+        available += FORECAST_UPDATE_INTERVAL
+    return available
+
+class _ForecastCache:
+    '''LRU cache of full forecast windows keyed by location.
+
+    Entries expire at the next model update rather than after a fixed TTL,
+    so a window is not served as fresh once a newer model run is available.
+    Expired windows are kept in memory for ``stale_ttl`` more seconds so they
+    can be served while a refresh runs in the background. When a store is
+    given, windows are also written to it so other processes (HTTP workers,
+    the next stdio session) can reuse them.
+    '''
+
+    def __init__(self, max_entries: int, store: Optional[_CacheBackend] = None, stale_ttl: float = 0.0):
+        self.max_entries = max_entries
+        self.store = store
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[Tuple[float, float], Tuple[float, _DailyForecast]]" = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(latitude: float, longitude: float) -> Tuple[float, float]:
+        return (round(latitude, 4), round(longitude, 4))
+
+    @staticmethod
+    def _store_key(key: Tuple[float, float]) -> str:
+        return f"{key[0]:.4f},{key[1]:.4f}"
+
+    def _remember(self, key: Tuple[float, float], expires: float, data: _DailyForecast) -> None:
+        self._entries[key] = (expires, data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, latitude: float, longitude: float) -> Optional[_DailyForecast]:
+        key = self.key(latitude, longitude)
+        entry = self._entries.get(key)
+        if entry is not None:
+            now = time.time()
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry[0] + self.stale_ttl <= now:
+                del self._entries[key]
+
+        if self.store is not None:
+            row = await self.store.get("forecast", self._store_key(key))
+            if row is not None and row[0] is not None:
+                data = _DailyForecast.from_bytes(row[0])
+                self._remember(key, row[1], data)
+                self.shared_hits += 1
+                return data
+
+        self.misses += 1
+        return None
+
+    async def get_many(self, keys: List[Tuple[float, float]]) -> Dict[Tuple[float, float], _DailyForecast]:
+        '''Fresh windows for ``keys`` (already rounded); backend misses are fetched with one multi-get.'''
+        found: Dict[Tuple[float, float], _DailyForecast] = {}
+        remote: List[Tuple[float, float]] = []
+        now = time.time()
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                found[key] = entry[1]
+            else:
+                remote.append(key)
+        if self.store is not None:
+            rows = await self.store.get_many("forecast", [self._store_key(key) for key in remote])
+        else:
+            rows = [None] * len(remote)
+        for key, row in zip(remote, rows):
+            if row is not None and row[0] is not None:
+                found[key] = _DailyForecast.from_bytes(row[0])
+                self._remember(key, row[1], found[key])
+                self.shared_hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def get_stale(self, latitude: float, longitude: float,
+                  variables: Tuple[str, ...] = DAILY_VARIABLES) -> Optional[_DailyForecast]:
+        '''Return an expired window still within the stale TTL that holds ``variables``, for stale-while-revalidate.'''
+        entry = self._entries.get(self.key(latitude, longitude))
+        if entry is not None and entry[0] + self.stale_ttl > time.time() and entry[1].covers(variables):
+            self.stale_hits += 1
+            return entry[1]
+        return None
+
+    def peek(self, latitude: float, longitude: float) -> Optional[_DailyForecast]:
+        '''Return the in-memory window whether fresh or not, without touching LRU order or stats.'''
+        entry = self._entries.get(self.key(latitude, longitude))
+        return entry[1] if entry is not None else None
+
+    async def put(self, latitude: float, longitude: float, data: _DailyForecast) -> None:
+        await self.put_many([(self.key(latitude, longitude), data)])
+
+    def snapshot(self, limit: int) -> List[Tuple[Tuple[float, float], float, bytes]]:
+        '''The ``limit`` most recently used windows still servable (fresh or stale), oldest first.'''
+        now = time.time()
+        entries = [(key, expires, data.to_bytes()) for key, (expires, data) in list(self._entries.items())[-limit:]
+                   if expires + self.stale_ttl > now] if limit > 0 else []
+        return entries
+
+    def restore(self, entries: List[Tuple[Tuple[float, float], float, _DailyForecast]]) -> None:
+        '''Load snapshot windows into memory without overriding anything already cached.'''
+        now = time.time()
+        for key, expires, data in entries:
+            if expires + self.stale_ttl > now and key not in self._entries:
+                self._remember(key, expires, data)
+
+    async def put_many(self, items: List[Tuple[Tuple[float, float], _DailyForecast]]) -> None:
+        '''Store windows keyed by rounded location; the backend write is a single batch.
+
+        Fetches for different variable sets of one location can finish in
+        any order, so a fresh entry's extra columns are merged into the new
+        window rather than dropped by whichever fetch lands last.
+        '''
+        now = time.time()
+        expires = _next_model_update(now)
+        merged = []
+        for key, data in items:
+            current = self._entries.get(key)
+            if current is not None and current[0] > now:
+                data = data.merged(current[1])
+            self._remember(key, expires, data)
+            merged.append((key, data))
+        items = merged
+        if self.store is not None and items:
+            await self.store.put_many("forecast", [(self._store_key(key), data.to_bytes(), expires)
+                                                   for key, data in items])
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "shared_hits": self.shared_hits,
+                "stale_hits": self.stale_hits, "misses": self.misses}
+
+class _SingleFlight:
+    '''Coalesce concurrent calls with the same key onto one upstream task.
+
+    Every caller awaits the shared task through ``asyncio.shield`` so that a
+    cancelled caller does not cancel the work for the others; the task is
+    only cancelled once its last waiter has gone. Exceptions raised by the
+    task propagate to every waiter.
+    '''
+
+    def __init__(self):
+        self._calls: Dict[Hashable, List[Any]] = {}
+        self.coalesced = 0
+
+    def _forget(self, key: Hashable, call: List[Any]) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.create_task(func())
+            call = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda _, key=key, call=call: self._forget(key, call))
+        else:
+            self.coalesced += 1
+
+        task = call[0]
+        call[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            call[1] -= 1
+            if call[1] == 0 and not task.done():
+                # Nobody is waiting any more; make sure late callers start afresh.
+                self._forget(key, call)
+                task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._calls), "coalesced": self.coalesced}
+
+class _Gazetteer:
+    '''Offline city index consulted before the geocoding API.
+
+    The TSV source (name, country, latitude, longitude, aliases) is parsed
+    lazily on the first lookup into a hash index over normalized names and
+    aliases plus a sorted key list for prefix search. The parsed index is
+    also written next to the other caches as a marshal file keyed by the
+    source size and mtime, so later processes skip parsing entirely.
+    '''
+
+    def __init__(self, path: str, cache_dir: Path):
+        self.path = path
+        self.cache_dir = cache_dir
+        self._rows: Optional[List[Tuple[str, str, float, float]]] = None
+        self._index: Dict[str, int] = {}
+        self._keys: List[str] = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(name: str) -> str:
+        '''Normalize a name: fold case and accents, ignore punctuation and spacing.'''
+        folded = "".join(ch for ch in unicodedata.normalize("NFKD", name) if not unicodedata.combining(ch))
+        folded = folded.casefold().replace("-", " ").replace("'", "").replace(".", "")
+        return " ".join(folded.split())
+
+    def _parse(self) -> Tuple[List[Tuple[str, str, float, float]], Dict[str, int]]:
+        rows: List[Tuple[str, str, float, float]] = []
+        index: Dict[str, int] = {}
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                name, country, latitude, longitude, aliases = line.rstrip("\n").split("\t")
+                rows.append((name, country, float(latitude), float(longitude)))
+                for alias in (name, *aliases.split("|")):
+                    if alias:
+                        index.setdefault(self.key(alias), len(rows) - 1)
+        return rows, index
+
+    def _load(self) -> None:
+        '''Load the index once; safe to race with the warm-up thread, readers see it complete or not at all.'''
+        with self._lock:
+            if self._rows is None:
+                rows, self._index = self._read()
+                self._keys = sorted(self._index)
+                self._rows = rows
+
+    def _read(self) -> Tuple[List[Tuple[str, str, float, float]], Dict[str, int]]:
+        if not self.path:
+            return [], {}
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            logger.warning("Gazetteer %s not found; using the geocoding API only", self.path)
+            return [], {}
+
+        compiled = self.cache_dir / f"gazetteer-{stat.st_size}-{stat.st_mtime_ns}.marshal"
+        try:
+            with open(compiled, "rb") as f:
+                return marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            rows, index = self._parse()
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp = compiled.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp, "wb") as f:
+                    marshal.dump((rows, index), f)
+                os.replace(tmp, compiled)
+            except OSError:
+                pass
+            return rows, index
+
+    def warm(self) -> None:
+        if self._rows is None:
+            self._load()
+
+    def lookup(self, city: str) -> Optional[Dict[str, Any]]:
+        '''Resolve a city name offline; ``None`` when it is not in the gazetteer.'''
+        if self._rows is None:
+            self._load()
+        key = self.key(city)
+        row = self._index.get(key)
+        if row is None and key.endswith("市"):
+            row = self._index.get(key[:-1])
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        name, country, latitude, longitude = self._rows[row]
+        return {"latitude": latitude, "longitude": longitude, "name": name, "country": country}
+
+    def suggest(self, prefix: str, limit: int = 5) -> List[str]:
+        '''Return display names of cities whose name or alias starts with ``prefix``.'''
+        if self._rows is None:
+            self._load()
+        key = self.key(prefix)
+        if not key:
+            return []
+        names: List[str] = []
+        for candidate in self._keys[bisect.bisect_left(self._keys, key):]:
+            if not candidate.startswith(key) or len(names) >= limit:
+                break
+            name = self._rows[self._index[candidate]][0]
+            if name not in names:
+                names.append(name)
+        return names
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._rows or ()), "hits": self.hits, "misses": self.misses}
+
+class _HotLocations:
+    '''Request counts per forecast location, decayed so popularity can shift.'''
+
+    def __init__(self, max_tracked: int):
+        self.max_tracked = max_tracked
+        self._counts: Counter = Counter()
+
+    def record(self, key: Tuple[float, float]) -> None:
+        self._counts[key] += 1
+        if len(self._counts) > self.max_tracked * 2:
+            self._counts = Counter(dict(self._counts.most_common(self.max_tracked)))
+
+    def top(self, n: int) -> List[Tuple[float, float]]:
+        return [key for key, _ in self._counts.most_common(n)]
+
+    def decay(self) -> None:
+        '''Halve every count and drop locations nobody asked about recently.'''
+        self._counts = Counter({key: count // 2 for key, count in self._counts.items() if count > 1})
+
+class _PrefetchScheduler:
+    '''Background task refreshing the hottest forecast windows after each model update.
+
+    Wakes at a jittered moment shortly after every update boundary (see
+    _next_model_update) and re-downloads the top locations with bounded
+    concurrency, so user-facing calls keep hitting the cache.
+    '''
+
+    def __init__(self, hot: _HotLocations, top_n: int, concurrency: int, jitter: float):
+        self.hot = hot
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self.jitter = jitter
+        self._task: Optional[asyncio.Task] = None
+        self.refreshed = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            now = time.time()
+            await asyncio.sleep(_next_model_update(now) - now + random.uniform(0, self.jitter))
+            await self.refresh()
+
+    async def refresh(self) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh_one(key: Tuple[float, float]) -> None:
+            async with semaphore:
+                try:
+                    # keep the variables callers actually asked for at this location
+                    current = _forecast_cache.peek(*key)
+                    await _fetch_forecast(key, _union_variables(current, ()) if current is not None else DAILY_VARIABLES)
+                    self.refreshed += 1
+                except Exception as e:
+                    self.failed += 1
+                    logger.warning("Prefetch of forecast for %s failed: %s", key, e)
+
+        await asyncio.gather(*(refresh_one(key) for key in self.hot.top(self.top_n)))
+        self.hot.decay()
+
+    def stats(self) -> Dict[str, int]:
+        return {"refreshed": self.refreshed, "failed": self.failed}
+
+_single_flight = _SingleFlight()
+_revalidations: set = set()
+_hot_locations = _HotLocations(PREFETCH_TOP_N * 4)
+_prefetcher = _PrefetchScheduler(_hot_locations, PREFETCH_TOP_N, PREFETCH_CONCURRENCY, PREFETCH_JITTER)
+_gazetteer = _Gazetteer(GAZETTEER_PATH, CACHE_DIR)
+@_metrics.collector
+def _collect_cache_metrics():
+    caches = {
+        "gazetteer": _gazetteer.stats(),
+        "geocode": _geocode_cache.stats(),
+        "forecast": _forecast_cache.stats(),
+        "hourly": _hourly_cache.stats()
+    }
+    events = []
+    ratios = []
+    entries = []
+    for cache, stats in caches.items():
+        hits = sum(value for name, value in stats.items() if name.endswith("hits"))
+        total = hits + stats["misses"]
+        for name, value in stats.items():
+            if name != "entries":
+                events.append(({"cache": cache, "result": name}, value))
+        ratios.append(({"cache": cache}, hits / total if total else 0.0))
+        entries.append(({"cache": cache}, stats["entries"]))
+    yield "weather_cache_events_total", "counter", "Cache lookups by cache and result", events
+    yield "weather_cache_hit_ratio", "gauge", "Fraction of cache lookups served without upstream", ratios
+    yield "weather_cache_entries", "gauge", "Entries held in the in-memory cache tier", entries
+    flight = _single_flight.stats()
+    yield "weather_coalesced_calls_total", "counter", "Calls that joined an in-flight upstream request", [({}, flight["coalesced"])]
+    yield "weather_single_flight_in_flight", "gauge", "Distinct upstream requests in flight", [({}, flight["in_flight"])]
+    yield "weather_circuit_open", "gauge", "1 while a host's circuit breaker rejects requests", [
+        ({"host": host}, 1 if breaker.state == "open" else 0) for host, breaker in _circuit_breakers.items()
+    ]
+    yield "weather_circuit_rejected_total", "counter", "Requests rejected by an open circuit breaker", [
+        ({"host": host}, breaker.rejected) for host, breaker in _circuit_breakers.items()
+    ]
+    yield "weather_archive_downloads_total", "counter", "Archive downloads merged into the local files", [
+        ({}, _archive_store.downloads)
+    ]
+    prefetch = _prefetcher.stats()
+    yield "weather_prefetch_total", "counter", "Background forecast prefetches by outcome", [
+        ({"result": "refreshed"}, prefetch["refreshed"]), ({"result": "failed"}, prefetch["failed"])
+    ]
+
+_cache_store = _cache_backend(CACHE_URL)
+_geocode_cache = _GeocodeCache(GEOCODE_CACHE_SIZE, GEOCODE_CACHE_TTL, GEOCODE_NEGATIVE_TTL, _cache_store)
+_forecast_cache = _ForecastCache(
+    FORECAST_CACHE_SIZE,
+    _cache_store if FORECAST_CACHE_SHARED else None,
+    FORECAST_STALE_TTL
+)
+# Memory only: entries hold whichever variables were requested for that location
+_hourly_cache = _ForecastCache(HOURLY_CACHE_SIZE)
+_archive_store = _ArchiveStore(ARCHIVE_DIR, ARCHIVE_OPEN_FILES)
+
+# Cold start
+def _warm_up(loop: asyncio.AbstractEventLoop, generation: int) -> None:
+    '''Pay one-off startup costs in a background thread while the client is still handshaking.
+
+    Builds the HTTP client (importing the transport stack and loading the CA
+    bundle), loads the gazetteer index and reads the warm-cache snapshot,
+    which is then restored on the event loop. ``generation`` identifies the
+    lifespan that started the thread: once it has ended, no client is built
+    and nothing is scheduled, so a short-lived session cannot leak a client
+    it already closed. Anything that fails here is simply done lazily on
+    first use instead.
+    '''
+    try:
+        _warm_http_client(generation)
+        _gazetteer.warm()
+        if SNAPSHOT_PATH:
+            snapshot = _read_snapshot(SNAPSHOT_PATH)
+            if snapshot is not None and _service_generation == generation:
+                loop.call_soon_threadsafe(_restore_snapshot, snapshot)
+    except Exception:
+        logger.exception("Warm-up failed; continuing lazily")
+
+def _read_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    '''Read and decode a snapshot written by ``_write_snapshot``; ``None`` if missing or unreadable.'''
+    try:
+        with open(path, "rb") as f:
+            snapshot = marshal.load(f)
+        snapshot["forecast"] = [(tuple(key), expires, _DailyForecast.from_bytes(data))
+                                for key, expires, data in snapshot["forecast"]]
+        return snapshot
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Ignoring unreadable snapshot %s: %s", path, e)
+        return None
+
+def _restore_snapshot(snapshot: Optional[Dict[str, Any]]) -> None:
+    if snapshot is None:
+        return
+    _geocode_cache.restore(snapshot["geocode"])
+    _forecast_cache.restore(snapshot["forecast"])
+    for key in snapshot.get("hot", ()):
+        _hot_locations.record(tuple(key))
+
+def _write_snapshot(path: str) -> None:
+    '''Save the most recently used geocodes and forecast windows so the next process starts warm.'''
+    snapshot = {
+        "geocode": _geocode_cache.snapshot(SNAPSHOT_ENTRIES),
+        "forecast": _forecast_cache.snapshot(SNAPSHOT_ENTRIES),
+        "hot": _hot_locations.top(SNAPSHOT_ENTRIES)
+    }
+    try:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            marshal.dump(snapshot, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("Failed to write snapshot %s: %s", path, e)
+
+# Shared utility functions
+def _normalize_city(city: str) -> str:
+    '''Normalize a city name into a cache key.'''
+    return " ".join(city.split()).casefold()
+
+async def _geocode_upstream(city: str, max_queue_wait: float = UPSTREAM_MAX_QUEUE_WAIT) -> Optional[Dict[str, Any]]:
+    '''Query the geocoding API and cache the answer; ``None`` means unknown city.'''
+    response = await _http_get(
+        f"{GEOCODING_API}/search",
+        params={"name": city, "count": 1, "language": "zh", "format": "json"},
+        timeout=10.0,
+        max_queue_wait=max_queue_wait
+    )
+    response.raise_for_status()
+    data = response.json()
+
+    city_info = None
+    if data.get("results"):
+        result = data["results"][0]
+        city_info = {"latitude": result["latitude"], "longitude": result["longitude"],
+                    "name": result.get("name", city), "country": result.get("country", "")}
+    await _geocode_cache.put(_normalize_city(city), city_info)
+    return city_info
+
+@_STAGE_SECONDS.timed(stage="geocode")
+async def _get_city_coordinates(city: str, max_queue_wait: float = UPSTREAM_MAX_QUEUE_WAIT) -> Dict[str, float]:
+    '''Get latitude and longitude for a city.
+
+    Resolution order: offline gazetteer, geocode cache, then the geocoding API.
+    '''
+    city_info = _gazetteer.lookup(city)
+    if city_info is not None:
+        return city_info
+
+    key = _normalize_city(city)
+    found, city_info = await _geocode_cache.get(key)
+    if not found:
+        try:
+            city_info = await _single_flight.do(("geocode", key), lambda: _geocode_upstream(city, max_queue_wait))
         except httpx.HTTPStatusError as e:
             raise ValueError(f"Geocoding API error: {e.response.status_code}")
         except Exception as e:
             raise ValueError(f"Failed to get city coordinates: {str(e)}")
 
+    if city_info is None:
+        suggestions = _gazetteer.suggest(city)
+        hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+        raise ValueError(f"Failed to get city coordinates: City '{city}' not found. Please check the city name.{hint}")
+    return dict(city_info)
+
+async def _get_many_city_coordinates(cities: List[str]) -> List[Any]:
+    '''Geocode many cities for the multi-city tools; failures stay per-city (returned as exceptions).
+
+    Cache misses go to the geocoding API through GEOCODE_BATCH_CONCURRENCY
+    workers that wait for rate-limit tokens rather than failing fast, so a
+    cold batch is paced by the upstream quota instead of losing every city
+    past the burst.
+    '''
+    await _geocode_cache.preload([_normalize_city(city) for city in cities])
+    workers = asyncio.Semaphore(GEOCODE_BATCH_CONCURRENCY)
+
+    async def resolve(city: str) -> Dict[str, float]:
+        async with workers:
+            return await _get_city_coordinates(city, max_queue_wait=float("inf"))
+
+    return await asyncio.gather(*(resolve(city) for city in cities), return_exceptions=True)
+
 def _handle_api_error(e: Exception) -> str:
     '''Consistent error formatting across all tools.'''
     if isinstance(e, httpx.HTTPStatusError):
@@ -129,17 +2358,21 @@ def _handle_api_error(e: Exception) -> str:
         return "Error: Request timed out. Please try again."
     return f"Error: {str(e)}"
 
-def _format_weather_markdown(data: Dict[str, Any], city_info: Dict[str, str], target_date: str) -> str:
-    '''Format weather data as human-readable markdown.'''
-    daily = data.get("daily", {})
-
-    # Find the index for the target date
-    dates = daily.get("time", [])
-    try:
-        date_index = dates.index(target_date)
-    except ValueError:
+@_STAGE_SECONDS.timed(stage="format")
+def _format_weather_markdown(forecast: "_DailyForecast", city_info: Dict[str, str], target_date: str,
+                             variables: Tuple[str, ...] = DAILY_VARIABLES) -> str:
+    '''Format one day of weather data as human-readable markdown, limited to ``variables``.'''
+    date_index = forecast.index(target_date)
+    if date_index is None:
         return f"Error: Weather data not available for {target_date}"
 
+    wanted = None if variables is DAILY_VARIABLES else frozenset(variables)
+
+    def value(name: str) -> Any:
+        if wanted is not None and name not in wanted:
+            return None
+        return forecast.value(name, date_index)
+
     lines = [
         f"# 天气预报 - {city_info['name']}",
         "",
@@ -151,55 +2384,144 @@ def _format_weather_markdown(data: Dict[str, Any], city_info: Dict[str, str], ta
     ]
 
     # Weather codes description
-    weather_code = daily.get("weathercode", [])[date_index]
-    weather_desc = _get_weather_description(weather_code)
-    lines.append(f"- **天气状况**: {weather_desc}")
+    if wanted is None or "weathercode" in wanted:
+        weather_code = value("weathercode")
+        weather_desc = _get_weather_description(weather_code)
+        lines.append(f"- **天气状况**: {weather_desc}")
 
     # Temperature
-    if daily.get("temperature_2m_max"):
-        temp_max = daily["temperature_2m_max"][date_index]
-        temp_min = daily["temperature_2m_min"][date_index]
+    temp_max, temp_min = value("temperature_2m_max"), value("temperature_2m_min")
+    if temp_max is not None and temp_min is not None:
         lines.append(f"- **温度**: {temp_min:.1f}°C ~ {temp_max:.1f}°C")
 
     # Apparent temperature
-    if daily.get("apparent_temperature_max"):
-        app_temp_max = daily["apparent_temperature_max"][date_index]
-        app_temp_min = daily["apparent_temperature_min"][date_index]
+    app_temp_max, app_temp_min = value("apparent_temperature_max"), value("apparent_temperature_min")
+    if app_temp_max is not None and app_temp_min is not None:
         lines.append(f"- **体感温度**: {app_temp_min:.1f}°C ~ {app_temp_max:.1f}°C")
 
     # Precipitation
-    if daily.get("precipitation_sum"):
-        precip = daily["precipitation_sum"][date_index]
+    precip = value("precipitation_sum")
+    if precip is not None:
         lines.append(f"- **降水量**: {precip:.1f} mm")
 
     # Precipitation probability
-    if daily.get("precipitation_probability_max"):
-        precip_prob = daily["precipitation_probability_max"][date_index]
+    precip_prob = value("precipitation_probability_max")
+    if precip_prob is not None:
         lines.append(f"- **降水概率**: {precip_prob:.0f}%")
 
     # Wind
-    if daily.get("windspeed_10m_max"):
-        wind = daily["windspeed_10m_max"][date_index]
+    wind = value("windspeed_10m_max")
+    if wind is not None:
         lines.append(f"- **风速**: {wind:.1f} km/h")
 
     # Humidity
-    if daily.get("relative_humidity_2m_max"):
-        humidity_max = daily["relative_humidity_2m_max"][date_index]
-        humidity_min = daily["relative_humidity_2m_min"][date_index]
+    humidity_max, humidity_min = value("relative_humidity_2m_max"), value("relative_humidity_2m_min")
+    if humidity_max is not None and humidity_min is not None:
         lines.append(f"- **湿度**: {humidity_min:.0f}% ~ {humidity_max:.0f}%")
 
     # UV Index
-    if daily.get("uv_index_max"):
-        uv = daily["uv_index_max"][date_index]
+    uv = value("uv_index_max")
+    if uv is not None:
         uv_desc = _get_uv_description(uv)
         lines.append(f"- **紫外线指数**: {uv:.1f} ({uv_desc})")
 
-    # Sunrise/Sunset
-    if daily.get("sunrise") and daily.get("sunset"):
-        sunrise = daily["sunrise"][date_index].split('T')[1]
-        sunset = daily["sunset"][date_index].split('T')[1]
-        lines.append(f"- **日出**: {sunrise}")
-        lines.append(f"- **日落**: {sunset}")
+    # Sunrise/Sunset
+    sunrise, sunset = value("sunrise"), value("sunset")
+    if sunrise and sunset:
+        lines.append(f"- **日出**: {sunrise.split('T')[1]}")
+        lines.append(f"- **日落**: {sunset.split('T')[1]}")
+
+    lines.append("")
+    lines.append("---")
+    lines.append("*数据来源: Open-Meteo API*")
+
+    return "\n".join(lines)
+
+@_STAGE_SECONDS.timed(stage="format")
+def _format_weather_json(forecast: "_DailyForecast", city_info: Dict[str, str], target_date: str,
+                         variables: Optional[Tuple[str, ...]] = None) -> str:
+    '''Format one day of weather data as JSON.'''
+    return json.dumps(_weather_json_result(forecast, city_info, target_date, variables), indent=2)
+
+def _weather_json_result(forecast: "_DailyForecast", city_info: Dict[str, str], target_date: str,
+                         variables: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+    '''Build the JSON-serializable result for one day, limited to ``variables`` if given.'''
+    date_index = forecast.index(target_date)
+    if date_index is None:
+        return {"error": f"Weather data not available for {target_date}"}
+
+    return {
+        "city": city_info["name"],
+        "country": city_info["country"],
+        "date": target_date,
+        "latitude": city_info["latitude"],
+        "longitude": city_info["longitude"],
+        "weather": forecast.day(date_index, variables)
+    }
+
+@functools.lru_cache(maxsize=GEOCODE_CACHE_SIZE)
+def _compact_location_prefix(name: str, country: str, latitude: float, longitude: float) -> str:
+    '''Leading fields of a compact result, serialized once per location (without the closing brace).'''
+    return _dumps_compact({"city": name, "country": country, "latitude": latitude, "longitude": longitude})[:-1]
+
+def _location_prefix(city_info: Dict[str, Any]) -> str:
+    return _compact_location_prefix(city_info["name"], city_info["country"],
+                                    city_info["latitude"], city_info["longitude"])
+
+@_STAGE_SECONDS.timed(stage="format")
+def _format_weather_compact(forecast: "_DailyForecast", city_info: Dict[str, Any], target_date: str,
+                            variables: Optional[Tuple[str, ...]] = None) -> str:
+    '''Format one day as minified JSON from the location template and the row's cached encoding.'''
+    date_index = forecast.index(target_date)
+    if date_index is None:
+        return _dumps_compact({"error": f"Weather data not available for {target_date}"})
+    if variables is None or len(variables) == len(forecast.columns):
+        weather = forecast.encoded_day(date_index)
+    else:
+        weather = _dumps_compact(forecast.day(date_index, variables))
+    return f'{_location_prefix(city_info)},"date":"{target_date}","weather":{weather}}}'
+
+@_STAGE_SECONDS.timed(stage="format")
+def _format_range_markdown(forecast: _DailyForecast, city_info: Dict[str, str], dates: List[str]) -> str:
+    '''Format several days as one markdown table in a single pass over the columns.'''
+    columns = forecast.columns
+    codes = columns.get("weathercode", ())
+    temp_max, temp_min = columns.get("temperature_2m_max", ()), columns.get("temperature_2m_min", ())
+    precip = columns.get("precipitation_sum", ())
+    precip_prob = columns.get("precipitation_probability_max", ())
+    wind = columns.get("windspeed_10m_max", ())
+    uv = columns.get("uv_index_max", ())
+
+    def cell(column: Any, index: int, fmt: str, unit: str = "") -> str:
+        if index >= len(column):
+            return "-"
+        v = column[index]
+        return "-" if v != v else format(v, fmt) + unit
+
+    lines = [
+        f"# 天气预报 - {city_info['name']}",
+        "",
+        f"**日期**: {dates[0]} ~ {dates[-1]}",
+        f"**位置**: {city_info['name']}, {city_info['country']}",
+        "",
+        "| 日期 | 天气状况 | 温度 (°C) | 降水量 (mm) | 降水概率 | 风速 (km/h) | 紫外线指数 |",
+        "| --- | --- | --- | --- | --- | --- | --- |"
+    ]
+    for target_date in dates:
+        i = forecast.index(target_date)
+        if i is None:
+            lines.append(f"| {target_date} | 数据不可用 | - | - | - | - | - |")
+            continue
+        weather_desc = _get_weather_description(codes[i]) if i < len(codes) else "-"
+        uv_text = "-"
+        if i < len(uv) and uv[i] == uv[i]:
+            uv_text = f"{uv[i]:.1f} ({_get_uv_description(uv[i])})"
+        lines.append(
+            f"| {target_date} | {weather_desc} "
+            f"| {cell(temp_min, i, '.1f')} ~ {cell(temp_max, i, '.1f')} "
+            f"| {cell(precip, i, '.1f')} | {cell(precip_prob, i, '.0f', '%')} "
+            f"| {cell(wind, i, '.1f')} | {uv_text} |"
+        )
 
     lines.append("")
     lines.append("---")
@@ -207,96 +2529,719 @@ def _format_weather_markdown(data: Dict[str, Any], city_info: Dict[str, str], ta
 
     return "\n".join(lines)
 
-def _format_weather_json(data: Dict[str, Any], city_info: Dict[str, str], target_date: str) -> str:
-    '''Format weather data as JSON.'''
-    import json
-
-    daily = data.get("daily", {})
-    dates = daily.get("time", [])
-
-    try:
-        date_index = dates.index(target_date)
-    except ValueError:
-        return json.dumps({"error": f"Weather data not available for {target_date}"}, indent=2)
-
-    result = {
+def _range_days(forecast: _DailyForecast, dates: List[str], layout: RangeLayout) -> Dict[str, Any]:
+    '''The per-day part of a range result, as rows or as one array per variable.'''
+    indices = [forecast.index(target_date) for target_date in dates]
+    if layout == RangeLayout.COLUMNS:
+        return {
+            "dates": dates,
+            "unavailable": [d for d, i in zip(dates, indices) if i is None],
+            "columns": forecast.select(indices)
+        }
+    days = []
+    for target_date, i in zip(dates, indices):
+        if i is None:
+            days.append({"date": target_date, "error": f"Weather data not available for {target_date}"})
+        else:
+            days.append({"date": target_date, "weather": forecast.day(i)})
+    return {"days": days}
+
+@_STAGE_SECONDS.timed(stage="format")
+def _format_range_json(forecast: _DailyForecast, city_info: Dict[str, str], dates: List[str],
+                       layout: RangeLayout = RangeLayout.ROWS) -> str:
+    '''Format several days as JSON.'''
+    return json.dumps({
         "city": city_info["name"],
         "country": city_info["country"],
-        "date": target_date,
         "latitude": city_info["latitude"],
         "longitude": city_info["longitude"],
-        "weather": {}
+        "start_date": dates[0],
+        "end_date": dates[-1],
+        **_range_days(forecast, dates, layout)
+    }, indent=2)
+
+@_STAGE_SECONDS.timed(stage="format")
+def _format_range_compact(forecast: _DailyForecast, city_info: Dict[str, Any], dates: List[str],
+                          layout: RangeLayout = RangeLayout.ROWS) -> str:
+    '''Format several days as minified JSON; rows reuse each day's cached encoding.'''
+    head = f'{_location_prefix(city_info)},"start_date":"{dates[0]}","end_date":"{dates[-1]}"'
+    if layout == RangeLayout.COLUMNS:
+        return f"{head},{_dumps_compact(_range_days(forecast, dates, layout))[1:]}"
+    days = []
+    for target_date in dates:
+        i = forecast.index(target_date)
+        if i is None:
+            days.append(f'{{"date":"{target_date}","error":"Weather data not available for {target_date}"}}')
+        else:
+            days.append(f'{{"date":"{target_date}","weather":{forecast.encoded_day(i)}}}')
+    return f'{head},"days":[{",".join(days)}]}}'
+
+# Hourly variable -> (markdown column header, number format)
+_HOURLY_COLUMNS = {
+    "temperature_2m": ("温度 (°C)", ".1f"),
+    "apparent_temperature": ("体感温度 (°C)", ".1f"),
+    "relative_humidity_2m": ("湿度 (%)", ".0f"),
+    "precipitation": ("降水量 (mm)", ".1f"),
+    "precipitation_probability": ("降水概率 (%)", ".0f"),
+    "weathercode": ("天气状况", ""),
+    "windspeed_10m": ("风速 (km/h)", ".1f"),
+    "winddirection_10m": ("风向 (°)", ".0f"),
+    "windgusts_10m": ("阵风 (km/h)", ".1f"),
+    "cloudcover": ("云量 (%)", ".0f"),
+    "uv_index": ("紫外线指数", ".1f")
+}
+
+def _hourly_markdown_chunks(forecast: _HourlyForecast, city_info: Dict[str, Any], variables: List[str],
+                            start: int, stop: int, chunk_hours: int) -> List[str]:
+    '''Render rows ``[start, stop)`` as one markdown table split into chunks of ``chunk_hours`` rows.
+
+    The first chunk carries the title and table header and the last one the
+    footer, so concatenating the chunks gives the complete document.
+    '''
+    columns = [(forecast.columns.get(name, ()), *_HOURLY_COLUMNS[name], name == "weathercode") for name in variables]
+    chunks = []
+    for offset in range(start, stop, chunk_hours):
+        lines = []
+        if offset == start:
+            lines += [
+                f"# 逐小时天气预报 - {city_info['name']}",
+                "",
+                f"**时间**: {forecast.time(start).replace('T', ' ')} ~ {forecast.time(stop - 1).replace('T', ' ')}",
+                f"**位置**: {city_info['name']}, {city_info['country']}",
+                "",
+                "| 时间 | " + " | ".join(header for _, header, _, _ in columns) + " |",
+                "| --- |" + " --- |" * len(columns)
+            ]
+        for i in range(offset, min(offset + chunk_hours, stop)):
+            cells = []
+            for column, _, fmt, is_code in columns:
+                v = column[i] if i < len(column) else None
+                if v is None or v != v:
+                    cells.append("-")
+                else:
+                    cells.append(_get_weather_description(v) if is_code else format(v, fmt))
+            lines.append(f"| {forecast.time(i)[5:].replace('T', ' ')} | " + " | ".join(cells) + " |")
+        chunks.append("\n".join(lines) + "\n")
+    chunks[-1] += "\n---\n*数据来源: Open-Meteo API*"
+    return chunks
+
+def _hourly_json_block(forecast: _HourlyForecast, variables: List[str], start: int, stop: int) -> Dict[str, Any]:
+    return {
+        "times": [forecast.time(i) for i in range(start, stop)],
+        "hourly": forecast.select(variables, start, stop)
+    }
+
+def _wants_progress(ctx: Context) -> bool:
+    '''Whether the client sent a progressToken, i.e. whether progress notifications would be delivered.'''
+    try:
+        meta = ctx.request_context.meta
+    except ValueError:  # called outside a request
+        return False
+    return meta is not None and meta.progressToken is not None
+
+@_STAGE_SECONDS.timed(stage="query")
+def _evaluate_city_query(np: Any, windows: List[Optional[_DailyForecast]], dates: List[str],
+                         params: CityQueryInput) -> Tuple[List[str], List[Tuple[int, Optional[int], Dict[str, Any]]], int]:
+    '''Filter, aggregate and sort the daily forecasts of many locations in one vectorized pass.
+
+    Each referenced variable is stacked into a (locations x days) float
+    matrix straight from the windows' typed array buffers, with NaN for
+    missing locations, days and values. Filters, reductions and the sort
+    then run over whole matrices; comparisons with NaN are false, so a
+    missing value never matches. Returns the value columns, the selected
+    rows as (window index, day index or None, values) and the number of
+    rows that matched before ``limit``.
+    '''
+    start_ordinal = date.fromisoformat(dates[0]).toordinal()
+    shape = (len(windows), len(dates))
+    present = np.zeros(shape, dtype=bool)
+    spans = []
+    for row, window in enumerate(windows):
+        offset = lo = hi = 0
+        if window is not None:
+            offset = start_ordinal - window.start_ordinal
+            lo, hi = max(offset, 0), min(offset + len(dates), window.length)
+            if lo < hi:
+                present[row, lo - offset:hi - offset] = True
+        spans.append((offset, lo, hi))
+
+    matrices: Dict[str, Any] = {}
+    integral = set()
+
+    def matrix(variable: str) -> Any:
+        if variable not in matrices:
+            values = np.full(shape, np.nan)
+            typecodes = set()
+            for row, (window, (offset, lo, hi)) in enumerate(zip(windows, spans)):
+                column = window.columns.get(variable) if window is not None else None
+                if type(column) is not array or lo >= min(hi, len(column)):
+                    continue
+                typecodes.add(column.typecode)
+                stop = min(hi, len(column))
+                values[row, lo - offset:stop - offset] = np.frombuffer(column, dtype=column.typecode)[lo:stop]
+            if typecodes == {"q"}:
+                integral.add(variable)
+            matrices[variable] = values
+        return matrices[variable]
+
+    compare = {
+        FilterOperator.GT: np.greater, FilterOperator.GE: np.greater_equal,
+        FilterOperator.LT: np.less, FilterOperator.LE: np.less_equal,
+        FilterOperator.EQ: np.equal, FilterOperator.NE: np.not_equal
     }
+    mask = present.copy()
+    for f in params.where:
+        if f.aggregate is None:
+            mask &= compare[f.op](matrix(f.variable.value), f.value)
+    columns = params.output_columns()
+
+    if not params.aggregated:
+        locations, days = np.nonzero(mask)
+        values = {name: matrix(name)[locations, days] for name in columns}
+        order = np.arange(len(locations))
+        if params.sort_by is not None:
+            key = values[params.sort_by]
+            # NaN sorts last either way; negating keeps it last for descending order
+            order = np.argsort(-key if params.descending else key, kind="stable")
+        selected = order[:params.limit]
+        rows = [(int(locations[i]), int(days[i]),
+                 {name: _query_value(values[name][i], name in integral) for name in columns}) for i in selected]
+        return columns, rows, len(order)
+
+    counts = mask.sum(axis=1)
+    reduced: Dict[str, Any] = {}
+    for function, variable in [(a.function, a.variable.value) for a in params.aggregates] + \
+                              [(f.aggregate, f.variable.value) for f in params.where if f.aggregate is not None]:
+        name = f"{function.value}_{variable}"
+        if name in reduced:
+            continue
+        masked = np.where(mask, matrix(variable), np.nan)
+        valid = ~np.isnan(masked)
+        n = valid.sum(axis=1)
+        if function == AggregateFunction.COUNT:
+            reduced[name] = n.astype(float)
+        elif function == AggregateFunction.MIN:
+            reduced[name] = np.fmin.reduce(masked, axis=1)
+        elif function == AggregateFunction.MAX:
+            reduced[name] = np.fmax.reduce(masked, axis=1)
+        else:
+            total = np.where(valid, masked, 0.0).sum(axis=1)
+            if function == AggregateFunction.MEAN:
+                total = np.divide(total, n, out=np.full(len(windows), np.nan), where=n > 0)
+            reduced[name] = np.where(n > 0, total, np.nan)
+    city_mask = counts > 0
+    for f in params.where:
+        if f.aggregate is not None:
+            city_mask &= compare[f.op](reduced[f.column], f.value)
+    candidates = np.nonzero(city_mask)[0]
+    if params.sort_by is not None:
+        key = reduced[params.sort_by][candidates]
+        candidates = candidates[np.argsort(-key if params.descending else key, kind="stable")]
+    integral_columns = {name for name in columns if name.startswith("count_")}
+    integral_columns |= {name for name in columns
+                         if name.split("_", 1)[0] in ("min", "max", "sum") and name.split("_", 1)[1] in integral}
+    rows = []
+    for i in candidates[:params.limit]:
+        values = {"days": int(counts[i])}
+        values.update((name, _query_value(reduced[name][i], name in integral_columns)) for name in columns)
+        rows.append((int(i), None, values))
+    return ["days"] + columns, rows, len(candidates)
+
+def _query_value(v: Any, integral: bool) -> Any:
+    if v != v:
+        return None
+    return int(v) if integral else round(float(v), 2)
+
+def _format_city_query_markdown(dates: List[str], columns: List[str], rows: List[Dict[str, Any]],
+                                matched: int, errors: List[Dict[str, str]]) -> str:
+    '''Render a cross-city query result as a markdown table.'''
+    period = dates[0] if len(dates) == 1 else f"{dates[0]} ~ {dates[-1]}"
+    lines = [
+        "# 多城市天气查询",
+        "",
+        f"**日期**: {period}",
+        f"**匹配**: {matched} 行" + (f"（显示前 {len(rows)} 行）" if len(rows) < matched else ""),
+        ""
+    ]
+    per_day = rows and "date" in rows[0]
+    if rows:
+        headers = ["城市"] + (["日期"] if per_day else []) + columns
+        lines.append("| " + " | ".join(headers) + " |")
+        lines.append("|" + " --- |" * len(headers))
+        for row in rows:
+            cells = [row["city"]] + ([row["date"]] if per_day else [])
+            cells += ["-" if row[name] is None else str(row[name]) for name in columns]
+            lines.append("| " + " | ".join(cells) + " |")
+    if errors:
+        lines.append("")
+        lines.append("## 查询失败的城市")
+        lines.extend(f"- {error['query']}: {error['error']}" for error in errors)
+    lines.append("")
+    lines.append("---")
+    lines.append("*数据来源: Open-Meteo API*")
+    return "\n".join(lines)
+
+# Archive variable -> (markdown label, number format)
+_ARCHIVE_COLUMNS = {
+    "weathercode": ("天气状况", ""),
+    "temperature_2m_max": ("最高温度 (°C)", ".1f"),
+    "temperature_2m_min": ("最低温度 (°C)", ".1f"),
+    "temperature_2m_mean": ("平均温度 (°C)", ".1f"),
+    "apparent_temperature_max": ("最高体感温度 (°C)", ".1f"),
+    "apparent_temperature_min": ("最低体感温度 (°C)", ".1f"),
+    "precipitation_sum": ("降水量 (mm)", ".1f"),
+    "windspeed_10m_max": ("最大风速 (km/h)", ".1f")
+}
+# Weather codes are categorical, so they have no normal
+_CLIMATE_VARIABLES = tuple(variable for variable in ARCHIVE_VARIABLES if variable != "weathercode")
+WET_DAY_THRESHOLD_MM = 1.0
+_CLIMATE_SOURCES = {"archive": "历史数据", "forecast": "预报"}
+
+def _format_history_markdown(city_info: Dict[str, Any], dates: List[str], variables: List[str],
+                             columns: Dict[str, List[Any]]) -> str:
+    '''Render archive rows as a markdown table, one row per day.'''
+    lines = [
+        f"# 历史天气 - {city_info['name']}",
+        "",
+        f"**日期**: {dates[0]} ~ {dates[-1]}",
+        f"**位置**: {city_info['name']}, {city_info['country']}",
+        "",
+        "| 日期 | " + " | ".join(_ARCHIVE_COLUMNS[name][0] for name in variables) + " |",
+        "| --- |" + " --- |" * len(variables)
+    ]
+    for i, day in enumerate(dates):
+        cells = []
+        for name in variables:
+            v = columns[name][i]
+            if v is None:
+                cells.append("-")
+            else:
+                cells.append(_get_weather_description(v) if name == "weathercode" else format(v, _ARCHIVE_COLUMNS[name][1]))
+        lines.append(f"| {day} | " + " | ".join(cells) + " |")
+    lines.append("")
+    lines.append("---")
+    lines.append("*数据来源: Open-Meteo Historical Weather API (ERA5)*")
+    return "\n".join(lines)
 
-    # Extract all available daily data
-    for key, values in daily.items():
-        if date_index < len(values):
-            result["weather"][key] = values[date_index]
+@_STAGE_SECONDS.timed(stage="climate")
+def _climate_normals(np: Any, series: _ArchiveSeries, target: date, start_year: int, end_year: int,
+                     window_days: int, values: Dict[str, Optional[float]]) -> Tuple[int, Dict[str, Dict[str, Any]]]:
+    '''Statistics of each variable over the same calendar days of the baseline years.
+
+    The baseline days are gathered from the memory-mapped columns with one
+    index array, so the cost is proportional to years x window rather than
+    to the length of the stored series. ``values`` (the target day) are
+    ranked against the sample and their anomaly against the mean.
+    '''
+    centers = []
+    for year in range(start_year, end_year + 1):
+        day = 28 if target.month == 2 and target.day == 29 and not calendar.isleap(year) else target.day
+        centers.append(date(year, target.month, day).toordinal())
+    index = (np.array(centers)[:, None] + np.arange(-window_days, window_days + 1)).ravel() - series.start_ordinal
+    index = index[(index >= 0) & (index < series.length)]
+    sample = series.data[[ARCHIVE_VARIABLES.index(name) for name in _CLIMATE_VARIABLES]][:, index]
+    valid = ~np.isnan(sample)
+    counts = valid.sum(axis=1)
+    with warnings.catch_warnings():
+        # all-NaN rows (no data for that variable) simply yield NaN statistics
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(sample, axis=1)
+        std = np.nanstd(sample, axis=1)
+        low, high = np.nanmin(sample, axis=1), np.nanmax(sample, axis=1)
+        p10, p90 = np.nanpercentile(sample, [10, 90], axis=1) if sample.shape[1] else (mean, mean)
+
+    stats: Dict[str, Dict[str, Any]] = {}
+    for row, name in enumerate(_CLIMATE_VARIABLES):
+        value = values.get(name)
+        entry = {
+            "value": value,
+            "normal": _query_value(mean[row], False),
+            "anomaly": None,
+            "percentile": None,
+            "std": _query_value(std[row], False),
+            "p10": _query_value(p10[row], False),
+            "p90": _query_value(p90[row], False),
+            "min": _query_value(low[row], False),
+            "max": _query_value(high[row], False)
+        }
+        if value is not None and counts[row]:
+            column = sample[row][valid[row]]
+            entry["anomaly"] = _query_value(value - mean[row], False)
+            # mid-rank percentile: ties count half
+            entry["percentile"] = _query_value(
+                100 * ((column < value).sum() + 0.5 * (column == value).sum()) / counts[row], False)
+        if name == "precipitation_sum":
+            entry["wet_day_frequency"] = _query_value(
+                (sample[row] >= WET_DAY_THRESHOLD_MM).sum() / counts[row] if counts[row] else float("nan"), False)
+        stats[name] = entry
+    return int(counts.max()) if len(counts) else 0, stats
+
+def _format_climate_markdown(city_info: Dict[str, Any], target_date: str, source: Optional[str],
+                             params: ClimateQueryInput, samples: int, stats: Dict[str, Dict[str, Any]]) -> str:
+    '''Render a climate comparison as a markdown table.'''
+    def cell(v: Any, fmt: str, signed: bool = False) -> str:
+        if v is None:
+            return "-"
+        return format(v, "+" + fmt if signed else fmt)
+
+    lines = [
+        f"# 气候对比 - {city_info['name']}",
+        "",
+        f"**日期**: {target_date}",
+        f"**位置**: {city_info['name']}, {city_info['country']}",
+        f"**基准期**: {params.baseline_start_year}-{params.baseline_end_year}，"
+        f"前后 {params.window_days} 天（{samples} 个样本日）",
+        f"**当日数值**: {_CLIMATE_SOURCES.get(source, '暂无（该日期不在历史数据或预报范围内）')}",
+        "",
+        "| 变量 | 当日 | 常年均值 | 距平 | 百分位 | P10 | P90 | 历史最低 | 历史最高 |",
+        "| --- | --- | --- | --- | --- | --- | --- | --- | --- |"
+    ]
+    for name, entry in stats.items():
+        label, fmt = _ARCHIVE_COLUMNS[name]
+        lines.append(
+            f"| {label} | {cell(entry['value'], fmt)} | {cell(entry['normal'], fmt)} | "
+            f"{cell(entry['anomaly'], fmt, True)} | {cell(entry['percentile'], '.0f')} | "
+            f"{cell(entry['p10'], fmt)} | {cell(entry['p90'], fmt)} | {cell(entry['min'], fmt)} | {cell(entry['max'], fmt)} |"
+        )
+    wet = stats.get("precipitation_sum", {}).get("wet_day_frequency")
+    if wet is not None:
+        lines.append("")
+        lines.append(f"- **降水日频率**（≥{WET_DAY_THRESHOLD_MM:g} mm）: {wet:.0%}")
+    lines.append("")
+    lines.append("---")
+    lines.append("*数据来源: Open-Meteo Historical Weather API (ERA5) 与 Forecast API*")
+    return "\n".join(lines)
 
-    return json.dumps(result, indent=2)
+# WMO weather code -> description, built once at import
+_WEATHER_CODE_DESCRIPTIONS = {
+    0: "晴朗",
+    1: "大部分晴朗",
+    2: "部分多云",
+    3: "阴天",
+    45: "雾",
+    48: "雾凇",
+    51: "毛毛雨（轻度）",
+    53: "毛毛雨（中度）",
+    55: "毛毛雨（重度）",
+    61: "小雨",
+    63: "中雨",
+    65: "大雨",
+    71: "小雪",
+    73: "中雪",
+    75: "大雪",
+    77: "雪粒",
+    80: "阵雨（轻度）",
+    81: "阵雨（中度）",
+    82: "阵雨（重度）",
+    85: "小阵雪",
+    86: "大阵雪",
+    95: "雷暴",
+    96: "雷暴伴冰雹（轻度）",
+    99: "雷暴伴冰雹（重度）"
+}
+
+# UV index upper bounds and their levels (the last level has no upper bound)
+_UV_THRESHOLDS = (2, 5, 7, 10)
+_UV_LEVELS = ("低", "中等", "高", "很高", "极高")
 
 def _get_weather_description(code: int) -> str:
     '''Get weather description from WMO weather code.'''
-    weather_codes = {
-        0: "晴朗",
-        1: "大部分晴朗",
-        2: "部分多云",
-        3: "阴天",
-        45: "雾",
-        48: "雾凇",
-        51: "毛毛雨（轻度）",
-        53: "毛毛雨（中度）",
-        55: "毛毛雨（重度）",
-        61: "小雨",
-        63: "中雨",
-        65: "大雨",
-        71: "小雪",
-        73: "中雪",
-        75: "大雪",
-        77: "雪粒",
-        80: "阵雨（轻度）",
-        81: "阵雨（中度）",
-        82: "阵雨（重度）",
-        85: "小阵雪",
-        86: "大阵雪",
-        95: "雷暴",
-        96: "雷暴伴冰雹（轻度）",
-        99: "雷暴伴冰雹（重度）"
-    }
-    return weather_codes.get(code, f"未知天气状况 (代码: {code})")
+    description = _WEATHER_CODE_DESCRIPTIONS.get(code)
+    return description if description is not None else f"未知天气状况 (代码: {code})"
 
 def _get_uv_description(uv_index: float) -> str:
     '''Get UV index description.'''
-    if uv_index <= 2:
-        return "低"
-    elif uv_index <= 5:
-        return "中等"
-    elif uv_index <= 7:
-        return "高"
-    elif uv_index <= 10:
-        return "很高"
-    else:
-        return "极高"
+    return _UV_LEVELS[bisect.bisect_left(_UV_THRESHOLDS, uv_index)]
+
+def _union_variables(window: _DailyForecast, variables: Tuple[str, ...]) -> Tuple[str, ...]:
+    '''Variables held by ``window`` plus ``variables``, in DAILY_VARIABLES order.'''
+    wanted = window.variables.union(variables)
+    return tuple(name for name in DAILY_VARIABLES if name in wanted)
+
+@_STAGE_SECONDS.timed(stage="forecast")
+async def _fetch_weather_data(latitude: float, longitude: float,
+                              variables: Tuple[str, ...] = DAILY_VARIABLES) -> _DailyForecast:
+    '''Fetch the forecast window for a location with at least ``variables``, serving it from cache when possible.
+
+    A cached window holding a superset of ``variables`` answers the request;
+    otherwise the union of its variables and the requested ones is fetched so
+    the entry only ever grows.
+    '''
+    key = _ForecastCache.key(latitude, longitude)
+    _hot_locations.record(key)
+    cached = await _forecast_cache.get(latitude, longitude)
+    if cached is not None:
+        if cached.covers(variables):
+            return cached
+        return await _fetch_forecast(key, _union_variables(cached, variables))
+    stale = _forecast_cache.get_stale(latitude, longitude, variables)
+    if stale is not None:
+        _revalidate_forecast(key, _union_variables(stale, variables))
+        return stale
+    # An expired window lacking some of ``variables`` is a miss, but its columns are refetched too
+    expired = _forecast_cache.peek(latitude, longitude)
+    return await _fetch_forecast(key, _union_variables(expired, variables) if expired is not None else variables)
+
+def _fetch_forecast(key: Tuple[float, float], variables: Tuple[str, ...]) -> Awaitable[_DailyForecast]:
+    '''Download a window through the single-flight group, one upstream call per (location, variables).'''
+    return _single_flight.do(("forecast", key, variables), lambda: _fetch_forecast_window(*key, variables))
+
+def _revalidate_forecast(key: Tuple[float, float], variables: Tuple[str, ...] = DAILY_VARIABLES) -> None:
+    '''Refresh a stale forecast window in the background.'''
+    async def refresh() -> None:
+        try:
+            await _fetch_forecast(key, variables)
+        except Exception as e:
+            logger.warning("Background refresh of forecast for %s failed: %s", key, e)
+
+    task = asyncio.create_task(refresh())
+    _revalidations.add(task)
+    task.add_done_callback(_revalidations.discard)
+
+async def _fetch_forecast_window(latitude: float, longitude: float,
+                                 variables: Tuple[str, ...] = DAILY_VARIABLES) -> _DailyForecast:
+    '''Download the forecast window for ``variables`` from Open-Meteo API and cache it.'''
+    params = {
+        "latitude": latitude,
+        "longitude": longitude,
+        "daily": ",".join(variables),
+        "timezone": "auto",
+        "forecast_days": FORECAST_WINDOW_DAYS
+    }
+
+    response = await _http_get(
+        f"{OPEN_METEO_BASE_URL}/forecast",
+        params=params,
+        timeout=30.0
+    )
+    response.raise_for_status()
+    forecast = _DailyForecast.from_json(response.json())
+    await _forecast_cache.put(latitude, longitude, forecast)
+    return forecast
+
+@_STAGE_SECONDS.timed(stage="forecast_batch")
+async def _fetch_weather_data_batch(locations: List[Tuple[float, float]]) -> Dict[Tuple[float, float], Any]:
+    '''Fetch forecast windows for many locations with as few requests as possible.
+
+    Cached windows are reused; the remaining locations are requested in
+    chunks using Open-Meteo's comma-separated latitude/longitude lists.
+    Returns a mapping from cache key to the window, or to the exception that
+    made its chunk fail.
+    '''
+    results: Dict[Tuple[float, float], Any] = {}
+    missing: List[Tuple[float, float]] = []
+    keys = [_ForecastCache.key(latitude, longitude) for latitude, longitude in locations]
+    for key in keys:
+        _hot_locations.record(key)
+    found = await _forecast_cache.get_many(list(dict.fromkeys(keys)))
+    for key in keys:
+        if key in results or key in missing:
+            continue
+        latitude, longitude = key
+        cached = found.get(key)
+        if cached is None:
+            cached = _forecast_cache.get_stale(latitude, longitude)
+            if cached is not None:
+                _revalidate_forecast(key)
+        if cached is not None and cached.covers(DAILY_VARIABLES):
+            results[key] = cached
+        else:
+            missing.append(key)
 
-async def _fetch_weather_data(latitude: float, longitude: float, start_date: str, end_date: str) -> Dict[str, Any]:
-    '''Fetch weather data from Open-Meteo API.'''
-    async with httpx.AsyncClient() as client:
-        params = {
+    async def fetch_chunk(chunk: List[Tuple[float, float]]) -> None:
+        try:
+            response = await _http_get(
+                f"{OPEN_METEO_BASE_URL}/forecast",
+                params={
+                    "latitude": ",".join(str(latitude) for latitude, _ in chunk),
+                    "longitude": ",".join(str(longitude) for _, longitude in chunk),
+                    "daily": ",".join(DAILY_VARIABLES),
+                    "timezone": "auto",
+                    "forecast_days": FORECAST_WINDOW_DAYS
+                },
+                timeout=30.0,
+                max_queue_wait=float("inf")
+            )
+            response.raise_for_status()
+            data = response.json()
+            # A single location comes back as an object, several as a list in request order
+            windows = data if isinstance(data, list) else [data]
+            if len(windows) != len(chunk):
+                raise ValueError("Unexpected number of locations in forecast response")
+        except Exception as e:
+            for key in chunk:
+                results[key] = e
+            return
+        fetched = []
+        for key, window in zip(chunk, windows):
+            try:
+                forecast = _DailyForecast.from_json(window)
+            except Exception as e:
+                results[key] = e
+                continue
+            fetched.append((key, forecast))
+            results[key] = forecast
+        await _forecast_cache.put_many(fetched)
+
+    chunks = [missing[i:i + BATCH_LOCATIONS_PER_REQUEST] for i in range(0, len(missing), BATCH_LOCATIONS_PER_REQUEST)]
+    await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+    return results
+
+@_STAGE_SECONDS.timed(stage="hourly")
+async def _fetch_hourly_data(latitude: float, longitude: float, variables: List[str]) -> _HourlyForecast:
+    '''Fetch the hourly window for a location with at least ``variables``.
+
+    A cached window holding a superset of the variables is reused; otherwise
+    the union of the cached and requested variables is fetched so the
+    entry keeps growing instead of thrashing between variable sets.
+    '''
+    cached = await _hourly_cache.get(latitude, longitude)
+    wanted = frozenset(variables)
+    if cached is not None and wanted <= cached.variables:
+        return cached
+    if cached is not None:
+        wanted |= cached.variables
+    names = sorted(wanted)
+    key = _ForecastCache.key(latitude, longitude)
+    return await _single_flight.do(("hourly", key, tuple(names)),
+                                   lambda: _fetch_hourly_window(latitude, longitude, names))
+
+async def _fetch_hourly_window(latitude: float, longitude: float, variables: List[str]) -> _HourlyForecast:
+    '''Download the hourly window for the given variables and cache it.'''
+    response = await _http_get(
+        f"{OPEN_METEO_BASE_URL}/forecast",
+        params={
             "latitude": latitude,
             "longitude": longitude,
-            "daily": "weathercode,temperature_2m_max,temperature_2m_min,apparent_temperature_max,apparent_temperature_min,precipitation_sum,precipitation_probability_max,windspeed_10m_max,relative_humidity_2m_max,relative_humidity_2m_min,uv_index_max,sunrise,sunset",
+            "hourly": ",".join(variables),
             "timezone": "auto",
-            "start_date": start_date,
-            "end_date": end_date
-        }
+            "forecast_days": FORECAST_WINDOW_DAYS
+        },
+        timeout=30.0
+    )
+    response.raise_for_status()
+    forecast = _HourlyForecast.from_json(response.json())
+    await _hourly_cache.put(latitude, longitude, forecast)
+    return forecast
 
-        response = await client.get(
-            f"{OPEN_METEO_BASE_URL}/forecast",
-            params=params,
-            timeout=30.0
-        )
-        response.raise_for_status()
-        return response.json()
+async def _archive_series(np: Any, latitude: float, longitude: float, start: date, end: date) -> _ArchiveSeries:
+    '''Return the stored archive series of a location covering days [start, end] as far as published.
+
+    Days already on disk are never downloaded again: only the missing days
+    before or after the stored range are fetched and merged into the file.
+    '''
+    start_ordinal = max(start, ARCHIVE_FIRST_DATE).toordinal()
+    end_ordinal = min(end, date.today() - timedelta(days=ARCHIVE_LAG_DAYS)).toordinal() + 1
+    if end_ordinal <= start_ordinal:
+        raise ValueError(f"Archive data is only available from {ARCHIVE_FIRST_DATE.isoformat()} "
+                         f"until {ARCHIVE_LAG_DAYS} days ago")
+    key = _ForecastCache.key(latitude, longitude)
+    series = _archive_store.get(np, key)
+    if series is None or not series.covers(start_ordinal, end_ordinal):
+        # another process may have extended the file in the meantime
+        series = _archive_store.get(np, key, reload=True)
+    for _ in range(3):
+        if series is not None and series.covers(start_ordinal, end_ordinal):
+            break
+        # a coalesced download may have been for a different range; check again once it is merged
+        series = await _single_flight.do(("archive", key),
+                                         lambda: _download_archive(np, key, start_ordinal, end_ordinal))
+    return series
+
+@_STAGE_SECONDS.timed(stage="archive")
+async def _download_archive(np: Any, key: Tuple[float, float], start_ordinal: int, end_ordinal: int) -> _ArchiveSeries:
+    '''Fetch the days of [start, end) missing from the stored series, merge them and rewrite the file.'''
+    current = _archive_store.get(np, key)
+    if current is None:
+        ranges = [(start_ordinal, end_ordinal)]
+        first, last, checked = start_ordinal, end_ordinal, end_ordinal
+    else:
+        ranges = []
+        if start_ordinal < current.start_ordinal:
+            ranges.append((start_ordinal, current.start_ordinal))
+        if end_ordinal > current.end_ordinal:
+            ranges.append((current.end_ordinal, end_ordinal))
+        first = min(start_ordinal, current.start_ordinal)
+        last = max(end_ordinal, current.end_ordinal)
+        checked = max(end_ordinal, current.checked_ordinal)
+    pieces = await asyncio.gather(*(_fetch_archive_range(np, key, lo, hi) for lo, hi in ranges))
+
+    data = np.full((len(ARCHIVE_VARIABLES), last - first), np.nan)
+    if current is not None:
+        data[:, current.start_ordinal - first:current.end_ordinal - first] = current.data
+    for (lo, hi), piece in zip(ranges, pieces):
+        data[:, lo - first:hi - first] = piece
+    # Trailing days the archive has not published yet are dropped; ``checked`` remembers they were asked for
+    filled = np.flatnonzero(~np.isnan(data).all(axis=0))
+    length = int(filled[-1]) + 1 if len(filled) else 0
+    return _archive_store.put(np, key, first, checked, data[:, :length])
+
+async def _fetch_archive_range(np: Any, key: Tuple[float, float], start_ordinal: int, end_ordinal: int) -> Any:
+    '''Download days [start, end) of every archive variable as a (variables x days) array.'''
+    response = await _http_get(
+        f"{ARCHIVE_API}/archive",
+        params={
+            "latitude": key[0],
+            "longitude": key[1],
+            "start_date": date.fromordinal(start_ordinal).isoformat(),
+            "end_date": date.fromordinal(end_ordinal - 1).isoformat(),
+            "daily": ",".join(ARCHIVE_VARIABLES),
+            "timezone": "auto"
+        },
+        timeout=60.0
+    )
+    response.raise_for_status()
+    daily = response.json().get("daily", {})
+    times = daily.get("time", [])
+    piece = np.full((len(ARCHIVE_VARIABLES), end_ordinal - start_ordinal), np.nan)
+    if not times:
+        return piece
+    offset = date.fromisoformat(times[0]).toordinal() - start_ordinal
+    if offset < 0 or date.fromisoformat(times[-1]).toordinal() - start_ordinal != offset + len(times) - 1 \
+            or offset + len(times) > piece.shape[1]:
+        raise ValueError("Unexpected dates in archive response")
+    for row, variable in enumerate(ARCHIVE_VARIABLES):
+        values = daily.get(variable)
+        if values is not None and len(values) == len(times):
+            piece[row, offset:offset + len(times)] = np.array(values, dtype=float)
+    return piece
+
+def _range_dates(params: RangeQueryInput, today: date) -> List[str]:
+    '''Resolve a range query into its list of dates, counting from the location's ``today``.'''
+    start, num_days = params.start_days_later, params.num_days
+    if params.preset == RangePreset.WEEKEND:
+        # Saturday=5, Sunday=6; on a weekend day the current weekend is used
+        weekday = today.weekday()
+        start = 0 if weekday >= 5 else 5 - weekday
+        num_days = 1 if weekday == 6 else 2
+    elif params.preset == RangePreset.NEXT_7_DAYS:
+        start, num_days = 0, 7
+    return [(today + timedelta(days=start + i)).isoformat() for i in range(num_days)]
+
+def _next_weekday_date(weekday: str, today: date) -> str:
+    '''Return the date of the next occurrence of a weekday after the location's ``today``.'''
+    weekdays = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+    target_index = weekdays.index(weekday.lower())
+
+    current_weekday = today.weekday()  # Monday=0, Sunday=6
+
+    # Calculate days to add
+    days_until_target = (target_index - current_weekday) % 7
+    if days_until_target == 0:
+        # If today is the target day, check if we want today or next week
+        # For simplicity, we'll use next week's occurrence if today is the target
+        days_until_target = 7
+
+    return (today + timedelta(days=days_until_target)).isoformat()
+
+def _shared_today(city_infos: List[Any], windows: Dict[Tuple[float, float], Any]) -> date:
+    '''Local date of the first city with a forecast window; multi-city tools put every city on that date.'''
+    for city_info in city_infos:
+        if isinstance(city_info, dict):
+            window = windows[_ForecastCache.key(city_info["latitude"], city_info["longitude"])]
+            if not isinstance(window, Exception):
+                return window.today()
+    return date.today()
 
 # Tool definitions
 @mcp.tool(
@@ -309,6 +3254,7 @@ async def _fetch_weather_data(latitude: float, longitude: float, start_date: str
         "openWorldHint": True
     }
 )
+@_instrumented
 async def weather_query_by_days(params: WeatherQueryInput) -> str:
     '''查询指定城市在指定天数后的天气情况。
 
@@ -317,7 +3263,9 @@ async def weather_query_by_days(params: WeatherQueryInput) -> str:
     Args:
         params (WeatherQueryInput): 已验证的输入参数，包含:
             - city (str): 城市名称（例如：'北京', '上海', 'New York', 'London'）
-            - days_later (int): 未来的天数（0=今天, 1=明天, 2=后天, 范围：0-16）
+            - days_later (int): 未来的天数（0=今天, 1=明天, 2=后天, 范围：0-15）
+            - fields (list[WeatherField], 可选): 只获取并返回这些字段组（weather, temperature, apparent_temperature,
+              precipitation, precipitation_probability, wind, humidity, uv, sun），默认全部
             - response_format (ResponseFormat): 输出格式，默认为markdown
 
     Returns:
@@ -343,32 +3291,30 @@ async def weather_query_by_days(params: WeatherQueryInput) -> str:
 
     Error Handling:
         - 如果城市名称无效，返回城市未找到错误
-        - 如果天数超出范围（0-16），返回验证错误
+        - 如果天数超出范围（0-15），返回验证错误
         - 如果API请求失败，返回相应的错误信息
     '''
     try:
         # Get city coordinates
         city_info = await _get_city_coordinates(params.city)
 
-        # Calculate target date
-        target_date = (datetime.now() + timedelta(days=params.days_later)).strftime("%Y-%m-%d")
-
-        # Fetch weather data (get a range to ensure we include the target date)
-        start_date = (datetime.now() + timedelta(days=params.days_later)).strftime("%Y-%m-%d")
-        end_date = start_date
-
+        # Fetch (or reuse) the cached forecast window for this location
+        variables = _field_variables(params.fields)
         weather_data = await _fetch_weather_data(
             city_info["latitude"],
             city_info["longitude"],
-            start_date,
-            end_date
+            variables
         )
 
+        # Count days from the city's own date, not the server's
+        target_date = (weather_data.today() + timedelta(days=params.days_later)).isoformat()
+
         # Format response
         if params.response_format == ResponseFormat.MARKDOWN:
-            return _format_weather_markdown(weather_data, city_info, target_date)
-        else:
-            return _format_weather_json(weather_data, city_info, target_date)
+            return _format_weather_markdown(weather_data, city_info, target_date, variables)
+        if params.response_format == ResponseFormat.COMPACT:
+            return _format_weather_compact(weather_data, city_info, target_date, variables)
+        return _format_weather_json(weather_data, city_info, target_date, variables)
 
     except Exception as e:
         return _handle_api_error(e)
@@ -383,6 +3329,7 @@ async def weather_query_by_days(params: WeatherQueryInput) -> str:
         "openWorldHint": True
     }
 )
+@_instrumented
 async def weather_query_by_weekday(params: WeekdayQueryInput) -> str:
     '''查询指定城市在下一个指定星期几的天气情况。
 
@@ -392,6 +3339,7 @@ async def weather_query_by_weekday(params: WeekdayQueryInput) -> str:
         params (WeekdayQueryInput): 已验证的输入参数，包含:
             - city (str): 城市名称（例如：'北京', '上海', 'New York'）
             - target_weekday (str): 目标星期几（例如：'Saturday', 'Sunday', 'Monday'）
+            - fields (list[WeatherField], 可选): 只获取并返回这些字段组，同 weather_query_by_days
             - response_format (ResponseFormat): 输出格式，默认为markdown
 
     Returns:
@@ -410,43 +3358,550 @@ async def weather_query_by_weekday(params: WeekdayQueryInput) -> str:
         # Get city coordinates
         city_info = await _get_city_coordinates(params.city)
 
-        # Find the next occurrence of the target weekday
-        target_weekday_lower = params.target_weekday.lower()
-        weekdays = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-        target_index = weekdays.index(target_weekday_lower)
+        # Fetch (or reuse) the cached forecast window for this location
+        variables = _field_variables(params.fields)
+        weather_data = await _fetch_weather_data(
+            city_info["latitude"],
+            city_info["longitude"],
+            variables
+        )
+
+        # Find the next occurrence of the target weekday in the city's own calendar
+        target_date = _next_weekday_date(params.target_weekday, weather_data.today())
+
+        # Format response
+        if params.response_format == ResponseFormat.MARKDOWN:
+            return _format_weather_markdown(weather_data, city_info, target_date, variables)
+        if params.response_format == ResponseFormat.COMPACT:
+            return _format_weather_compact(weather_data, city_info, target_date, variables)
+        return _format_weather_json(weather_data, city_info, target_date, variables)
+
+    except Exception as e:
+        return _handle_api_error(e)
+
+@mcp.tool(
+    name="weather_query_range",
+    annotations={
+        "title": "查询连续多天的天气",
+        "readOnlyHint": True,
+        "destructiveHint": False,
+        "idempotentHint": True,
+        "openWorldHint": True
+    }
+)
+@_instrumented
+async def weather_query_range(params: RangeQueryInput) -> str:
+    '''查询指定城市连续多天的天气情况（如本周末、未来7天）。
 
-        today = datetime.now()
-        current_weekday = today.weekday()  # Monday=0, Sunday=6
+    一次获取预报并在一次遍历中输出所有日期，避免逐天调用 weather_query_by_days。
 
-        # Calculate days to add
-        days_until_target = (target_index - current_weekday) % 7
-        if days_until_target == 0:
-            # If today is the target day, check if we want today or next week
-            # For simplicity, we'll use next week's occurrence if today is the target
-            days_until_target = 7
+    Args:
+        params (RangeQueryInput): 已验证的输入参数，包含:
+            - city (str): 城市名称（例如：'北京', '上海', 'New York'）
+            - start_days_later (int): 起始日（0=今天），默认0
+            - num_days (int): 天数（1-16），默认7；start_days_later + num_days 不超过16
+            - preset (RangePreset, 可选): 'weekend'（本周末）或 'next_7_days'（未来7天），优先于上面两个参数
+            - layout (RangeLayout): json/compact 的结构，'rows'（每天一个对象，默认）或 'columns'（每个变量一个数组）
+            - response_format (ResponseFormat): 输出格式，默认为markdown
 
-        target_date = (today + timedelta(days=days_until_target)).strftime("%Y-%m-%d")
+    Returns:
+        str: markdown 为每天一行的表格（天气状况、温度、降水量、降水概率、风速、紫外线指数）；
+        json 为 {"city", "country", "latitude", "longitude", "start_date", "end_date", "days": [...]}，
+        columns 布局时 "days" 换成 "dates"、"unavailable" 与 "columns": {变量: [...]}；
+        compact 与 json 结构相同，但为无空白的紧凑 JSON。
+        超出预报范围的日期会标记为数据不可用。
 
-        # Fetch weather data
+    Examples:
+        - 查询本周末的天气: city="北京", preset="weekend"
+        - 查询未来7天的天气: city="上海", preset="next_7_days"
+        - 查询3天后开始的5天: city="London", start_days_later=3, num_days=5
+    '''
+    try:
+        city_info = await _get_city_coordinates(params.city)
         weather_data = await _fetch_weather_data(
             city_info["latitude"],
-            city_info["longitude"],
-            target_date,
-            target_date
+            city_info["longitude"]
         )
+        dates = _range_dates(params, weather_data.today())
+
+        if params.response_format == ResponseFormat.MARKDOWN:
+            return _format_range_markdown(weather_data, city_info, dates)
+        if params.response_format == ResponseFormat.COMPACT:
+            return _format_range_compact(weather_data, city_info, dates, params.layout)
+        return _format_range_json(weather_data, city_info, dates, params.layout)
+
+    except Exception as e:
+        return _handle_api_error(e)
+
+@mcp.tool(
+    name="weather_query_batch",
+    annotations={
+        "title": "批量查询多个城市的天气",
+        "readOnlyHint": True,
+        "destructiveHint": False,
+        "idempotentHint": True,
+        "openWorldHint": True
+    }
+)
+@_instrumented
+async def weather_query_batch(params: BatchQueryInput) -> str:
+    '''批量查询多个城市在同一天的天气情况。
+
+    城市并发解析坐标，预报通过 Open-Meteo 的多地点请求一次性获取，
+    因此查询几十到上百个城市只需要极少的往返。
+
+    Args:
+        params (BatchQueryInput): 已验证的输入参数，包含:
+            - cities (list[str]): 城市名称列表（1-200个）
+            - days_later (int, 可选): 未来的天数（0-15），与 target_weekday 二选一
+            - target_weekday (str, 可选): 目标星期几（例如：'Saturday'），与 days_later 二选一
+            - response_format (ResponseFormat): 输出格式，默认为markdown
+
+    Returns:
+        str: 每个城市的天气信息，格式与 weather_query_by_days 相同
+
+        单个城市出错不会影响其他城市，错误会出现在该城市对应的位置：
+        - markdown: 该城市小节内的 "Error: <错误信息>"
+        - json: results 中该城市的 {"query": ..., "error": ...}
+
+    Examples:
+        - 查询多个城市明天的天气: cities=["北京", "上海", "广州"], days_later=1
+        - 查询门店城市本周六的天气: cities=["Shenzhen", "Hangzhou"], target_weekday="Saturday"
+    '''
+    try:
+        # Geocode every city concurrently; failures stay per-city
+        city_infos = await _get_many_city_coordinates(params.cities)
+        windows = await _fetch_weather_data_batch([
+            (info["latitude"], info["longitude"]) for info in city_infos if isinstance(info, dict)
+        ])
+
+        today = _shared_today(city_infos, windows)
+        if params.target_weekday is not None:
+            target_date = _next_weekday_date(params.target_weekday, today)
+        else:
+            target_date = (today + timedelta(days=params.days_later)).isoformat()
+
+        markdown_sections = []
+        json_results = []
+        for city, city_info in zip(params.cities, city_infos):
+            if isinstance(city_info, dict):
+                window = windows[_ForecastCache.key(city_info["latitude"], city_info["longitude"])]
+                error = window if isinstance(window, Exception) else None
+            else:
+                error = city_info
+
+            if error is not None:
+                message = _handle_api_error(error)
+                markdown_sections.append(f"# 天气预报 - {city}\n\n{message}")
+                json_results.append({"query": city, "error": message})
+                continue
+
+            if params.response_format == ResponseFormat.MARKDOWN:
+                markdown_sections.append(_format_weather_markdown(window, city_info, target_date))
+            elif params.response_format == ResponseFormat.COMPACT:
+                # splice the query in front of the templated single-day result
+                result = _format_weather_compact(window, city_info, target_date)
+                json_results.append(f'{{"query":{_dumps_compact(city)},{result[1:]}')
+            else:
+                json_results.append({"query": city, **_weather_json_result(window, city_info, target_date)})
+
+        if params.response_format == ResponseFormat.MARKDOWN:
+            return "\n\n".join(markdown_sections)
+        if params.response_format == ResponseFormat.COMPACT:
+            results = (r if isinstance(r, str) else _dumps_compact(r) for r in json_results)
+            return f'{{"date":"{target_date}","results":[{",".join(results)}]}}'
+        return json.dumps({"date": target_date, "results": json_results}, indent=2)
+
+    except Exception as e:
+        return _handle_api_error(e)
+
+@mcp.tool(
+    name="weather_query_hourly",
+    annotations={
+        "title": "查询逐小时天气",
+        "readOnlyHint": True,
+        "destructiveHint": False,
+        "idempotentHint": True,
+        "openWorldHint": True
+    }
+)
+@_instrumented
+async def weather_query_hourly(params: HourlyQueryInput, ctx: Context) -> str:
+    '''查询指定城市逐小时的天气（温度、降水、风速等），按需只获取所请求的变量。
+
+    如果客户端在请求中带有 progressToken，结果会按 chunk_hours 小时分块，
+    通过 MCP 进度通知（notifications/progress 的 message 字段）依次推送，
+    客户端无需等待整份结果即可先看到最初几个小时；最终返回值仍是完整结果。
+
+    Args:
+        params (HourlyQueryInput): 已验证的输入参数，包含:
+            - city (str): 城市名称（例如：'北京', '上海', 'New York'）
+            - start_days_later (int): 起始日（0=今天），默认0
+            - num_days (int): 天数（1-16），默认1
+            - variables (list[HourlyVariable]): 逐小时变量，默认温度、降水量、风速
+            - chunk_hours (int): 每条进度通知包含的小时数，默认24
+            - response_format (ResponseFormat): 输出格式，默认为markdown
+
+    Returns:
+        str: markdown 为每小时一行的表格，各分块首尾相接即为完整表格；
+        json/compact 为 {"city", "country", "latitude", "longitude", "times": [...], "hourly": {变量: [...]}}，
+        此时每个进度通知的 message 是 {"offset", "times", "hourly"} 形式的紧凑 JSON 分块。
+
+    Examples:
+        - 查询今天逐小时温度和降水: city="北京"
+        - 查询明后两天的风速和阵风: city="上海", start_days_later=1, num_days=2, variables=["windspeed_10m", "windgusts_10m"]
+    '''
+    try:
+        city_info = await _get_city_coordinates(params.city)
+        variables = [variable.value for variable in params.variables]
+        forecast = await _fetch_hourly_data(city_info["latitude"], city_info["longitude"], variables)
+
+        start_day = forecast.today() + timedelta(days=params.start_days_later)
+        start, stop = forecast.span(start_day, params.num_days)
+        if start == stop:
+            return f"Error: Hourly weather data not available from {start_day.isoformat()}"
+        total = stop - start
+        # Without a progress token nothing is streamed, so render the result in one piece
+        streaming = _wants_progress(ctx)
 
-        # Format response
         if params.response_format == ResponseFormat.MARKDOWN:
-            return _format_weather_markdown(weather_data, city_info, target_date)
+            chunk_hours = params.chunk_hours if streaming else total
+            chunks = _hourly_markdown_chunks(forecast, city_info, variables, start, stop, chunk_hours)
+            if streaming:
+                for n, chunk in enumerate(chunks, 1):
+                    await ctx.report_progress(min(n * chunk_hours, total), total, chunk)
+            return "".join(chunks)
+
+        if streaming:
+            for offset in range(start, stop, params.chunk_hours):
+                end = min(offset + params.chunk_hours, stop)
+                block = _hourly_json_block(forecast, variables, offset, end)
+                await ctx.report_progress(end - start, total, _dumps_compact({"offset": offset - start, **block}))
+        result = {
+            "city": city_info["name"],
+            "country": city_info["country"],
+            "latitude": city_info["latitude"],
+            "longitude": city_info["longitude"],
+            **_hourly_json_block(forecast, variables, start, stop)
+        }
+        if params.response_format == ResponseFormat.COMPACT:
+            return _dumps_compact(result)
+        return json.dumps(result, indent=2)
+
+    except Exception as e:
+        return _handle_api_error(e)
+
+@mcp.tool(
+    name="weather_query_cities",
+    annotations={
+        "title": "多城市天气筛选、排序与汇总",
+        "readOnlyHint": True,
+        "destructiveHint": False,
+        "idempotentHint": True,
+        "openWorldHint": True
+    }
+)
+@_instrumented
+async def weather_query_cities(params: CityQueryInput) -> str:
+    '''在多个城市（最多500个）的日级预报上执行筛选、排序和汇总，只返回匹配的行。
+
+    预报通过多地点请求批量获取后载入 NumPy 矩阵（城市 × 日期），
+    所有条件、汇总和排序一次向量化完成。条件与汇总均为结构化参数，不执行任何表达式。
+
+    Args:
+        params (CityQueryInput): 已验证的输入参数，包含:
+            - cities (list[str]): 城市名称列表（1-500个）
+            - start_days_later / num_days / preset: 日期范围，同 weather_query_range，默认今天一天
+            - target_weekday (str, 可选): 只查询某个星期几（例如：'Saturday'），优先于日期范围
+            - where (list[QueryFilter]): 条件列表 {"variable", "op", "value"}，op 为 gt/ge/lt/le/eq/ne；
+              带 "aggregate" 时比较该城市的汇总值（例如一周降水总量）
+            - aggregates (list[QueryAggregate]): 汇总列 {"variable", "function"}，function 为 min/max/mean/sum/count，
+              给出后每个城市一行，列名为 "<function>_<variable>"
+            - sort_by (str, 可选): 排序列；descending 默认从大到小
+            - limit (int): 最多返回的行数，默认50
+            - variables (list[DailyVariable]): 逐日行中额外返回的变量
+            - response_format (ResponseFormat): 输出格式，默认为markdown
+
+    Returns:
+        str: markdown 表格，或 JSON {"dates", "columns", "matched", "rows", "errors"}；
+        逐日行为 {"query", "city", "date", 变量...}，汇总行为 {"query", "city", "days", 汇总列...}。
+        解析失败的城市列在 errors 中，不影响其他城市。
+
+    Examples:
+        - 周六降水超过10mm的站点: cities=[...], target_weekday="Saturday",
+          where=[{"variable": "precipitation_sum", "op": "gt", "value": 10}]
+        - 按本周最大紫外线指数给城市排序: cities=[...], preset="next_7_days",
+          aggregates=[{"variable": "uv_index_max", "function": "max"}], sort_by="max_uv_index_max"
+    '''
+    try:
+        if importlib.util.find_spec("numpy") is None:
+            return "Error: weather_query_cities requires numpy. Install it with: pip install 'openmeteo-weather-mcp[analytics]'"
+        import numpy as np
+
+        city_infos = await _get_many_city_coordinates(params.cities)
+        windows = await _fetch_weather_data_batch([
+            (info["latitude"], info["longitude"]) for info in city_infos if isinstance(info, dict)
+        ])
+
+        today = _shared_today(city_infos, windows)
+        if params.target_weekday is not None:
+            dates = [_next_weekday_date(params.target_weekday, today)]
         else:
-            return _format_weather_json(weather_data, city_info, target_date)
+            dates = _range_dates(params, today)
+
+        stacked: List[Optional[_DailyForecast]] = []
+        errors = []
+        for city, city_info in zip(params.cities, city_infos):
+            window = city_info
+            if isinstance(city_info, dict):
+                window = windows[_ForecastCache.key(city_info["latitude"], city_info["longitude"])]
+            if isinstance(window, Exception):
+                errors.append({"query": city, "error": _handle_api_error(window)})
+                window = None
+            stacked.append(window)
+
+        columns, selected, matched = _evaluate_city_query(np, stacked, dates, params)
+        rows = []
+        for i, day, values in selected:
+            row = {"query": params.cities[i], "city": city_infos[i]["name"]}
+            if day is not None:
+                row["date"] = dates[day]
+            row.update(values)
+            rows.append(row)
+
+        if params.response_format == ResponseFormat.MARKDOWN:
+            return _format_city_query_markdown(dates, columns, rows, matched, errors)
+        result = {"dates": dates, "columns": columns, "matched": matched, "rows": rows, "errors": errors}
+        if params.response_format == ResponseFormat.COMPACT:
+            return _dumps_compact(result)
+        return json.dumps(result, indent=2)
 
     except Exception as e:
         return _handle_api_error(e)
 
+@mcp.tool(
+    name="weather_query_history",
+    annotations={
+        "title": "查询历史天气",
+        "readOnlyHint": True,
+        "destructiveHint": False,
+        "idempotentHint": True,
+        "openWorldHint": True
+    }
+)
+@_instrumented
+async def weather_query_history(params: HistoryQueryInput) -> str:
+    '''查询指定城市过去某段时间（最多366天，1940年起）的逐日历史天气。
+
+    数据来自 Open-Meteo 历史天气 API（ERA5 再分析），按地点保存为本地内存映射的列式文件，
+    之后的查询直接从文件切片返回，只有本地尚未保存的日期才会下载。
+    再分析数据约有几天延迟，最近几天尚未发布时显示为缺失。
+
+    Args:
+        params (HistoryQueryInput): 已验证的输入参数，包含:
+            - city (str): 城市名称（例如：'北京', '上海', 'New York'）
+            - start_date (str): 起始日期 YYYY-MM-DD
+            - end_date (str): 结束日期 YYYY-MM-DD
+            - variables (list[ArchiveVariable], 可选): 返回的变量，默认全部
+            - response_format (ResponseFormat): 输出格式，默认为markdown
+
+    Returns:
+        str: markdown 为每天一行的表格；json/compact 为
+        {"city", "country", "latitude", "longitude", "daily": {"time": [...], 变量: [...]}}，缺失值为 null
+
+    Examples:
+        - 查询去年国庆的天气: city="北京", start_date="2025-10-01", end_date="2025-10-07"
+        - 查询上个月的降水: city="上海", start_date="2026-09-01", end_date="2026-09-30", variables=["precipitation_sum"]
+    '''
+    try:
+        if importlib.util.find_spec("numpy") is None:
+            return "Error: weather_query_history requires numpy. Install it with: pip install 'openmeteo-weather-mcp[analytics]'"
+        import numpy as np
+
+        start, end = date.fromisoformat(params.start_date), date.fromisoformat(params.end_date)
+        city_info = await _get_city_coordinates(params.city)
+        series = await _archive_series(np, city_info["latitude"], city_info["longitude"], start, end)
+
+        variables = [v.value for v in params.variables] if params.variables else list(ARCHIVE_VARIABLES)
+        first, view = series.window(start.toordinal(), end.toordinal() + 1)
+        dates = [date.fromordinal(start.toordinal() + i).isoformat() for i in range((end - start).days + 1)]
+        offset = first - start.toordinal()
+        columns: Dict[str, List[Any]] = {}
+        for name in variables:
+            column: List[Any] = [None] * len(dates)
+            values = view[ARCHIVE_VARIABLES.index(name)].tolist()
+            integral = name == "weathercode"
+            column[offset:offset + len(values)] = [None if v != v else (int(v) if integral else v) for v in values]
+            columns[name] = column
+
+        if params.response_format == ResponseFormat.MARKDOWN:
+            return _format_history_markdown(city_info, dates, variables, columns)
+        result = {
+            "city": city_info["name"],
+            "country": city_info["country"],
+            "latitude": city_info["latitude"],
+            "longitude": city_info["longitude"],
+            "daily": {"time": dates, **columns}
+        }
+        if params.response_format == ResponseFormat.COMPACT:
+            return _dumps_compact(result)
+        return json.dumps(result, indent=2)
+
+    except Exception as e:
+        return _handle_api_error(e)
+
+@mcp.tool(
+    name="weather_query_climate",
+    annotations={
+        "title": "与常年气候对比",
+        "readOnlyHint": True,
+        "destructiveHint": False,
+        "idempotentHint": True,
+        "openWorldHint": True
+    }
+)
+@_instrumented
+async def weather_query_climate(params: ClimateQueryInput) -> str:
+    '''将某一天（默认今天）的天气与常年气候（默认1991-2020年）对比，给出均值、距平和百分位。
+
+    基准期的逐日数据首次使用时下载并保存为本地内存映射的列式文件，
+    之后计算同一地点任意日期的30年常年值只需读取文件中对应的几百个数值，耗时为毫秒级。
+    当日数值：过去的日期取自历史数据，今天起16天内（到第15天）取自预报。
+
+    Args:
+        params (ClimateQueryInput): 已验证的输入参数，包含:
+            - city (str): 城市名称（例如：'北京', '上海', 'New York'）
+            - target_date (str, 可选): 对比的日期 YYYY-MM-DD，默认今天
+            - baseline_start_year / baseline_end_year (int): 基准期，默认 1991-2020
+            - window_days (int): 取基准期每年同一日期前后各若干天作为样本，默认7
+            - response_format (ResponseFormat): 输出格式，默认为markdown
+
+    Returns:
+        str: markdown 表格；json/compact 为 {"city", "country", "latitude", "longitude", "date", "source",
+        "baseline": {"start_year", "end_year", "window_days", "samples"},
+        "variables": {变量: {"value", "normal", "anomaly", "percentile", "std", "p10", "p90", "min", "max"}}}，
+        降水另有 "wet_day_frequency"
+
+    Examples:
+        - 今天比常年热吗: city="北京"
+        - 下周六和常年相比: city="上海", target_date="2026-10-24"
+    '''
+    try:
+        if importlib.util.find_spec("numpy") is None:
+            return "Error: weather_query_climate requires numpy. Install it with: pip install 'openmeteo-weather-mcp[analytics]'"
+        import numpy as np
+
+        target = date.fromisoformat(params.target_date) if params.target_date else date.today()
+        city_info = await _get_city_coordinates(params.city)
+        latitude, longitude = city_info["latitude"], city_info["longitude"]
+
+        start = date(params.baseline_start_year, 1, 1) - timedelta(days=params.window_days)
+        end = date(params.baseline_end_year, 12, 31) + timedelta(days=params.window_days)
+        archived = target <= date.today() - timedelta(days=ARCHIVE_LAG_DAYS)
+        series = await _archive_series(np, latitude, longitude, min(start, target) if archived else start,
+                                       max(end, target) if archived else end)
+
+        values: Dict[str, Optional[float]] = {}
+        source = None
+        if archived:
+            first, view = series.window(target.toordinal(), target.toordinal() + 1)
+            if view.shape[1]:
+                values = {name: _query_value(view[ARCHIVE_VARIABLES.index(name), 0], False) for name in _CLIMATE_VARIABLES}
+                source = "archive"
+        elif target >= date.today():
+            window = await _fetch_weather_data(latitude, longitude)
+            index = window.index(target.isoformat())
+            if index is not None:
+                values = {name: window.value(name, index) for name in _CLIMATE_VARIABLES}
+                source = "forecast"
+        if not any(v is not None for v in values.values()):
+            source = None
+
+        samples, stats = _climate_normals(np, series, target, params.baseline_start_year,
+                                          params.baseline_end_year, params.window_days, values)
+        if params.response_format == ResponseFormat.MARKDOWN:
+            return _format_climate_markdown(city_info, target.isoformat(), source, params, samples, stats)
+        result = {
+            "city": city_info["name"],
+            "country": city_info["country"],
+            "latitude": latitude,
+            "longitude": longitude,
+            "date": target.isoformat(),
+            "source": source,
+            "baseline": {
+                "start_year": params.baseline_start_year,
+                "end_year": params.baseline_end_year,
+                "window_days": params.window_days,
+                "samples": samples
+            },
+            "variables": stats
+        }
+        if params.response_format == ResponseFormat.COMPACT:
+            return _dumps_compact(result)
+        return json.dumps(result, indent=2)
+
+    except Exception as e:
+        return _handle_api_error(e)
+
+def create_http_app():
+    '''Build the streamable HTTP ASGI app; used as a uvicorn factory by every worker.'''
+    from starlette.applications import Starlette
+    from starlette.routing import Mount
+    from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+
+    session_manager = StreamableHTTPSessionManager(
+        app=mcp._mcp_server,
+        stateless=HTTP_STATELESS,
+        json_response=HTTP_JSON_RESPONSE
+    )
+
+    async def mcp_asgi(scope, receive, send):
+        await session_manager.handle_request(scope, receive, send)
+
+    @asynccontextmanager
+    async def lifespan(_: Starlette):
+        # Hold the pooled client for the whole process, not per MCP session
+        async with _service_lifespan(), session_manager.run():
+            yield
+
+    return Starlette(
+        routes=[mcp_metrics.metrics_route(_metrics), Mount("/mcp", app=mcp_asgi)],
+        lifespan=lifespan
+    )
+
 def main():
     """Entry point for the weather-mcp command."""
-    mcp.run(transport="stdio")
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="openmeteo-weather-mcp", description="Open-Meteo weather MCP server")
+    parser.add_argument("--transport", choices=["stdio", "http"], default="stdio",
+                        help="stdio (default) or streamable HTTP served at /mcp")
+    parser.add_argument("--host", default="127.0.0.1", help="HTTP bind address")
+    parser.add_argument("--port", type=int, default=8000, help="HTTP port")
+    parser.add_argument("--workers", type=int, default=1, help="number of uvicorn worker processes")
+    parser.add_argument("--stateless", action="store_true",
+                        help="stateless HTTP mode: no server-side sessions, any worker can serve any request")
+    parser.add_argument("--json-response", action="store_true",
+                        help="return plain JSON responses instead of SSE streams")
+    args = parser.parse_args()
+
+    if args.transport == "stdio":
+        if METRICS_DUMP_PATH:
+            mcp_metrics.dump_on_exit(_metrics, METRICS_DUMP_PATH)
+        mcp.run(transport="stdio")
+        return
+
+    if args.workers > 1 and not args.stateless:
+        parser.error("--workers > 1 requires --stateless (MCP sessions live in a single process)")
+
+    import uvicorn
+
+    # Workers re-import this module, so settings travel through the environment
+    if args.stateless:
+        os.environ["WEATHER_HTTP_STATELESS"] = "1"
+    if args.json_response:
+        os.environ["WEATHER_HTTP_JSON_RESPONSE"] = "1"
+    uvicorn.run("weather:create_http_app", factory=True, host=args.host, port=args.port, workers=args.workers)
 
 if __name__ == "__main__":
     main()
@@ -1,7 +1,17 @@
+import bisect
+import functools
+import hashlib
+import html as html_lib
 import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, Awaitable, Callable
 
 import httpx
 import anyio
@@ -10,10 +20,12 @@ from mcp.server.lowlevel.server import Server
 from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
 from mcp.types import TextContent, Tool
 import os
-from openai import OpenAI
+from openai import AsyncOpenAI
 from starlette.applications import Starlette
 from starlette.routing import Mount
 
+import mcp_metrics
+
 
 DEFAULT_URL = "https://mp.weixin.qq.com/s/8KiDOoosF4cMyOOEltq28g"
 DEFAULT_PROMPT_PATH = Path(__file__).parent / "解析被投资公司.prompt"
@@ -24,6 +36,30 @@ USER_AGENT = (
 )
 OPENAI_BASE_URL = "https://api.xiaomimimo.com/v1"
 OPENAI_MODEL = "mimo-v2-flash"
+# LLM calls in flight at once across all sessions; further calls wait for a slot
+LLM_CONCURRENCY = int(os.environ.get("WECHAT_LLM_CONCURRENCY", "16"))
+LLM_TIMEOUT = float(os.environ.get("WECHAT_LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("WECHAT_LLM_CONNECT_TIMEOUT", "10"))
+LLM_MAX_RETRIES = int(os.environ.get("WECHAT_LLM_MAX_RETRIES", "2"))
+# Distinct API keys that keep a pooled client open; idle clients beyond this are closed, oldest first
+LLM_MAX_CLIENTS = int(os.environ.get("WECHAT_LLM_MAX_CLIENTS", "32"))
+# Articles estimated above this many tokens are split on paragraph boundaries into chunks of at most
+# this size, extracted concurrently (map) and merged by a final LLM call (reduce)
+CHUNK_TOKENS = int(os.environ.get("WECHAT_CHUNK_TOKENS", "6000"))
+# Chunks of one article extracted at once (all calls also share WECHAT_LLM_CONCURRENCY)
+MAP_CONCURRENCY = int(os.environ.get("WECHAT_MAP_CONCURRENCY", "4"))
+# Seconds between notifications carrying streamed LLM output; deltas arriving in between are merged
+STREAM_INTERVAL = float(os.environ.get("WECHAT_STREAM_INTERVAL", "0.1"))
+# Published articles do not change: cache parsed articles and LLM results in memory and on disk
+CACHE_DIR = Path(os.environ.get("WECHAT_CACHE_DIR", str(Path.home() / ".cache" / "wechat-article-mcp")))
+CACHE_DB_PATH = os.environ.get("WECHAT_CACHE_DB", str(CACHE_DIR / "cache.sqlite3"))  # "" keeps the cache in memory
+ARTICLE_CACHE_TTL = float(os.environ.get("WECHAT_ARTICLE_CACHE_TTL", str(7 * 86400)))
+RESULT_CACHE_TTL = float(os.environ.get("WECHAT_RESULT_CACHE_TTL", str(30 * 86400)))
+CACHE_MEMORY_ENTRIES = int(os.environ.get("WECHAT_CACHE_MEMORY_ENTRIES", "256"))
+CACHE_MAX_BYTES = int(os.environ.get("WECHAT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# "fast" scans only the meta tags and the few elements the tool reads, falling back to
+# BeautifulSoup when the page does not look as expected; "bs4" always builds the full tree
+HTML_PARSER = os.environ.get("WECHAT_HTML_PARSER", "fast")
 SYSTEM_PROMPT = (
     "You are MiMo, an AI assistant developed by Xiaomi. "
     "Today is date: Tuesday, December 16, 2025. "
@@ -37,6 +73,21 @@ def load_default_prompt() -> str:
 
 DEFAULT_PROMPT = load_default_prompt()
 
+logger = logging.getLogger(__name__)
+
+metrics = mcp_metrics.Registry()
+STAGE_SECONDS = metrics.histogram("wechat_stage_seconds", "Latency of tool stages (fetch_html, parse_html, llm)")
+TOOL_SECONDS = metrics.histogram("wechat_tool_seconds", "End-to-end latency of tool calls")
+TOOL_IN_FLIGHT = metrics.gauge("wechat_tool_in_flight", "Tool calls currently being served")
+TOOL_ERRORS = metrics.counter("wechat_tool_errors_total", "Tool calls that raised, by exception type")
+FETCH_RESPONSES = metrics.counter("wechat_fetch_responses_total", "Article fetches by HTTP status")
+PARSE_ENGINE = metrics.counter("wechat_parse_engine_total", "Article pages parsed, by extraction engine (fast or bs4)")
+LLM_IN_FLIGHT = metrics.gauge("wechat_llm_in_flight", "LLM requests currently holding a concurrency slot")
+LLM_WAITING = metrics.gauge("wechat_llm_waiting", "LLM requests waiting for a concurrency slot")
+LLM_FIRST_TOKEN = metrics.histogram("wechat_llm_first_token_seconds", "Time from sending the LLM request to its first token")
+LLM_CHUNKS = metrics.counter("wechat_llm_chunks_total", "LLM calls made for chunked articles, by step (map or reduce)")
+CACHE_LOOKUPS = metrics.counter("wechat_cache_lookups_total", "Article and LLM result cache lookups, by tier hit or miss")
+
 server = Server(name="wechat_article_mcp")
 
 
@@ -45,7 +96,10 @@ async def list_tools():
     return [
         Tool(
             name="parse_wechat_article",
-            description="获取并解析微信公众号文章",
+            description=(
+                "获取并解析微信公众号文章。模型输出会边生成边推送：请求带 progressToken 时通过进度通知"
+                "（message 为新增文本），否则通过日志通知；最终结果仍完整返回。"
+            ),
             inputSchema={
                 "type": "object",
                 "properties": {
@@ -65,16 +119,124 @@ def _first_text(*values: str | None) -> str:
     return ""
 
 
+@STAGE_SECONDS.timed(stage="fetch_html")
 async def _fetch_html(url: str) -> str:
     headers = {"User-Agent": USER_AGENT}
     async with httpx.AsyncClient(headers=headers, follow_redirects=True, timeout=20.0) as client:
         response = await client.get(url)
+        FETCH_RESPONSES.inc(status=response.status_code)
         if response.status_code != 200:
             raise RuntimeError(f"Fetch failed with status {response.status_code}")
         return response.text
 
 
+# Quoted attribute values may contain ">"; the alternatives are disjoint, so matching stays linear
+_TAG_BODY = r"""(?:[^>"']|"[^"]*"|'[^']*')*"""
+# Comments and script/style bodies: never element text, and markup inside them is not markup
+# (loops unrolled instead of lazy ".*?", which is several times slower on large inline scripts)
+_RAW_TEXT_PATTERN = (
+    r"<!--[^-]*(?:-(?!->)[^-]*)*-->"
+    rf"|<script\b{_TAG_BODY}>[^<]*(?:<(?!/script\s*>)[^<]*)*</script\s*>"
+    rf"|<style\b{_TAG_BODY}>[^<]*(?:<(?!/style\s*>)[^<]*)*</style\s*>"
+)
+_RAW_TEXT = re.compile(_RAW_TEXT_PATTERN, re.S | re.I)
+_MARKUP = re.compile(rf"{_RAW_TEXT_PATTERN}|</?[a-zA-Z][^\s/>]*{_TAG_BODY}>|<[!?][^>]*>", re.S | re.I)
+_META_TAG = re.compile(rf"<meta\b({_TAG_BODY})>", re.I)
+_START_TAG = re.compile(rf"<([a-zA-Z][^\s/>]*)({_TAG_BODY})>")
+_ATTRIBUTE = re.compile(r"""([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?""")
+_ELEMENT_ID = re.compile(r"""id\s*=\s*["']?(activity-name|js_author_name|publish_time|js_content)(?=["'\s/>])""")
+
+
+@functools.lru_cache(maxsize=32)
+def _same_name_tags(name: str) -> re.Pattern:
+    return re.compile(rf"{_RAW_TEXT_PATTERN}|<(/?){re.escape(name)}(?=[\s/>]){_TAG_BODY}>", re.S | re.I)
+
+
+def _attributes(body: str) -> dict[str, str]:
+    attrs = {}
+    for match in _ATTRIBUTE.finditer(body):
+        value = match.group(2, 3, 4)
+        value = next((v for v in value if v is not None), "")
+        attrs[match[1].lower()] = html_lib.unescape(value) if "&" in value else value
+    return attrs
+
+
+def _element_text(html: str, tag: re.Match, separator: str) -> str | None:
+    # strings of the element in document order, like BeautifulSoup's get_text(separator, strip=True);
+    # None when the element is never closed
+    if tag[0].endswith("/>"):
+        return ""
+    depth = 1
+    for token in _same_name_tags(tag[1].lower()).finditer(html, tag.end()):
+        if token[1] is None or token[0].endswith("/>"):
+            continue
+        depth += -1 if token[1] else 1
+        if not depth:
+            strings = (html_lib.unescape(text) if "&" in text else text
+                       for text in _MARKUP.split(html[tag.end():token.start()]))
+            return separator.join(text for text in map(str.strip, strings) if text)
+    return None
+
+
+def _scan_wechat_html(html: str) -> dict[str, Any] | None:
+    # Regex scan for the same fields _soup_wechat_html reads, without building a DOM.
+    # Returns None whenever the page does not look as expected, so the caller can fall back.
+    raw = [match.span() for match in _RAW_TEXT.finditer(html)]
+    raw_starts = [start for start, _ in raw]
+
+    def hidden(pos: int) -> bool:
+        i = bisect.bisect_right(raw_starts, pos) - 1
+        return i >= 0 and pos < raw[i][1]
+
+    metas: dict[tuple[str, str], str | None] = {}
+    for match in _META_TAG.finditer(html):
+        if hidden(match.start()):
+            continue
+        attrs = _attributes(match[1])
+        for kind in ("property", "name"):
+            if kind in attrs:
+                metas.setdefault((kind, attrs[kind]), attrs.get("content"))
+
+    elements: dict[str, re.Match] = {}
+    for match in _ELEMENT_ID.finditer(html):
+        if match[1] in elements or not html[match.start() - 1].isspace() or hidden(match.start()):
+            continue
+        tag = _START_TAG.match(html, html.rfind("<", 0, match.start()))
+        if tag is None or tag.end() <= match.start() or _attributes(tag[2]).get("id") != match[1]:
+            return None
+        elements[match[1]] = tag
+
+    if "js_content" not in elements:
+        return None
+    texts = {}
+    for element_id, tag in elements.items():
+        text = _element_text(html, tag, "\n" if element_id == "js_content" else "")
+        if text is None:
+            return None
+        texts[element_id] = text
+
+    content = texts["js_content"]
+    return {
+        "title": _first_text(metas.get(("property", "og:title")), texts.get("activity-name")),
+        "author": _first_text(metas.get(("name", "author")), texts.get("js_author_name")),
+        "publish_time": _first_text(metas.get(("property", "article:published_time")), texts.get("publish_time")),
+        "content": content,
+        "content_length": len(content),
+    }
+
+
+@STAGE_SECONDS.timed(stage="parse_html")
 def _parse_wechat_html(html: str) -> dict[str, Any]:
+    if HTML_PARSER != "bs4":
+        parsed = _scan_wechat_html(html)
+        if parsed is not None:
+            PARSE_ENGINE.inc(engine="fast")
+            return parsed
+    PARSE_ENGINE.inc(engine="bs4")
+    return _soup_wechat_html(html)
+
+
+def _soup_wechat_html(html: str) -> dict[str, Any]:
     soup = BeautifulSoup(html, "html.parser")
 
     title = _first_text(
@@ -122,9 +284,74 @@ def _extract_api_key() -> str:
     return auth_header.strip()
 
 
-def _run_openai(prompt: str, content: str, api_key: str) -> str:
-    client = OpenAI(api_key=api_key, base_url=OPENAI_BASE_URL)
-    response = client.chat.completions.create(
+class _LLMClientPool:
+    '''Long-lived AsyncOpenAI clients, one connection pool per API key.
+
+    Clients are kept in LRU order; beyond ``max_clients`` the least recently
+    used idle client is closed. A client still serving a request is never
+    closed underneath it.
+    '''
+
+    def __init__(self, max_clients: int):
+        self.max_clients = max_clients
+        self._clients: OrderedDict[str, AsyncOpenAI] = OrderedDict()
+        self._in_use: dict[str, int] = {}
+
+    def _create(self, api_key: str) -> AsyncOpenAI:
+        return AsyncOpenAI(
+            api_key=api_key,
+            base_url=OPENAI_BASE_URL,
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            max_retries=LLM_MAX_RETRIES,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=LLM_CONCURRENCY, max_keepalive_connections=LLM_CONCURRENCY),
+            ),
+        )
+
+    @asynccontextmanager
+    async def client(self, api_key: str):
+        client = self._clients.get(api_key)
+        if client is None:
+            client = self._clients[api_key] = self._create(api_key)
+        self._clients.move_to_end(api_key)
+        self._in_use[api_key] = self._in_use.get(api_key, 0) + 1
+        try:
+            yield client
+        finally:
+            self._in_use[api_key] -= 1
+            if not self._in_use[api_key]:
+                del self._in_use[api_key]
+            await self._evict()
+
+    async def _evict(self) -> None:
+        idle = [key for key in self._clients if key not in self._in_use]
+        for key in idle[:max(len(self._clients) - self.max_clients, 0)]:
+            await self._clients.pop(key).close()
+
+    async def close(self) -> None:
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.close()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+_llm_clients = _LLMClientPool(LLM_MAX_CLIENTS)
+_llm_slots = anyio.Semaphore(LLM_CONCURRENCY)
+
+
+@metrics.collector
+def _collect_llm_clients():
+    yield "wechat_llm_clients", "gauge", "Pooled LLM clients currently open (one per API key)", [({}, len(_llm_clients))]
+
+
+async def _complete(
+    client: AsyncOpenAI, prompt: str, content: str, on_delta: Callable[[str], Awaitable[None]] | None = None
+) -> str:
+    started = time.perf_counter()
+    stream = await client.chat.completions.create(
         model=OPENAI_MODEL,
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
@@ -133,19 +360,379 @@ def _run_openai(prompt: str, content: str, api_key: str) -> str:
         max_completion_tokens=1024,
         temperature=0.3,
         top_p=0.95,
-        stream=False,
+        stream=True,
         stop=None,
         frequency_penalty=0,
         presence_penalty=0,
         extra_body={"thinking": {"type": "disabled"}},
     )
-    if response.choices and response.choices[0].message:
-        return response.choices[0].message.content or ""
-    return ""
+    parts = []
+    async with stream:
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            if not parts:
+                LLM_FIRST_TOKEN.observe(time.perf_counter() - started)
+            parts.append(delta)
+            if on_delta is not None:
+                await on_delta(delta)
+    return "".join(parts)
+
+
+class _TokenStream:
+    '''Forward LLM output to the client of the current request while it is generated.
+
+    Uses progress notifications (``message`` holds the new text, ``progress`` the
+    characters so far) when the request carried a progressToken, log
+    notifications otherwise. Both are tied to the request, so the streamable
+    HTTP transport sends them on that request's SSE stream. Deltas are merged
+    for ``interval`` seconds to keep the notification rate bounded; a failed
+    send stops streaming without failing the call.
+    '''
+
+    def __init__(self, interval: float):
+        ctx = server.request_context
+        self.session = ctx.session
+        self.request_id = ctx.request_id
+        self.progress_token = ctx.meta.progressToken if ctx.meta else None
+        self.interval = interval
+        self.sent = 0
+        self._pending: list[str] = []
+        self._last_flush = 0.0
+        self._broken = False
+
+    async def send(self, delta: str) -> None:
+        self._pending.append(delta)
+        if time.monotonic() - self._last_flush >= self.interval:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending or self._broken:
+            return
+        text = "".join(self._pending)
+        self._pending.clear()
+        self._last_flush = time.monotonic()
+        self.sent += len(text)
+        try:
+            if self.progress_token is not None:
+                await self.session.send_progress_notification(
+                    self.progress_token, self.sent, message=text, related_request_id=self.request_id
+                )
+            else:
+                await self.session.send_log_message(
+                    "info", {"delta": text}, logger="parse_wechat_article", related_request_id=self.request_id
+                )
+        except Exception as e:
+            logger.warning("Streaming LLM output stopped: %s", e)
+            self._broken = True
+
+
+@STAGE_SECONDS.timed(stage="llm")
+async def _parse_with_openai(
+    prompt: str, content: str, api_key: str, on_delta: Callable[[str], Awaitable[None]] | None = None
+) -> str:
+    with LLM_WAITING.track():
+        await _llm_slots.acquire()
+    try:
+        with LLM_IN_FLIGHT.track():
+            async with _llm_clients.client(api_key) as client:
+                return await _complete(client, prompt, content, on_delta)
+    finally:
+        _llm_slots.release()
+
+
+class _DiskCache:
+    '''SQLite store behind the memory caches, shared by every process using the same file.
+
+    Each entry records its size and last access. A running byte total is
+    kept per process (seeded from the file on connect and adjusted on each
+    write), so a put is a single upsert; only when the total passes
+    ``max_bytes`` are expired entries deleted, the real total recounted and
+    the least recently used entries dropped. Calls block on disk and on other
+    writers, so the async caches run them in a worker thread. If the database
+    cannot be opened every call becomes a no-op and the caches run from
+    memory only.
+    '''
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._db: sqlite3.Connection | None = None
+        self._failed = not path
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection | None:
+        if self._db is None and not self._failed:
+            try:
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+                db = sqlite3.connect(self.path, isolation_level=None, timeout=1.0, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS cache (namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                    "size INTEGER NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (namespace, key))"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+                self._total = db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+                self._db = db
+            except (sqlite3.Error, OSError) as e:
+                logger.warning("Cache database %s unavailable (%s); using memory only", self.path, e)
+                self._failed = True
+        return self._db
+
+    def get(self, namespace: str, key: str) -> tuple[str, float] | None:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return None
+            now = time.time()
+            try:
+                row = db.execute(
+                    "SELECT value, expires FROM cache WHERE namespace = ? AND key = ? AND expires > ?", (namespace, key, now)
+                ).fetchone()
+                if row is not None:
+                    db.execute("UPDATE cache SET accessed = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+                return row
+            except sqlite3.Error:
+                return None
+
+    def put(self, namespace: str, key: str, value: str, expires: float) -> None:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return
+            now = time.time()
+            size = len(value.encode("utf-8"))
+            try:
+                previous = db.execute(
+                    "SELECT size FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+                ).fetchone()
+                db.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                    (namespace, key, value, size, expires, now),
+                )
+                self._total += size - (previous[0] if previous else 0)
+                if self._total > self.max_bytes:
+                    self._trim(db, now)
+            except sqlite3.Error as e:
+                logger.warning("Failed to persist %s cache entry: %s", namespace, e)
+
+    def _trim(self, db: sqlite3.Connection, now: float) -> None:
+        # other processes write to the same file, so recount before evicting anything
+        db.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        freed = 0
+        oldest = []
+        if total > self.max_bytes:
+            for namespace, key, size in db.execute("SELECT namespace, key, size FROM cache ORDER BY accessed"):
+                if freed >= total - self.max_bytes:
+                    break
+                oldest.append((namespace, key))
+                freed += size
+            db.executemany("DELETE FROM cache WHERE namespace = ? AND key = ?", oldest)
+        self._total = total - freed
+
+
+class _TwoLevelCache:
+    '''In-memory LRU with TTL in front of the shared disk cache; values are JSON-serialisable.'''
+
+    def __init__(self, namespace: str, ttl: float, max_entries: int, disk: _DiskCache):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk = disk
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def _remember(self, key: str, expires: float, value: Any) -> None:
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self._entries.move_to_end(key)
+                CACHE_LOOKUPS.inc(cache=self.namespace, result="memory")
+                return entry[1]
+            del self._entries[key]
+
+        row = await anyio.to_thread.run_sync(self.disk.get, self.namespace, key)
+        if row is not None:
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            CACHE_LOOKUPS.inc(cache=self.namespace, result="disk")
+            return value
+
+        CACHE_LOOKUPS.inc(cache=self.namespace, result="miss")
+        return None
+
+    async def put(self, key: str, value: Any) -> None:
+        expires = time.time() + self.ttl
+        self._remember(key, expires, value)
+        await anyio.to_thread.run_sync(self.disk.put, self.namespace, key, json.dumps(value, ensure_ascii=False), expires)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _result_key(prompt: str, content: str) -> str:
+    # content-addressed: an edited article or prompt, or another model, never reuses a stale answer
+    return f"{_digest(prompt)}:{_digest(content)}:{OPENAI_MODEL}"
+
+
+_disk_cache = _DiskCache(CACHE_DB_PATH, CACHE_MAX_BYTES)
+_article_cache = _TwoLevelCache("article", ARTICLE_CACHE_TTL, CACHE_MEMORY_ENTRIES, _disk_cache)
+_result_cache = _TwoLevelCache("result", RESULT_CACHE_TTL, CACHE_MEMORY_ENTRIES, _disk_cache)
+
+# CJK characters are roughly one token each, other text roughly four characters per token
+_WIDE_CHAR = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+_SENTENCE_END = re.compile(r"(?<=[。！？；!?;])")
+REDUCE_PROMPT = (
+    "{prompt}\n\n"
+    "注意：下文不是原文，而是同一篇文章按顺序分成 {parts} 段后分别抽取得到的部分结果。"
+    "请严格按上述要求的输出格式将它们合并为一份最终结果：去除重复条目，合并同一对象的信息，"
+    "信息冲突时保留更完整的一项，不要添加部分结果中没有的内容。"
+)
 
 
-async def _parse_with_openai(prompt: str, content: str, api_key: str) -> str:
-    return await anyio.to_thread.run_sync(_run_openai, prompt, content, api_key)
+def _estimate_tokens(text: str) -> int:
+    wide = len(_WIDE_CHAR.findall(text))
+    return wide + (len(text) - wide + 3) // 4
+
+
+def _pieces(content: str, budget: int):
+    for paragraph in content.split("\n"):
+        if _estimate_tokens(paragraph) <= budget:
+            yield paragraph
+            continue
+        # an oversized paragraph is cut at sentence ends, and a sentence that is still too long
+        # into slices of ``budget`` characters (never more than ``budget`` tokens)
+        for sentence in _SENTENCE_END.split(paragraph):
+            if _estimate_tokens(sentence) <= budget:
+                yield sentence
+            else:
+                yield from (sentence[i:i + budget] for i in range(0, len(sentence), budget))
+
+
+def _split_content(content: str, budget: int) -> list[str]:
+    '''Pack consecutive paragraphs into chunks of at most ``budget`` estimated tokens.'''
+    chunks: list[str] = []
+    current: list[str] = []
+    size = 0
+    for piece in _pieces(content, budget):
+        tokens = _estimate_tokens(piece) + 1
+        if current and size + tokens > budget:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _group_partials(partials: list[str], budget: int) -> list[list[str]]:
+    # at least two partial results per group, so every reduce round shrinks the list
+    groups: list[list[str]] = []
+    size = 0
+    for partial in partials:
+        tokens = _estimate_tokens(partial)
+        if groups and (len(groups[-1]) < 2 or size + tokens <= budget):
+            groups[-1].append(partial)
+            size += tokens
+        else:
+            groups.append([partial])
+            size = tokens
+    return groups
+
+
+async def _cached_completion(prompt: str, content: str, api_key: str, step: str) -> str:
+    key = _result_key(prompt, content)
+    result = await _result_cache.get(key)
+    if result is None:
+        LLM_CHUNKS.inc(step=step)
+        result = await _parse_with_openai(prompt, content, api_key)
+        if result:
+            await _result_cache.put(key, result)
+    return result
+
+
+async def _run_bounded(calls: list[Callable[[], Awaitable[str]]], limit: int) -> list[str]:
+    results = [""] * len(calls)
+    slots = anyio.Semaphore(limit)
+
+    async def run(index: int) -> None:
+        async with slots:
+            results[index] = await calls[index]()
+
+    try:
+        async with anyio.create_task_group() as tg:
+            for index in range(len(calls)):
+                tg.start_soon(run, index)
+    except BaseExceptionGroup as group:
+        # surface the first failure itself rather than the task group wrapper
+        while isinstance(group, BaseExceptionGroup):
+            group = group.exceptions[0]
+        raise group
+    return results
+
+
+def _reduce_input(partials: list[str]) -> str:
+    return "\n\n".join(f"## 第 {i} 段的抽取结果\n\n{partial}" for i, partial in enumerate(partials, 1))
+
+
+async def _extract(
+    prompt: str, content: str, api_key: str, on_delta: Callable[[str], Awaitable[None]] | None = None
+) -> str:
+    '''Run the extraction prompt over ``content``, map-reducing over chunks when it exceeds CHUNK_TOKENS.
+
+    Chunk results are cached individually, so a retry after a failed call only
+    pays for the chunks that did not finish. Only the final reduce call is
+    streamed to the client.
+    '''
+    if _estimate_tokens(content) <= CHUNK_TOKENS:
+        return await _parse_with_openai(prompt, content, api_key, on_delta)
+
+    chunks = _split_content(content, CHUNK_TOKENS)
+    partials = await _run_bounded(
+        [
+            functools.partial(
+                _cached_completion, prompt, f"（全文共 {len(chunks)} 段，以下为第 {i} 段）\n\n{chunk}", api_key, "map"
+            )
+            for i, chunk in enumerate(chunks, 1)
+        ],
+        MAP_CONCURRENCY,
+    )
+    partials = [partial for partial in partials if partial.strip()]
+    while len(partials) > 1:
+        groups = _group_partials(partials, CHUNK_TOKENS)
+        if len(groups) == 1:
+            break
+        partials = await _run_bounded(
+            [
+                functools.partial(
+                    _cached_completion, REDUCE_PROMPT.format(prompt=prompt, parts=len(group)),
+                    _reduce_input(group), api_key, "reduce",
+                )
+                for group in groups
+            ],
+            MAP_CONCURRENCY,
+        )
+        partials = [partial for partial in partials if partial.strip()]
+    if len(partials) < 2:
+        result = partials[0] if partials else ""
+        if result and on_delta is not None:
+            await on_delta(result)
+        return result
+
+    LLM_CHUNKS.inc(step="reduce")
+    return await _parse_with_openai(
+        REDUCE_PROMPT.format(prompt=prompt, parts=len(partials)), _reduce_input(partials), api_key, on_delta
+    )
 
 
 @server.call_tool()
@@ -153,14 +740,12 @@ async def call_tool(name: str, arguments: dict):
     if name != "parse_wechat_article":
         raise RuntimeError(f"Unknown tool: {name}")
 
-    prompt = (arguments.get("prompt") or "").strip() or DEFAULT_PROMPT
-    url = (arguments.get("url") or "").strip() or DEFAULT_URL
-
-    html = await _fetch_html(url)
-    parsed = _parse_wechat_html(html)
-    api_key = _extract_api_key()
-    parsed_result = await _parse_with_openai(prompt, parsed["content"], api_key)
-    payload = {"prompt": prompt, "parsed_result": parsed_result}
+    with TOOL_IN_FLIGHT.track(tool=name), TOOL_SECONDS.time(tool=name):
+        try:
+            payload = await _parse_article(arguments)
+        except Exception as e:
+            TOOL_ERRORS.inc(tool=name, error=type(e).__name__)
+            raise
 
     return [
         TextContent(
@@ -170,6 +755,29 @@ async def call_tool(name: str, arguments: dict):
     ]
 
 
+async def _parse_article(arguments: dict) -> dict[str, Any]:
+    prompt = (arguments.get("prompt") or "").strip() or DEFAULT_PROMPT
+    url = (arguments.get("url") or "").strip() or DEFAULT_URL
+
+    api_key = _extract_api_key()
+    parsed = await _article_cache.get(url)
+    if parsed is None:
+        html = await _fetch_html(url)
+        parsed = _parse_wechat_html(html)
+        if parsed["content"]:
+            await _article_cache.put(url, parsed)
+
+    key = _result_key(prompt, parsed["content"])
+    parsed_result = await _result_cache.get(key)
+    if parsed_result is None:
+        stream = _TokenStream(STREAM_INTERVAL)
+        parsed_result = await _extract(prompt, parsed["content"], api_key, stream.send)
+        await stream.flush()
+        if parsed_result:
+            await _result_cache.put(key, parsed_result)
+    return {"prompt": prompt, "parsed_result": parsed_result}
+
+
 session_manager = StreamableHTTPSessionManager(server)
 
 
@@ -179,11 +787,14 @@ async def mcp_asgi(scope, receive, send):
 
 @asynccontextmanager
 async def lifespan(_: Starlette):
-    async with session_manager.run():
-        yield
+    try:
+        async with session_manager.run():
+            yield
+    finally:
+        await _llm_clients.close()
 
 
-app = Starlette(routes=[Mount("/mcp", app=mcp_asgi)], lifespan=lifespan)
+app = Starlette(routes=[mcp_metrics.metrics_route(metrics), Mount("/mcp", app=mcp_asgi)], lifespan=lifespan)
 
 
 def main():